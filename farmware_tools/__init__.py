@@ -1,8 +1,7 @@
 'Farmware Tools imports.'
 
 import os
-from .device import log, get_bot_state, set_user_env
-from .app import request
+import importlib
 from .auxiliary import snake_case
 from .env import Env
 
@@ -11,9 +10,74 @@ with open(os.path.join(os.path.dirname(__file__), 'VERSION')) as version_file:
 
 __version__ = VERSION
 
+# Submodules and their functions are loaded on first access
+# so that importing the package does not import `requests` or `paho`
+# or connect to FarmBot OS.
+SUBMODULES = ['app', 'app_aio', 'auxiliary', 'device', 'device_aio',
+              'device_logging', 'env']
+LAZY_ATTRIBUTES = {
+    'log': 'device',
+    'get_bot_state': 'device',
+    'set_user_env': 'device',
+    'request': 'app',
+}
+# `from farmware_tools import *` exports (the asyncio and logging
+# submodules are only loaded when imported by name).
+__all__ = ['app', 'auxiliary', 'device', 'env'] + sorted(LAZY_ATTRIBUTES) + [
+    'Env', 'VERSION', 'get_config_value', 'get_config_values',
+    'set_config_value', 'set_config_values', 'snake_case']
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in LAZY_ATTRIBUTES:
+        module = importlib.import_module('.' + LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES) | set(LAZY_ATTRIBUTES))
+
+
+CONFIG_DEFAULTS = {}
+CONFIG_VALUES = {}
+
+
+def _config_defaults(farmware_name, _get_state=None):
+    """Get the Farmware manifest config default values by config name.
+
+    The manifest is fetched once per Farmware (unless `_get_state` is
+    provided). Returns None if the manifest is not found; failed lookups
+    are not cached, so they are retried on the next call.
+    """
+    if _get_state is None and farmware_name in CONFIG_DEFAULTS:
+        return CONFIG_DEFAULTS[farmware_name]
+    from .device import get_state_value
+    keys = ['process_info', 'farmwares', farmware_name]
+    try:
+        if _get_state is None:
+            config = get_state_value(keys)['config']
+        else:
+            config = _get_state()[keys[0]][keys[1]][keys[2]]['config']
+    except (KeyError, TypeError):
+        defaults = None
+    else:
+        configs = config.values() if isinstance(config, dict) else config
+        defaults = {c['name']: c['value'] for c in configs}
+    if _get_state is None and defaults is not None:
+        CONFIG_DEFAULTS[farmware_name] = defaults
+    return defaults
+
+
+def _quoted(names):
+    return ', '.join('`{}`'.format(name) for name in names)
+
 
 def get_config_value(farmware_name, config_name, value_type=int,
-                     _get_state=get_bot_state):
+                     _get_state=None):
     """Get the value of a Farmware config input.
 
     If not found, attempt to use the default value.
@@ -22,6 +86,7 @@ def get_config_value(farmware_name, config_name, value_type=int,
         farmware_name (str): Name of the Farmware.
         config_name (str): Farmware input name.
     """
+    from .device import log
     namespaced_config = '{}_{}'.format(snake_case(farmware_name), config_name)
 
     # Try to determine the default value for the config in two steps.
@@ -29,19 +94,13 @@ def get_config_value(farmware_name, config_name, value_type=int,
     # has been set (will result in a KeyError if it hasn't).
 
     # Step 1. Search for config data.
-    try:  # to retrieve Farmware manifest data
-        manifest = _get_state()['process_info']['farmwares'][farmware_name]
-    except KeyError:
+    defaults = _config_defaults(farmware_name, _get_state)
+    if defaults is None:
         log('Farmware manifest for `{}` not found.'.format(farmware_name), 'warn')
         return value_type(os.environ[namespaced_config])
-    else:  # Found config data.
-        v2 = Env().use_v2() or Env().use_mqtt()
-        configs = manifest['config'].values() if v2 else manifest['config']
 
     # Step 2. Search for the config name.
-    try:  # to retrieve default config value
-        [default] = [c['value'] for c in configs if c['name'] == config_name]
-    except ValueError:
+    if config_name not in defaults:
         log('Config name `{}` not found.'.format(config_name), 'warn')
         return value_type(os.environ[namespaced_config])
 
@@ -51,10 +110,57 @@ def get_config_value(farmware_name, config_name, value_type=int,
         value = value_type(os.environ[namespaced_config])
     except KeyError:
         log('Using the default value for `{}`.'.format(config_name))
-        value = default
+        value = defaults[config_name]
     return value_type(value)
 
 
+def get_config_values(farmware_name, config_types, _get_state=None):
+    """Get the values of many Farmware config inputs at once.
+
+    The Farmware manifest is fetched once and the results are cached
+    for the life of the process. Set values (environment variables)
+    take precedence over the manifest default values.
+
+    Args:
+        farmware_name (str): Name of the Farmware.
+        config_types (dict): Farmware input names and value types,
+            i.e., {'speed': int, 'label': str}.
+    Returns:
+        {input name: value}
+    Raises:
+        KeyError: An input has neither a set value nor a default value.
+    """
+    cache_key = (farmware_name, tuple(sorted(config_types.items())))
+    if _get_state is None and cache_key in CONFIG_VALUES:
+        return dict(CONFIG_VALUES[cache_key])
+    from .device import log
+    prefix = '{}_'.format(snake_case(farmware_name))
+    defaults = _config_defaults(farmware_name, _get_state)
+    if defaults is None:
+        log('Farmware manifest for `{}` not found.'.format(farmware_name), 'warn')
+        defaults = {}
+    else:
+        missing = [name for name in config_types if name not in defaults]
+        if len(missing) > 0:
+            log('Config names {} not found.'.format(_quoted(missing)), 'warn')
+    values = {}
+    default_names = []
+    for name, value_type in config_types.items():
+        try:
+            value = os.environ[prefix + name]
+        except KeyError:
+            if name not in defaults:
+                raise KeyError(prefix + name)
+            value = defaults[name]
+            default_names.append(name)
+        values[name] = value_type(value)
+    if len(default_names) > 0:
+        log('Using the default values for {}.'.format(_quoted(default_names)))
+    if _get_state is None:
+        CONFIG_VALUES[cache_key] = dict(values)
+    return values
+
+
 def set_config_value(farmware_name, config_name, value):
     """Set the value of a Farmware config using the Farmware's namespace.
 
@@ -63,5 +169,21 @@ def set_config_value(farmware_name, config_name, value):
         config_name (str): Farmware input name.
         value: Value to set.
     """
+    from .device import set_user_env
     namespaced_config = '{}_{}'.format(snake_case(farmware_name), config_name)
     set_user_env(namespaced_config, value)
+
+
+def set_config_values(farmware_name, configs):
+    """Set the values of many Farmware configs in a single command.
+
+    Configs whose value is unchanged are skipped.
+
+    Args:
+        farmware_name (str): Name of the Farmware.
+        configs (dict): Farmware input names and values.
+    """
+    from .device import set_user_envs
+    prefix = '{}_'.format(snake_case(farmware_name))
+    return set_user_envs(
+        {prefix + name: value for name, value in configs.items()})
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: HTTP sessions and response cache used by `app`, `device`.'''
+
+import copy
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_POOL_SIZE = 10
+POOL_HOSTS = 4
+POOL = {'size': DEFAULT_POOL_SIZE, 'adapter': None, 'generation': 0}
+POOL_LOCK = threading.Lock()
+SESSIONS = threading.local()
+DEFAULT_CACHE_TTL_SECONDS = 60
+DEFAULT_CACHE_ENTRIES = 256
+
+
+def _adapter():
+    'Get the shared connection pool adapter, creating it on first use.'
+    with POOL_LOCK:
+        if POOL['adapter'] is None:
+            from requests.adapters import HTTPAdapter
+            POOL['adapter'] = HTTPAdapter(
+                pool_connections=POOL_HOSTS, pool_maxsize=POOL['size'])
+            POOL['generation'] += 1
+        return POOL['adapter'], POOL['generation']
+
+
+def _session():
+    """Get the HTTP session for the current thread.
+
+    Each thread has its own `requests.Session` (headers and cookies are
+    not shared), but all sessions share one keep-alive connection pool,
+    so connections (and TLS handshakes) are reused across threads.
+    """
+    adapter, generation = _adapter()
+    session = getattr(SESSIONS, 'session', None)
+    if session is None or SESSIONS.generation != generation:
+        import requests
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        SESSIONS.session = session
+        SESSIONS.generation = generation
+    return session
+
+
+def set_pool_size(size):
+    """Set how many keep-alive connections are kept per host.
+
+    Sessions created afterwards use a new pool of this size.
+
+    Args:
+        size (int): Connections per host. Defaults to DEFAULT_POOL_SIZE.
+    """
+    with POOL_LOCK:
+        POOL['size'] = size
+        POOL['adapter'] = None
+
+
+def _account(api):
+    '''Identify a Web App account by its API URL and a hash of the token.'''
+    token_hash = hashlib.sha256(
+        str(api.get('token')).encode('utf-8')).hexdigest()
+    return '{} {}'.format(api.get('url'), token_hash)
+
+
+class _ResponseCache():
+    '''LRU cache of Web App responses with per-resource TTLs.
+
+    GET requests and POST searches (i.e., 'points/search') are cached.
+    Responses are cached per Web App URL and API token. Any other
+    request invalidates the cached responses of its resource (the first
+    endpoint path segment, i.e., 'points' for 'points/5'), including
+    responses of requests in flight at the time. Expired responses with
+    an ETag or Last-Modified header are revalidated with a conditional
+    request.
+    '''
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL_SECONDS, ttls=None,
+                 max_entries=DEFAULT_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            ['hits', 'misses', 'revalidated', 'evictions', 'invalidations'],
+            0)
+
+    @staticmethod
+    def resource(endpoint):
+        '''Get the resource an endpoint belongs to.'''
+        return endpoint.strip('/').split('/')[0]
+
+    @staticmethod
+    def cacheable(method, endpoint):
+        '''Determine if a request only reads data.'''
+        return method == 'GET' or (
+            method == 'POST' and endpoint.endswith('/search'))
+
+    @staticmethod
+    def key(api, method, endpoint, payload):
+        '''Cache key for a request. None if the payload is not JSON.'''
+        try:
+            payload_key = json.dumps(payload, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return (endpoint, method, payload_key, _account(api))
+
+    def generation(self, endpoint):
+        '''Invalidation count of an endpoint's resource (see `store`).'''
+        with self.lock:
+            return self.generations.get(self.resource(endpoint), 0)
+
+    def lookup(self, key):
+        '''Get (entry, fresh) for a key. Entry is None if not cached.'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counts['misses'] += 1
+                return None, False
+            self.entries.move_to_end(key)
+            if entry['expires'] > time.time():
+                self.counts['hits'] += 1
+                return entry, True
+            if entry['etag'] is None and entry['last_modified'] is None:
+                del self.entries[key]
+                self.counts['misses'] += 1
+                return None, False
+            return entry, False
+
+    @staticmethod
+    def conditional_headers(entry):
+        '''Headers for revalidating an expired entry.'''
+        headers = {}
+        if entry['etag'] is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified'] is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _expires(self, key):
+        return time.time() + self.ttls.get(self.resource(key[0]), self.ttl)
+
+    def store(self, key, json_response, headers, generation):
+        '''Cache a successful response.
+
+        Not cached if the resource was invalidated since `generation`
+        was read (before the request was sent): the response may be stale.
+        '''
+        entry = {
+            'json': copy.deepcopy(json_response),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'expires': self._expires(key),
+        }
+        with self.lock:
+            if self.generations.get(self.resource(key[0]), 0) != generation:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def revalidated(self, key):
+        '''Mark an expired entry as current (304 Not Modified).'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry['expires'] = self._expires(key)
+            self.counts['revalidated'] += 1
+
+    @staticmethod
+    def response(entry):
+        '''Copy of a cached response.'''
+        return copy.deepcopy(entry['json'])
+
+    def invalidate(self, endpoint):
+        '''Remove the cached responses of an endpoint's resource.'''
+        resource = self.resource(endpoint)
+        with self.lock:
+            self.generations[resource] = self.generations.get(resource, 0) + 1
+            for key in [k for k in self.entries
+                        if self.resource(k[0]) == resource]:
+                del self.entries[key]
+                self.counts['invalidations'] += 1
+
+    def clear(self):
+        '''Remove all cached responses.'''
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''Get hit, miss, revalidation, eviction and invalidation counts.'''
+        with self.lock:
+            stats = dict(self.counts)
+            stats['entries'] = len(self.entries)
+            return stats
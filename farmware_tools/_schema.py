@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: Celery Script schemas used by `device`.'''
+
+ALLOWED_AXIS_VALUES = ['x', 'y', 'z', 'all']
+ALLOWED_MESSAGE_TYPES = [
+    'success', 'busy', 'warn', 'error', 'info', 'fun', 'debug']
+ALLOWED_MESSAGE_CHANNELS = ['ticker', 'toast', 'email', 'espeak']
+ALLOWED_PACKAGES = ['farmbot_os', 'arduino_firmware', 'farmware']
+VALIDATION_MODES = ['default', 'strict', 'trusted']
+NUMBER = (int, float)
+STRING = (str,)
+ANY = (object,)
+PIN_NUMBER = (int, range(0, 70))
+PIN_MODE = (int, [0, 1])
+SPEED = (NUMBER, range(1, 101))
+AXIS = (STRING, ALLOWED_AXIS_VALUES)
+PACKAGE = (STRING, ALLOWED_PACKAGES)
+COORDINATE = (dict, None, ['coordinate'])
+OPERAND = (dict, None, ['numeric', 'random'])
+MOVE_ITEMS = ['axis_overwrite', 'axis_addition']
+
+# Every supported kind: {arg name: (types, accepted values[, node kinds])}
+# and the kinds allowed as body items (None: no body, ANY: any kind).
+# Accepted values (including those of known body item kinds) are checked
+# by default; types, unknown args and body item kinds are also checked
+# in strict mode.
+SCHEMAS = {
+    'axis_addition': {'args': {'axis': AXIS, 'axis_operand': OPERAND}},
+    'axis_overwrite': {'args': {'axis': AXIS, 'axis_operand': OPERAND}},
+    'calibrate': {'args': {'axis': AXIS}},
+    'channel': {'args': {
+        'channel_name': (STRING, ALLOWED_MESSAGE_CHANNELS)}},
+    'check_updates': {'args': {'package': PACKAGE}},
+    'coordinate': {'args': {'x': (NUMBER,), 'y': (NUMBER,), 'z': (NUMBER,)}},
+    'emergency_lock': {'args': {}},
+    'emergency_unlock': {'args': {}},
+    'execute': {'args': {'sequence_id': (int,)}},
+    'execute_script': {'args': {'label': (STRING,)}, 'body': ['pair']},
+    'factory_reset': {'args': {'package': PACKAGE}},
+    'find_home': {'args': {'axis': AXIS}},
+    'home': {'args': {'axis': AXIS}},
+    'install_farmware': {'args': {'url': (STRING,)}},
+    'install_first_party_farmware': {'args': {}},
+    'move': {'args': {}, 'body': MOVE_ITEMS},
+    'move_absolute': {'args': {
+        'location': COORDINATE, 'speed': SPEED, 'offset': COORDINATE}},
+    'move_relative': {'args': {
+        'x': (NUMBER,), 'y': (NUMBER,), 'z': (NUMBER,), 'speed': SPEED}},
+    'nothing': {'args': {}},
+    'numeric': {'args': {'number': (NUMBER,)}},
+    'pair': {'args': {'label': (STRING,), 'value': ANY}},
+    'power_off': {'args': {}},
+    'random': {'args': {'variance': (NUMBER,)}},
+    'read_pin': {'args': {
+        'pin_number': PIN_NUMBER, 'label': (STRING,), 'pin_mode': PIN_MODE}},
+    'read_status': {'args': {}},
+    'reboot': {'args': {'package': PACKAGE}},
+    'register_gpio': {'args': {
+        'sequence_id': (int,), 'pin_number': (int, range(1, 30))}},
+    'remove_farmware': {'args': {'package': (STRING,)}},
+    'rpc_request': {'args': {'label': (STRING,)}, 'body': ANY},
+    'send_message': {
+        'args': {'message': (STRING,),
+                 'message_type': (STRING, ALLOWED_MESSAGE_TYPES)},
+        'body': ['channel']},
+    'set_pin_io_mode': {'args': {
+        'pin_io_mode': (int, [0, 1, 2]), 'pin_number': PIN_NUMBER}},
+    'set_servo_angle': {'args': {
+        'pin_number': (int, [4, 5, 6, 11]),
+        'pin_value': (NUMBER, range(0, 181))}},
+    'set_user_env': {'args': {}, 'body': ['pair']},
+    'sync': {'args': {}},
+    'take_photo': {'args': {}},
+    'toggle_pin': {'args': {'pin_number': PIN_NUMBER}},
+    'unregister_gpio': {'args': {'pin_number': PIN_NUMBER}},
+    'update_farmware': {'args': {'package': (STRING,)}},
+    'wait': {'args': {'milliseconds': (NUMBER,)}},
+    'write_pin': {'args': {
+        'pin_number': PIN_NUMBER, 'pin_value': (NUMBER,),
+        'pin_mode': PIN_MODE}},
+    'zero': {'args': {'axis': AXIS}},
+}
+
+
+class _Valid():
+    '''Validation result for valid input.'''
+
+    def __repr__(self):
+        return 'VALID'
+
+
+VALID = _Valid()
+
+
+def _compile_accepted(accepted):
+    'Compile an accepted values list or range into a membership check.'
+    if isinstance(accepted, range):
+        start, stop = accepted.start, accepted.stop
+
+        def _in_range(value):
+            if value.__class__ is int:
+                return start <= value < stop
+            return (isinstance(value, NUMBER) and start <= value < stop
+                    and value == int(value))
+        return _in_range
+    values = frozenset(accepted)
+
+    def _in_values(value):
+        try:
+            return value in values
+        except TypeError:
+            return False
+    return _in_values
+
+
+def _compile_node(kinds, validators, schemas):
+    'Compile a node arg check (node kind and args, all required).'
+    required = {kind: frozenset(schemas[kind]['args']) for kind in kinds}
+
+    def _is_node(value):
+        try:
+            kind = value['kind']
+            args = value['args']
+            if not required[kind].issubset(args):
+                return False
+            return validators[kind](args, value.get('body')) is VALID
+        except (KeyError, TypeError, AttributeError):
+            return False
+    return _is_node
+
+
+def _compile_arg(spec, strict, validators, schemas):
+    """Compile an arg spec into a check returning True for valid values.
+
+    Returns None if there is nothing to check.
+    """
+    types = spec[0] if isinstance(spec[0], tuple) else (spec[0],)
+    accepted = spec[1] if len(spec) > 1 else None
+    if len(spec) > 2:
+        return _compile_node(spec[2], validators, schemas)
+    checks = []
+    if accepted is not None:
+        checks.append(_compile_accepted(accepted))
+    if strict and types != ANY:
+        checks.append(lambda value: isinstance(value, types))
+    if len(checks) == 0:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    first, second = checks
+    return lambda value: first(value) and second(value)
+
+
+def _check_body_values(body, validators):
+    'Check the arg values of body items of known kinds.'
+    if not isinstance(body, list):
+        return VALID
+    for item in body:
+        try:
+            validate = validators[item['kind']]
+            args = item['args']
+        except (KeyError, TypeError):
+            continue
+        invalid = validate(args, item.get('body'))
+        if invalid is not VALID:
+            return invalid
+    return VALID
+
+
+def _compile(schema, strict, validators, schemas):
+    'Compile a kind schema into a validator for its args and body.'
+    checks = []
+    for name, spec in schema['args'].items():
+        check = _compile_arg(spec, strict, validators, schemas)
+        if check is not None:
+            checks.append((name, check))
+    names = frozenset(schema['args'])
+    body_kinds = schema.get('body')
+    if body_kinds is not None and body_kinds is not ANY:
+        body_kinds = frozenset(body_kinds)
+
+    def _validate(args, body=None):
+        try:
+            for name, check in checks:
+                value = args[name]
+                if not check(value):
+                    return value
+        except (KeyError, TypeError):
+            return args
+        if not strict:
+            return _check_body_values(body, validators)
+        if len(args) != len(names) or not names.issuperset(args):
+            return args
+        if body is None:
+            return VALID
+        if body_kinds is None or not isinstance(body, list):
+            return body
+        for item in body:
+            invalid = validate_node(item, validators)
+            if invalid is not VALID:
+                return invalid
+            if body_kinds is not ANY and item['kind'] not in body_kinds:
+                return item
+        return VALID
+    return _validate
+
+
+def compile_validators(strict=False, schemas=None):
+    """Compile a validator for each kind.
+
+    Args:
+        strict (bool, optional): Also check arg types, unknown args and
+            body item kinds. Defaults to False.
+        schemas (dict, optional): Defaults to SCHEMAS.
+    Returns:
+        {kind: validator}. `validator(args, body=None)` returns VALID,
+        or the first invalid value.
+    """
+    schemas = schemas or SCHEMAS
+    validators = {}
+    for kind, schema in schemas.items():
+        validators[kind] = _compile(schema, strict, validators, schemas)
+    return validators
+
+
+def validate_node(node, validators):
+    'Validate a Celery Script node. Unknown kinds are invalid.'
+    try:
+        validate = validators[node['kind']]
+        args = node['args']
+    except (KeyError, TypeError):
+        return node
+    return validate(args, node.get('body'))
+
+
+VALIDATORS = {
+    'default': compile_validators(),
+    'strict': compile_validators(strict=True),
+    'trusted': None,
+}
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: Web App sequence name index used by `app`.'''
+
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+
+DEFAULT_INDEX_MAX_AGE_SECONDS = 300
+
+
+class _SequenceIndex():
+    '''Sequence names and IDs, optionally persisted to a JSON file.
+
+    Only the id, name and updated_at of each sequence are kept. A file
+    written for another Web App `source` (account, see
+    `_http._account`) is ignored.
+    Refreshing merges a downloaded sequence list into the index: entries
+    whose `updated_at` is unchanged are skipped and the lookup tables are
+    only rebuilt when something changed.
+    '''
+
+    def __init__(self, source, path=None,
+                 max_age=DEFAULT_INDEX_MAX_AGE_SECONDS):
+        self.source = source
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.fetched_at = None
+        self.lock = threading.Lock()
+        self._rebuild()
+        if path is not None:
+            self._load()
+
+    def _rebuild(self):
+        self.names = {}
+        self.folded = {}
+        for sequence_id, (name, _) in sorted(self.entries.items()):
+            self.names.setdefault(name, sequence_id)
+            self.folded.setdefault(name.casefold(), sequence_id)
+        self.sorted_names = sorted(self.names)
+        self.sorted_folded = sorted(self.folded)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                data = json.load(index_file)
+            if data['source'] != self.source:
+                return
+            self.entries = {int(sequence_id): tuple(entry)
+                            for sequence_id, entry in data['entries'].items()}
+            self.fetched_at = data['fetched_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+            self.fetched_at = None
+        self._rebuild()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        data = {'source': self.source, 'fetched_at': self.fetched_at,
+                'entries': self.entries}
+        try:
+            descriptor, temporary = tempfile.mkstemp(dir=directory)
+            with os.fdopen(descriptor, 'w') as index_file:
+                json.dump(data, index_file)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+
+    def stale(self):
+        '''Determine if the index needs to be refreshed.'''
+        return (self.fetched_at is None
+                or time.time() - self.fetched_at > self.max_age)
+
+    def invalidate(self):
+        '''Require a refresh before the next lookup.'''
+        with self.lock:
+            self.fetched_at = None
+
+    def update(self, sequences):
+        """Merge a Web App sequence list into the index.
+
+        Returns:
+            number of added, changed or removed sequences
+        """
+        with self.lock:
+            changed = 0
+            seen = set()
+            for sequence in sequences:
+                sequence_id = sequence['id']
+                seen.add(sequence_id)
+                entry = self.entries.get(sequence_id)
+                updated_at = sequence.get('updated_at')
+                if entry is not None and updated_at is not None and (
+                        entry[1] == updated_at):
+                    continue
+                entry = (sequence['name'], updated_at)
+                if self.entries.get(sequence_id) != entry:
+                    self.entries[sequence_id] = entry
+                    changed += 1
+            for sequence_id in set(self.entries) - seen:
+                del self.entries[sequence_id]
+                changed += 1
+            if changed:
+                self._rebuild()
+            self.fetched_at = time.time()
+            if self.path is not None:
+                self._save()
+            return changed
+
+    def lookup(self, name, ignore_case=False):
+        '''Get the ID for a sequence name (None if not found).'''
+        if ignore_case:
+            return self.folded.get(name.casefold())
+        return self.names.get(name)
+
+    def prefix(self, prefix, ignore_case=False):
+        '''Get {name: ID} for the sequence names starting with `prefix`.'''
+        names = self.sorted_folded if ignore_case else self.sorted_names
+        prefix = prefix.casefold() if ignore_case else prefix
+        matches = set()
+        for index in range(bisect.bisect_left(names, prefix), len(names)):
+            if not names[index].startswith(prefix):
+                break
+            matches.add(names[index])
+        return {name: sequence_id
+                for sequence_id, (name, _) in sorted(self.entries.items())
+                if (name.casefold() if ignore_case else name) in matches}
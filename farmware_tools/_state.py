@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: FarmBot OS state directory cache used by `device`.'''
+
+import os
+import re
+import struct
+import ctypes
+import time
+import select
+import threading
+from stat import S_ISDIR
+from types import MappingProxyType
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Files are read once written (closed or moved into place), never while
+# a write is in progress (IN_MODIFY, or IN_CREATE before the write).
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+FILE_WRITTEN = IN_CLOSE_WRITE | IN_MOVED_TO
+EVENT_FORMAT = 'iIII'
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+READ_SIZE = 64 * 1024
+POLL_INTERVAL_SECONDS = 0.5
+INTEGER = re.compile(r'^-?\d+$')
+FLOAT = re.compile(r'^-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+NONE_VALUES = ['', 'nil', 'null', 'None']
+BOOLEAN_VALUES = {'true': True, 'false': False}
+
+
+def _read_value(path):
+    'Read a state value file. Empty files are None.'
+    with open(path, 'r') as value_file:
+        value = value_file.read()
+        return value if value != '' else None
+
+
+def _read_tree(path):
+    'Read a state directory branch or value file.'
+    if os.path.isdir(path):
+        return {n: _read_tree(os.path.join(path, n)) for n in os.listdir(path)}
+    return _read_value(path)
+
+
+def decode_value(value):
+    """Decode a raw state value string into a typed value.
+
+    Integers and floats become numbers, 'true'/'false' become booleans and
+    empty or 'nil'/'null' values become None. Other values are unchanged.
+    """
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if text in NONE_VALUES:
+        return None
+    if text in BOOLEAN_VALUES:
+        return BOOLEAN_VALUES[text]
+    if INTEGER.match(text):
+        return int(text)
+    if FLOAT.match(text):
+        return float(text)
+    return value
+
+
+def _copy(node):
+    if isinstance(node, dict):
+        return {key: _copy(value) for key, value in node.items()}
+    return node
+
+
+class _Inotify():
+    '''Minimal inotify wrapper (Linux) built on ctypes.'''
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        '''Create a non-blocking inotify instance. None if unavailable.'''
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            init = libc.inotify_init1
+        except (OSError, AttributeError):
+            return None
+        init.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def fileno(self):
+        '''File descriptor, i.e., for `select`.'''
+        return self.fd
+
+    def add_watch(self, path):
+        '''Watch a directory. Returns the watch descriptor or -1.'''
+        return self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK)
+
+    def rm_watch(self, watch):
+        '''Stop watching a watch descriptor.'''
+        self.libc.inotify_rm_watch(self.fd, watch)
+
+    def wait(self, timeout):
+        '''Wait up to `timeout` seconds for events. True if available.'''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return len(readable) > 0
+
+    def read(self):
+        '''Read pending events as (watch, mask, name) tuples.'''
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, size = struct.unpack_from(
+                    EVENT_FORMAT, data, offset)
+                offset += EVENT_SIZE
+                name = data[offset:offset + size].rstrip(b'\0')
+                offset += size
+                events.append((watch, mask, os.fsdecode(name)))
+
+    def close(self):
+        '''Release the inotify instance.'''
+        os.close(self.fd)
+
+
+class _StateCache():
+    '''Bot state tree read from the FarmBot OS state directory.
+
+    The directory is read once. Afterwards only files reported as changed
+    by inotify are read again. Without inotify, file modification times
+    are compared instead, so only changed files are read.
+    '''
+
+    def __init__(self, root, use_inotify=True):
+        self.root = root
+        self.tree = None
+        self.lock = threading.Lock()
+        self.watcher = _Inotify.create() if use_inotify else None
+        self.watches = {}
+        self.stats = {}
+        self.truncated = {}
+
+    def _path(self, keys):
+        return os.path.join(self.root, *keys)
+
+    def _node(self, keys):
+        node = self.tree
+        for key in keys:
+            node = node[key]
+        return node
+
+    def _load(self):
+        if self.watcher is not None:
+            for watch in self.watches:
+                self.watcher.rm_watch(watch)
+            self.watcher.read()
+        self.watches = {}
+        self.stats = {}
+        self.tree = self._crawl(())
+
+    def _crawl(self, keys):
+        path = self._path(keys)
+        if self.watcher is not None:
+            watch = self.watcher.add_watch(path)
+            if watch < 0:
+                self._stop_watching()
+            else:
+                self.watches[watch] = keys
+        node = {}
+        for entry in os.scandir(path):
+            entry_keys = keys + (entry.name,)
+            try:
+                if entry.is_dir():
+                    node[entry.name] = self._crawl(entry_keys)
+                else:
+                    self._track(entry, entry_keys)
+                    node[entry.name] = _read_value(entry.path)
+            except FileNotFoundError:
+                node.pop(entry.name, None)
+        return node
+
+    def _stop_watching(self):
+        self.watcher.close()
+        self.watcher = None
+        self.watches = {}
+
+    def _track(self, entry, keys):
+        if self.watcher is None:
+            stat = entry.stat()
+            self.stats[keys] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _set(self, keys, value):
+        try:
+            parent = self._node(keys[:-1])
+        except KeyError:
+            return
+        parent[keys[-1]] = value
+
+    def _remove(self, keys):
+        try:
+            self._node(keys[:-1]).pop(keys[-1], None)
+        except KeyError:
+            pass
+        for watch, watched_keys in list(self.watches.items()):
+            if watched_keys[:len(keys)] == keys:
+                del self.watches[watch]
+                self.watcher.rm_watch(watch)
+
+    def _apply_events(self):
+        changed = {}
+        for watch, mask, name in self.watcher.read():
+            if mask & IN_Q_OVERFLOW:
+                self._load()
+                return
+            if mask & IN_IGNORED or watch not in self.watches:
+                self.watches.pop(watch, None)
+                continue
+            keys = self.watches[watch] + (name,)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                changed.pop(keys, None)
+                self._remove(keys)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._set(keys, self._crawl(keys))
+                except FileNotFoundError:
+                    self._remove(keys)
+            elif not mask & IN_ISDIR and mask & FILE_WRITTEN and name:
+                changed[keys] = True
+        for keys in changed:
+            try:
+                self._set(keys, _read_value(self._path(keys)))
+            except (OSError, ValueError):
+                pass  # keep the last value read
+
+    def _scan_file(self, keys, parent, stat):
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self.stats.get(keys) == signature:
+            return
+        value = _read_value(self._path(keys))
+        if value is None and parent.get(keys[-1]) is not None and (
+                self.truncated.get(keys) != signature):
+            # Possibly truncated by a write in progress:
+            # keep the last value unless still empty next scan.
+            self.truncated[keys] = signature
+            return
+        self.truncated.pop(keys, None)
+        self.stats[keys] = signature
+        parent[keys[-1]] = value
+
+    def _scan_path(self, keys):
+        '''Bring only the entries at `keys` up to date (without inotify).'''
+        if len(keys) == 0:
+            self._scan((), self.tree)
+            return
+        try:
+            stat = os.stat(self._path(keys))
+        except (FileNotFoundError, NotADirectoryError):
+            self._remove(keys)
+            for tracked in [k for k in self.stats if k[:len(keys)] == keys]:
+                del self.stats[tracked]
+            return
+        parent = self.tree
+        for key in keys[:-1]:
+            if not isinstance(parent.get(key), dict):
+                parent[key] = {}
+            parent = parent[key]
+        try:
+            if S_ISDIR(stat.st_mode):
+                if not isinstance(parent.get(keys[-1]), dict):
+                    parent[keys[-1]] = {}
+                self._scan(keys, parent[keys[-1]])
+            else:
+                self._scan_file(keys, parent, stat)
+        except FileNotFoundError:
+            self._remove(keys)
+        except (OSError, ValueError):
+            pass  # keep the last value read
+
+    def _scan(self, keys, node):
+        seen = set()
+        for entry in os.scandir(self._path(keys)):
+            entry_keys = keys + (entry.name,)
+            seen.add(entry.name)
+            try:
+                if entry.is_dir():
+                    if not isinstance(node.get(entry.name), dict):
+                        node[entry.name] = {}
+                    self._scan(entry_keys, node[entry.name])
+                    continue
+                self._scan_file(entry_keys, node, entry.stat())
+            except FileNotFoundError:
+                seen.discard(entry.name)
+            except (OSError, ValueError):
+                pass  # keep the last value read
+        for name in set(node) - seen:
+            del node[name]
+            self.stats.pop(keys + (name,), None)
+
+    def refresh(self):
+        '''Bring the cached tree up to date with the state directory.'''
+        with self.lock:
+            if self.tree is None:
+                self._load()
+                return
+            if self.watcher is not None:
+                self._apply_events()
+            if self.watcher is None:
+                self._scan((), self.tree)
+
+    def wait_for_change(self, timeout=None):
+        '''Wait up to `timeout` seconds for the state directory to change.
+
+        Without inotify, wait for the polling interval instead.
+        '''
+        watcher = self.watcher
+        if watcher is not None:
+            watcher.wait(timeout)
+        elif timeout is None:
+            time.sleep(POLL_INTERVAL_SECONDS)
+        else:
+            time.sleep(min(timeout, POLL_INTERVAL_SECONDS))
+
+    def _copied(self, keys):
+        try:
+            return _copy(self._node(keys))
+        except TypeError:
+            raise KeyError(keys)
+
+    def get(self, keys=()):
+        '''Get a copy of the (sub)tree or value at `keys`.'''
+        self.refresh()
+        with self.lock:
+            return self._copied(keys)
+
+    def get_path(self, keys):
+        '''Get a copy of the (sub)tree or value at `keys`.
+
+        Until the whole directory has been loaded (by `get` or `refresh`),
+        only the files on the path are read. Afterwards, without inotify,
+        only the entries at `keys` are checked for changes.
+        '''
+        keys = tuple(keys)
+        with self.lock:
+            if self.tree is not None:
+                if self.watcher is not None:
+                    self._apply_events()
+                if self.watcher is None:
+                    self._scan_path(keys)
+                return self._copied(keys)
+        try:
+            return _read_tree(self._path(keys))
+        except (FileNotFoundError, NotADirectoryError):
+            raise KeyError(keys)
+
+
+class _DirectorySource():
+    '''Bot state read on demand from the FarmBot OS state directory.'''
+
+    def __init__(self, root):
+        self.root = root
+
+    def children(self, keys):
+        '''Map child names to whether they are branches.'''
+        try:
+            return {entry.name: entry.is_dir()
+                    for entry in os.scandir(os.path.join(self.root, *keys))}
+        except (FileNotFoundError, NotADirectoryError):
+            raise KeyError(keys)
+
+    def value(self, keys):
+        '''Read a raw leaf value.'''
+        try:
+            return _read_value(os.path.join(self.root, *keys))
+        except FileNotFoundError:
+            raise KeyError(keys)
+
+
+class _DictSource():
+    '''Bot state from an already fetched nested dict (MQTT, HTTP).'''
+
+    def __init__(self, state):
+        self.state = state
+
+    def _node(self, keys):
+        node = self.state
+        for key in keys:
+            node = node[key]
+        return node
+
+    def children(self, keys):
+        '''Map child names to whether they are branches.'''
+        return {str(key): isinstance(value, dict)
+                for key, value in self._node(keys).items()}
+
+    def value(self, keys):
+        '''Get a raw leaf value.'''
+        return self._node(keys)
+
+
+class StateView(Mapping):
+    '''Lazy, read-only view of (a branch of) the bot state.
+
+    Branches are listed on first access and leaf values are decoded
+    (see `decode_value`) once and remembered. Use `snapshot()` to load
+    everything into a frozen copy.
+    '''
+
+    def __init__(self, source, keys=()):
+        self._source = source
+        self._keys = keys
+        self._children = None
+        self._items = {}
+
+    def _load(self):
+        if self._children is None:
+            self._children = self._source.children(self._keys)
+        return self._children
+
+    def __getitem__(self, key):
+        key = str(key)
+        if key not in self._items:
+            children = self._load()
+            if key not in children:
+                raise KeyError(key)
+            keys = self._keys + (key,)
+            if children[key]:
+                self._items[key] = StateView(self._source, keys)
+            else:
+                self._items[key] = decode_value(self._source.value(keys))
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__, '.'.join(self._keys) or '<root>')
+
+    def snapshot(self):
+        '''Load the whole branch into a frozen (read-only) copy.'''
+        return MappingProxyType({
+            key: value.snapshot() if isinstance(value, StateView) else value
+            for key, value in self.items()})
+
+
+STATE_CACHES = {}
+STATE_CACHES_LOCK = threading.Lock()
+
+
+def _state_cache(root):
+    'Get the shared state cache for a state directory.'
+    with STATE_CACHES_LOCK:
+        if root not in STATE_CACHES:
+            STATE_CACHES[root] = _StateCache(root)
+        return STATE_CACHES[root]
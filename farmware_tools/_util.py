@@ -4,147 +4,562 @@
 
 import sys
 import json
+import bisect
 import struct
 import socket
 import threading
+from itertools import accumulate
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures import ThreadPoolExecutor
 from time import time, sleep
 from uuid import uuid4
-try:
-    import paho.mqtt.client as mqtt
-except ImportError:
-    pass
 from .env import Env
 
 ENV = Env()
 HEADER_FORMAT = '>HII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FRAME_MARKER = struct.pack('>H', 0xFBFB)
+READ_BUFFER_SIZE = 4096
 TIMEOUT_SECONDS = 10
+EXPIRY_INTERVAL_SECONDS = 1
+RECONNECT_DELAY_SECONDS = 0.1
+MAX_RECONNECT_DELAY_SECONDS = 5
+RESPONSE_TTL_SECONDS = 60
+MAX_STORED_RESPONSES = 1000
+CALLBACK_WORKERS = 4
 
+# Transports are connected on first use (see `_response_buffer`,
+# `_request_channel` and `_mqtt_session`).
+TRANSPORT_LOCK = threading.Lock()
+RESPONSE_BUFFER = None
+REQUEST_CHANNEL = None
+MQTT_SESSION = None
+MQTT_OK = None
+STATUS = {}
+# Resolves the futures returned to callers (threads start on first use).
+CALLBACKS = ThreadPoolExecutor(
+    max_workers=CALLBACK_WORKERS, thread_name_prefix='farmware_tools')
 
-def _open_socket(address):
+
+def _connect_socket(address, timeout=TIMEOUT_SECONDS):
+    'Connect to a unix socket. Raises OSError if it is unavailable.'
     opened_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    opened_socket.settimeout(TIMEOUT_SECONDS)
+    opened_socket.settimeout(timeout)
     try:
         opened_socket.connect(address)
+    except OSError:
+        opened_socket.close()
+        raise
+    return opened_socket
+
+
+def _open_socket(address):
+    try:
+        return _connect_socket(address)
     except FileNotFoundError:
         print('Could not connect to socket: address not found.')
         sys.exit(1)
-    return opened_socket
 
 
-class _ResponseBuffer():
+def _encode_frame(payload):
+    'Encode a payload as a framed message for FarmBot OS.'
+    message_bytes = bytes(json.dumps(payload), 'utf-8')
+    header = struct.pack(HEADER_FORMAT, 0xFBFB, 0, len(message_bytes))
+    return header + message_bytes
+
+
+class _RequestChannel():
+    '''Long-lived connection to the FarmBot OS request pipe.'''
+
+    def __init__(self, address):
+        self.address = address
+        self.request_socket = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        '''Connect, retrying with a growing delay while the pipe is
+        unavailable (i.e., while FarmBot OS restarts), for up to
+        TIMEOUT_SECONDS.'''
+        deadline = time() + TIMEOUT_SECONDS
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            try:
+                return _connect_socket(self.address)
+            except OSError:
+                if time() + delay > deadline:
+                    raise
+            sleep(delay)
+            delay = min(2 * delay, MAX_RECONNECT_DELAY_SECONDS)
+
+    def _send(self, frames):
+        '''Send frames in order.
+
+        Returns:
+            (number of frames completely sent, OSError or None)
+        '''
+        sent = 0
+        try:
+            if self.request_socket is None:
+                self.request_socket = self._connect()
+            data = memoryview(b''.join(frames))
+            while sent < len(data):
+                sent += self.request_socket.send(data[sent:])
+        except OSError as error:
+            ends = list(accumulate(len(frame) for frame in frames))
+            return bisect.bisect_right(ends, sent), error
+        return len(frames), None
+
+    def _close(self):
+        if self.request_socket is not None:
+            self.request_socket.close()
+            self.request_socket = None
+
+    def write(self, *payloads):
+        '''Write request frames, reconnecting once if the pipe was closed.
+
+        After a reconnect only the frames that were not completely sent
+        on the closed connection are written again.
+
+        Raises:
+            OSError: the pipe could not be (re)connected within
+                TIMEOUT_SECONDS, or a write failed after reconnecting.
+        '''
+        frames = [_encode_frame(payload) for payload in payloads]
+        with self.lock:
+            (complete, error) = self._send(frames)
+            if error is not None and self.request_socket is not None:
+                self._close()
+                (_, error) = self._send(frames[complete:])
+            if error is not None:
+                self._close()
+                raise error
+
+    def close(self):
+        '''Close the connection. The next write will reconnect.'''
+        with self.lock:
+            self._close()
+
+
+class _FrameReader():
+    '''Incremental decoder for framed messages read from a socket.'''
+
+    def __init__(self, source, size=READ_BUFFER_SIZE):
+        self.source = source
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def _make_room(self, needed):
+        '''Ensure `needed` bytes past the current frame start fit in the buffer.'''
+        pending = self.end - self.start
+        if needed > len(self.buffer):
+            buffer = bytearray(max(needed, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        elif self.start > 0:
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            return
+        self.start, self.end = 0, pending
+
+    def fill(self):
+        '''Read available bytes from the source. Returns 0 at end of stream.'''
+        if self.end == len(self.buffer):
+            self._make_room(self.end - self.start + 1)
+        count = self.source.recv_into(self.view[self.end:])
+        self.end += count
+        return count
+
+    def _resync(self):
+        '''Skip ahead to the next frame marker after a corrupt header.'''
+        index = self.buffer.find(FRAME_MARKER, self.start + 1, self.end)
+        if index != -1:
+            self.start = index
+        elif self.buffer[self.end - 1] == FRAME_MARKER[0]:
+            self.start = self.end - 1
+        else:
+            self.start = self.end
+
+    def frames(self):
+        '''Decode all complete frames currently in the buffer.'''
+        while self.end - self.start >= HEADER_SIZE:
+            (marker, _, size) = struct.unpack_from(
+                HEADER_FORMAT, self.buffer, self.start)
+            if marker != 0xFBFB:
+                self._resync()
+                continue
+            if self.end - self.start < HEADER_SIZE + size:
+                self._make_room(HEADER_SIZE + size)
+                break
+            body_start = self.start + HEADER_SIZE
+            self.start = body_start + size
+            try:
+                yield json.loads(
+                    bytes(self.view[body_start:self.start]).decode('utf-8'))
+            except ValueError:
+                print('Discarded invalid response from FarmBot OS.')
+        if self.start == self.end:
+            self.start = self.end = 0
+
+
+class _ResponseStore():
+    '''Responses from FarmBot OS, held until collected by RPC UUID (label).
+
+    Responses nobody collects are evicted once older than `ttl` seconds
+    or when more than `max_size` are held, oldest first.
+    '''
+
+    def __init__(self, max_size=MAX_STORED_RESPONSES,
+                 ttl=RESPONSE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.responses = OrderedDict()
+        self.waiters = {}
+        self.deadlines = {}
+        self.evictions = {'expired': 0, 'overflow': 0}
+        self.lock = threading.Lock()
+
+    def __contains__(self, rpc_uuid):
+        return rpc_uuid in self.responses
+
+    def __len__(self):
+        return len(self.responses)
+
+    def _evict(self, now):
+        while self.responses:
+            rpc_uuid, (expires, _) = next(iter(self.responses.items()))
+            if expires <= now:
+                self.evictions['expired'] += 1
+            elif len(self.responses) > self.max_size:
+                self.evictions['overflow'] += 1
+            else:
+                break
+            del self.responses[rpc_uuid]
+
+    def add(self, response):
+        '''Store a response and wake the caller waiting for its label.'''
+        rpc_uuid = response['args']['label']
+        now = time()
+        with self.lock:
+            waiter = self.waiters.pop(rpc_uuid, None)
+            self.deadlines.pop(rpc_uuid, None)
+            if waiter is None:
+                self.responses[rpc_uuid] = (now + self.ttl, response)
+                self._evict(now)
+        if waiter is not None:
+            waiter.set_result(response)
+
+    def expect(self, rpc_uuid, timeout=TIMEOUT_SECONDS):
+        '''Get a future that resolves with the response for an RPC label.
+
+        If no response arrives within `timeout` seconds,
+        the future resolves with 'no response'.
+        '''
+        future = Future()
+        with self.lock:
+            (_, response) = self.responses.pop(rpc_uuid, (None, None))
+            if response is None:
+                self.waiters[rpc_uuid] = future
+                self.deadlines[rpc_uuid] = time() + timeout
+        if response is not None:
+            future.set_result(response)
+        return future
+
+    def expire(self):
+        '''Evict stale responses and resolve waiters past their deadline.'''
+        now = time()
+        expired = []
+        with self.lock:
+            self._evict(now)
+            for rpc_uuid, deadline in list(self.deadlines.items()):
+                if deadline <= now:
+                    del self.deadlines[rpc_uuid]
+                    expired.append(self.waiters.pop(rpc_uuid))
+        for waiter in expired:
+            waiter.set_result('no response')
+
+    def discard(self, rpc_uuid):
+        '''Stop waiting for a response.'''
+        with self.lock:
+            self.waiters.pop(rpc_uuid, None)
+            self.deadlines.pop(rpc_uuid, None)
+
+    def pop(self, rpc_uuid, timeout=TIMEOUT_SECONDS):
+        '''Pull a response off of the store by RPC UUID (label).'''
+        try:
+            return self.expect(rpc_uuid, timeout).result(timeout)
+        except FutureTimeoutError:
+            self.discard(rpc_uuid)
+            return 'no response'
+
+    def stats(self):
+        '''Get the number of held responses and eviction counts.'''
+        with self.lock:
+            return dict(self.evictions, size=len(self.responses),
+                        waiting=len(self.waiters))
+
+
+class _ResponseBuffer(_ResponseStore):
     '''Collection of responses from FarmBot OS.'''
 
     def __init__(self):
-        self.responses = {}
+        super().__init__()
         self.response_socket = _open_socket(ENV.response_pipe)
+        self.response_socket.settimeout(EXPIRY_INTERVAL_SECONDS)
+        self.reader = _FrameReader(self.response_socket)
+
+    def _reconnect(self):
+        '''Replace a closed response pipe connection.
+
+        Retries with a growing delay while the pipe is unavailable.
+        Responses to requests sent before the pipe closed are lost;
+        their waiters resolve with 'no response' at their deadline.
+        '''
+        self.response_socket.close()
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            self.expire()
+            sleep(delay)
+            try:
+                response_socket = _connect_socket(
+                    ENV.response_pipe, EXPIRY_INTERVAL_SECONDS)
+            except OSError:
+                delay = min(2 * delay, MAX_RECONNECT_DELAY_SECONDS)
+                continue
+            self.response_socket = response_socket
+            self.reader = _FrameReader(response_socket)
+            return
 
     def listen(self):
         '''Collect responses from FarmBot OS.'''
         while True:
+            self.expire()
             try:
-                header = self.response_socket.recv(10)
+                count = self.reader.fill()
             except socket.timeout:
                 continue
-            if header == b'':
+            except OSError:
+                count = 0
+            if count == 0:
+                self._reconnect()
                 continue
-            (_, _, size) = struct.unpack(HEADER_FORMAT, header)
-            response = json.loads(self.response_socket.recv(size).decode())
-            self.responses[response['args']['label']] = response
-
-    def pop(self, rpc_uuid):
-        '''Pull a response off of the buffer by RPC UUID (label).'''
-        wait_time = 0
-        while wait_time < TIMEOUT_SECONDS:
-            response = self.responses.pop(rpc_uuid, None)
-            if response is None:
-                wait_time += 0.5
-                sleep(0.5)
-            else:
-                return response
-        return 'no response'
+            for response in self.reader.frames():
+                self.add(response)
+
+
+class _MqttSession():
+    '''Persistent connection to the FarmBot message broker.
 
+    The network loop runs for the life of the process and responses wake
+    their callers as soon as they arrive.
+    '''
 
-# Listen for responses from FarmBot OS.
-if ENV.use_v2() and ENV.farmware_api_available():
-    RESPONSE_BUFFER = _ResponseBuffer()
-    RESPONSES = threading.Thread(target=RESPONSE_BUFFER.listen, daemon=True)
-    RESPONSES.start()
-elif ENV.use_mqtt():
-    RESPONSES = {}
-    STATUS = {}
-    client = mqtt.Client()
+    def __init__(self, client, bot):
+        self.client = client
+        self.bot = bot
+        self.responses = _ResponseStore()
+        self.status = {}
+        self.status_received = threading.Condition()
+        self.status_count = 0
+        self.status_time = None
+        self.subscribed = threading.Event()
+        client.on_connect = self._on_connect
+        client.on_subscribe = self._on_subscribe
+        client.on_message = self._on_message
 
-    def _on_message(_client, _userdata, msg):
+    def channel(self, name):
+        '''Get the full topic for a bot channel.'''
+        return 'bot/{}/{}'.format(self.bot, name)
+
+    def start(self, host):
+        '''Connect to the broker and start the network loop.'''
+        self.client.connect(host)
+        self.client.loop_start()
+        expiry = threading.Thread(target=self._expire, daemon=True)
+        expiry.start()
+
+    def _expire(self):
+        while True:
+            sleep(EXPIRY_INTERVAL_SECONDS)
+            self.responses.expire()
+
+    def _on_connect(self, *_args):
+        self.subscribed.clear()
+        self.client.subscribe(
+            [(self.channel('from_device'), 0), (self.channel('status'), 0)])
+
+    def _on_subscribe(self, *_args):
+        self.subscribed.set()
+
+    def _on_message(self, _client, _userdata, msg):
         message = json.loads(msg.payload)
         if 'status' in msg.topic:
-            for key, value in message.items():
-                STATUS[key] = value
+            with self.status_received:
+                for key, value in message.items():
+                    self.status[key] = value
+                self.status_count += 1
+                self.status_time = time()
+                self.status_received.notify_all()
         elif message.get('kind') in ['rpc_ok', 'rpc_error']:
             rpc_id = message.get('args', {}).get('label')
             if rpc_id is not None:
-                RESPONSES[rpc_id] = message
-    client.on_message = _on_message
-    client.username_pw_set(ENV.decoded_token['bot'], password=ENV.token)
-    try:
-        client.connect(ENV.decoded_token['mqtt'])
-    except:
-        MQTT_OK = False
-    else:
-        MQTT_OK = True
+                self.responses.add(message)
+
+    def send(self, payload, timeout=TIMEOUT_SECONDS):
+        '''Publish a request and get a future for the response.'''
+        rpc_id = payload.get('args', {}).get('label', '')
+        future = self.responses.expect(rpc_id, timeout)
+        self.subscribed.wait(timeout)
+        self.client.publish(
+            self.channel('from_clients'), payload=json.dumps(payload))
+        return future
 
-    if MQTT_OK:
-        def _mqtt_channel(channel):
-            return 'bot/{}/{}'.format(ENV.decoded_token['bot'], channel)
-        client.subscribe(_mqtt_channel('from_device'))
-        client.subscribe(_mqtt_channel('status'))
+    def wait_for_status(self, count, timeout=TIMEOUT_SECONDS):
+        '''Wait for more than `count` status messages to have arrived.'''
+        with self.status_received:
+            return self.status_received.wait_for(
+                lambda: self.status_count > count, timeout)
+
+    def status_snapshot(self, max_age=None):
+        '''Copy the status mirror if it has been updated recently enough.
+
+        Args:
+            max_age (float, optional): Maximum snapshot age in seconds.
+                Defaults to None (any age).
+        Returns:
+            dict, or None if no (recent enough) status has been received
+        '''
+        with self.status_received:
+            if self.status_time is None:
+                return None
+            if max_age is not None and time() - self.status_time > max_age:
+                return None
+            return dict(self.status)
+
+    def request(self, payload, wait_for_status=False, timeout=TIMEOUT_SECONDS):
+        '''Publish a request and wait for the response (or a status update).'''
+        print(f'sending MQTT message: {json.dumps(payload, indent=2)}')
+        rpc_id = payload.get('args', {}).get('label', '')
+        deadline = time() + timeout
+        count = self.status_count
+        future = self.send(payload, timeout)
+        remaining = max(0, deadline - time())
+        if wait_for_status:
+            received = self.wait_for_status(count, remaining)
+            self.responses.discard(rpc_id)
+            return 'got status' if received else 'no response'
+        try:
+            response = future.result(remaining)
+        except FutureTimeoutError:
+            self.responses.discard(rpc_id)
+            response = 'no response'
+        print(f'MQTT response: {json.dumps(response, indent=2)}')
+        return response
+
+
+def _response_buffer():
+    'Get the v2 response buffer, starting the listener on first use.'
+    global RESPONSE_BUFFER
+    with TRANSPORT_LOCK:
+        if RESPONSE_BUFFER is None:
+            RESPONSE_BUFFER = _ResponseBuffer()
+            listener = threading.Thread(
+                target=RESPONSE_BUFFER.listen, daemon=True)
+            listener.start()
+        return RESPONSE_BUFFER
+
+
+def _request_channel():
+    'Get the v2 request channel.'
+    global REQUEST_CHANNEL
+    with TRANSPORT_LOCK:
+        if REQUEST_CHANNEL is None:
+            REQUEST_CHANNEL = _RequestChannel(ENV.request_pipe)
+        return REQUEST_CHANNEL
+
+
+def _mqtt_session():
+    'Get the MQTT session, connecting on first use. None if unavailable.'
+    global MQTT_SESSION, MQTT_OK
+    with TRANSPORT_LOCK:
+        if MQTT_OK is None:
+            import paho.mqtt.client as mqtt
+            session = _MqttSession(mqtt.Client(), ENV.decoded_token['bot'])
+            session.client.username_pw_set(
+                ENV.decoded_token['bot'], password=ENV.token)
+            try:
+                session.start(ENV.decoded_token['mqtt'])
+            except:
+                MQTT_OK = False
+            else:
+                MQTT_OK = True
+                MQTT_SESSION = session
+        return MQTT_SESSION
 
 
 def _mqtt_request(payload, wait_for_status=False):
     'Make a request via MQTT.'
-    if not MQTT_OK:
+    session = _mqtt_session()
+    if session is None:
         return 'no MQTT'
-    if wait_for_status:
-        STATUS.clear()
-    client.loop_start()
-    print(f'sending MQTT message: {json.dumps(payload, indent=2)}')
-    sleep(0.5)
-    client.publish(_mqtt_channel('from_clients'), payload=json.dumps(payload))
-    rpc_id = payload.get('args', {}).get('label', '')
-    start = time()
-    response = 'no response'
-    while (time() - start) < TIMEOUT_SECONDS:
-        sleep(0.5)
-        if wait_for_status:
-            if len(STATUS.keys()) > 0:
-                return 'got status'
-        elif rpc_id in RESPONSES.keys():
-            response = RESPONSES[rpc_id]
-    print(f'MQTT response: {json.dumps(response, indent=2)}')
-    client.loop_stop()
-    return response
+    return session.request(payload, wait_for_status=wait_for_status)
 
 
-def _mqtt_status():
-    'Fetch bot state via MQTT.'
-    _mqtt_request({
-        'kind': 'rpc_request',
-        'args': {'label': str(uuid4())},
-        'body': [{'kind': 'read_status', 'args': {}}]}, wait_for_status=True)
-    return STATUS
+def _mqtt_request_async(payload):
+    'Make a request via MQTT and get a future for the response.'
+    session = _mqtt_session()
+    if session is None:
+        future = Future()
+        future.set_result('no MQTT')
+        return future
+    return session.send(payload)
 
 
+def _mqtt_status(max_age=None):
+    """Fetch bot state via MQTT.
 
-def _request_write(payload):
-    'Make a request to FarmBot OS.'
-    request_socket = _open_socket(ENV.request_pipe)
-    message_bytes = bytes(json.dumps(payload), 'utf-8')
-    header = struct.pack(HEADER_FORMAT, 0xFBFB, 0, len(message_bytes))
-    request_socket.sendall(header + message_bytes)
-    request_socket.close()
+    Reads the status mirror kept current by the status subscription and
+    only requests a fresh status when it is empty or older than `max_age`.
+    """
+    session = _mqtt_session()
+    if session is None:
+        return STATUS
+    status = session.status_snapshot(max_age)
+    if status is None:
+        _mqtt_request({
+            'kind': 'rpc_request',
+            'args': {'label': str(uuid4())},
+            'body': [{'kind': 'read_status', 'args': {}}]},
+            wait_for_status=True)
+        status = session.status_snapshot() or {}
+    return status
+
+
+def _resolve_later(future, result):
+    '''Resolve a future returned to the caller.
+
+    Never resolved on the response listener or MQTT network thread,
+    so done-callbacks may send commands and wait for their responses.
+    '''
+    CALLBACKS.submit(future.set_result, result)
+
+
+def _request_write(*payloads):
+    'Make one or more requests to FarmBot OS.'
+    _request_channel().write(*payloads)
 
 
 def _response_read(rpc_uuid):
     'Read a response from FarmBot OS for the provided request RPC UUID.'
     if rpc_uuid is not None:
-        return RESPONSE_BUFFER.pop(rpc_uuid)
+        return _response_buffer().pop(rpc_uuid)
     return 'missing RPC label'
+
+
+def _response_expect(rpc_uuid, timeout=TIMEOUT_SECONDS):
+    'Get a future for the FarmBot OS response to the provided RPC UUID.'
+    return _response_buffer().expect(rpc_uuid, timeout)
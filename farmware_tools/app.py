@@ -6,12 +6,22 @@ from __future__ import print_function
 import sys
 import time
 import json
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .auxiliary import Color
 from .env import Env
+from ._http import _session, set_pool_size, _ResponseCache, _account
+from ._http import DEFAULT_CACHE_TTL_SECONDS, DEFAULT_CACHE_ENTRIES
+from ._sequences import _SequenceIndex, DEFAULT_INDEX_MAX_AGE_SECONDS
 
 COLOR = Color()
 ENV = Env()
+CACHE = {'cache': None}
+DEFAULT_BULK_WORKERS = 8
+# Errors raised by `_get_required_info` for a missing or malformed token.
+GET_INFO_ERRORS = (KeyError, IndexError, TypeError, ValueError)
+SEQUENCE_INDEXES = {}
+SEQUENCE_INDEX_OPTIONS = {
+    'path': None, 'max_age': DEFAULT_INDEX_MAX_AGE_SECONDS}
 
 
 def _get_required_info():
@@ -53,15 +63,74 @@ def _simplify_text_response(text, code):
         return '({}) {}'.format(code, simple_error_string)
 
 
-def request(raw_method, endpoint, _id=None, payload=None, return_dict=False,
-            get_info=_get_required_info):
-    """Send an HTTP request to the FarmBot Web App.
+def enable_cache(ttl=DEFAULT_CACHE_TTL_SECONDS, ttls=None,
+                 max_entries=DEFAULT_CACHE_ENTRIES):
+    """Cache Web App responses of requests that only read data.
+
+    GET requests and POST searches are cached. Other requests to the
+    same resource (i.e., `post('points', ...)` for 'points/search')
+    invalidate its cached responses. Expired responses are revalidated
+    with `If-None-Match`/`If-Modified-Since` when possible.
 
     Args:
-        raw_method (str): HTTP request method ('POST', 'GET', etc.)
-        endpoint (str): Web App endpoint ('sequences', 'logs', etc.)
-        _id (int, optional): Web App resource ID. Defaults to None.
-        payload (dict, optional): i.e., {'name': 'new tool'}
+        ttl (float, optional): Seconds a response is used without
+            revalidation. Defaults to DEFAULT_CACHE_TTL_SECONDS.
+        ttls (dict, optional): TTLs by resource, i.e., {'sequences': 300}.
+        max_entries (int, optional): Maximum number of cached responses
+            (least recently used are evicted). Defaults to
+            DEFAULT_CACHE_ENTRIES.
+    """
+    CACHE['cache'] = _ResponseCache(ttl, ttls, max_entries)
+
+
+def disable_cache():
+    """Stop caching Web App responses (and drop cached responses)."""
+    CACHE['cache'] = None
+
+
+def cache_stats():
+    """Get Web App response cache counts.
+
+    Returns:
+        dict with hits, misses, revalidated, evictions, invalidations
+        and entries (number of cached responses), or None if the cache
+        is not enabled.
+    """
+    cache = CACHE['cache']
+    return None if cache is None else cache.stats()
+
+
+def _cached(cache, entry, return_dict):
+    json_response = cache.response(entry)
+    if return_dict:
+        return {'json': json_response, 'status_code': 200}
+    return json_response
+
+
+def _invalidate(cache, method, endpoint, full_endpoint, api):
+    'Drop cached data a (write) request may have changed.'
+    if cache is not None and not cache.cacheable(method, full_endpoint):
+        cache.invalidate(full_endpoint)
+    if method != 'GET' and endpoint.startswith('sequences'):
+        index = SEQUENCE_INDEXES.get(_account(api))
+        if index is not None:
+            index.invalidate()
+
+
+def _unsent(request_string, return_dict):
+    'Result of a request that could not be sent.'
+    print(request_string)
+    if return_dict:
+        return {'json': json.dumps(request_string), 'status_code': 0}
+    return request_string
+
+
+def _prepare(raw_method, endpoint, _id, payload, return_dict, get_info):
+    """Assemble a Web App request (shared by `request` and `app_aio`).
+
+    Returns:
+        (request info, None), or (None, result) if nothing needs to be
+        sent (no API info, or a fresh cached response).
     """
     method = raw_method.upper()
     full_endpoint = endpoint
@@ -73,53 +142,92 @@ def request(raw_method, endpoint, _id=None, payload=None, return_dict=False,
     try:
         api = get_info()
     except:
-        print(request_string)
-        if return_dict:
-            return {'json': json.dumps(request_string), 'status_code': 0}
-        return request_string
-
-    try:  # verbose output if testing
-        if api['verbose']:
-            verbose = True
-    except KeyError:
-        verbose = False
-
-    url = api['url'] + full_endpoint
-    request_kwargs = {}
-    request_kwargs['headers'] = {
-        'Authorization': 'Bearer ' + api['token'],
-        'content-type': 'application/json'}
-    if payload is not None:
-        request_kwargs['json'] = payload
-    try:
-        response = requests.request(method, url, **request_kwargs)
-    except:
-        print(request_string)
-        if return_dict:
-            return {'json': json.dumps(request_string), 'status_code': 0}
-        return request_string
-    status_code = response.status_code
+        return None, _unsent(request_string, return_dict)
+
+    prepared = {
+        'method': method, 'endpoint': endpoint,
+        'full_endpoint': full_endpoint, 'request_string': request_string,
+        'api': api, 'url': api['url'] + full_endpoint,
+        'verbose': bool(api.get('verbose', False)),  # if testing
+        'headers': {
+            'Authorization': 'Bearer ' + api['token'],
+            'content-type': 'application/json'},
+        'return_dict': return_dict,
+        'cache': CACHE['cache'], 'cache_key': None, 'cached': None}
+    cache = prepared['cache']
+    if cache is not None and cache.cacheable(method, full_endpoint):
+        prepared['cache_key'] = cache.key(api, method, full_endpoint, payload)
+    if prepared['cache_key'] is not None:
+        prepared['generation'] = cache.generation(full_endpoint)
+        cached, fresh = cache.lookup(prepared['cache_key'])
+        if fresh:
+            return None, _cached(cache, cached, return_dict)
+        if cached is not None:
+            prepared['cached'] = cached
+            prepared['headers'].update(cache.conditional_headers(cached))
+    return prepared, None
+
+
+def _finish(prepared, status_code, text, headers):
+    'Handle a Web App response (shared by `request` and `app_aio`).'
+    cache = prepared['cache']
+    return_dict = prepared['return_dict']
+    if prepared['cached'] is not None and status_code == 304:
+        cache.revalidated(prepared['cache_key'])
+        return _cached(cache, prepared['cached'], return_dict)
+    _invalidate(cache, prepared['method'], prepared['endpoint'],
+                prepared['full_endpoint'], prepared['api'])
     colorized_status_code = COLOR.colorize_response_code(status_code)
-    bold_request_string = COLOR.make_bold(request_string)
+    bold_request_string = COLOR.make_bold(prepared['request_string'])
     request_details = '{}: {}'.format(
         colorized_status_code, bold_request_string)
+    verbose = prepared['verbose']
     if verbose:
         print()
         print(request_details)
     try:
-        json_response = response.json()
-        text_response = response.text
-    except:
-        text_response = _simplify_text_response(response.text, status_code)
+        json_response = json.loads(text)
+        text_response = text
+    except ValueError:
+        text_response = _simplify_text_response(text, status_code)
         json_response = json.dumps(text_response)
     if status_code != 200 and not verbose:
         print(request_details)
         print(text_response)
+    if status_code == 200 and prepared['cache_key'] is not None:
+        cache.store(prepared['cache_key'], json_response, headers,
+                    prepared['generation'])
     if return_dict:
         return {'json': json_response, 'status_code': status_code}
     return json_response
 
 
+def request(raw_method, endpoint, _id=None, payload=None, return_dict=False,
+            get_info=_get_required_info):
+    """Send an HTTP request to the FarmBot Web App.
+
+    Args:
+        raw_method (str): HTTP request method ('POST', 'GET', etc.)
+        endpoint (str): Web App endpoint ('sequences', 'logs', etc.)
+        _id (int, optional): Web App resource ID. Defaults to None.
+        payload (dict, optional): i.e., {'name': 'new tool'}
+    """
+    prepared, result = _prepare(
+        raw_method, endpoint, _id, payload, return_dict, get_info)
+    if prepared is None:
+        return result
+    request_kwargs = {'headers': prepared['headers']}
+    if payload is not None:
+        request_kwargs['json'] = payload
+    try:
+        response = _session().request(
+            prepared['method'], prepared['url'], **request_kwargs)
+    except:
+        return _unsent(prepared['request_string'], return_dict)
+    return _finish(
+        prepared, response.status_code, response.text, response.headers)
+
+
 def post(endpoint, payload, return_dict=False, get_info=_get_required_info):
     """Send a POST HTTP request to the FarmBot Web App.
 
@@ -204,6 +312,55 @@ def delete(endpoint, _id=None, return_dict=False, get_info=_get_required_info):
     return request('DELETE', endpoint, **kwargs)
 
 
+def _bulk_item(item):
+    'Split a bulk item into (ID, payload).'
+    if isinstance(item, dict):
+        return None, item
+    if isinstance(item, (tuple, list)):
+        return item[0], item[1]
+    return item, None
+
+
+def bulk(method, endpoint, items, workers=DEFAULT_BULK_WORKERS,
+         progress=None, get_info=_get_required_info):
+    """Send many HTTP requests to the FarmBot Web App concurrently.
+
+    Args:
+        method (str): HTTP request method ('POST', 'DELETE', etc.)
+        endpoint (str): Web App endpoint ('points', etc.)
+        items (list): One item per request. Each item is a payload
+            (dict), a resource ID, or an (ID, payload) pair.
+        workers (int, optional): Maximum number of concurrent requests.
+            Defaults to DEFAULT_BULK_WORKERS.
+        progress (callable, optional): Called as `progress(done, total)`
+            after each request completes.
+    Returns:
+        list of {'json': ..., 'status_code': ...} in the order of `items`.
+        A status code of 0 means the request could not be sent.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if len(items) == 0:
+        return results
+
+    def _send(item):
+        _id, payload = _bulk_item(item)
+        return request(method, endpoint, _id=_id, payload=payload,
+                       return_dict=True, get_info=get_info)
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        futures = {pool.submit(_send, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {'json': str(error), 'status_code': 0}
+            results[futures[future]] = result
+            if progress is not None:
+                progress(done, len(items))
+    return results
+
+
 def log(message, message_type='info', get_info=_get_required_info):
     """POST a log message to the Web App.
 
@@ -295,27 +452,140 @@ def add_plant(x, y, get_info=_get_required_info, **kwargs):
     return post('points', payload=new_plant, get_info=get_info)
 
 
-def find_sequence_by_name(name, get_info=_get_required_info):
-    """Find the sequence_id for a given sequence name.
+def add_plants(plants, get_info=_get_required_info, **kwargs):
+    """Add many plants to the garden map concurrently.
 
     Args:
-        name (str): Sequence name.
+        plants (list): Plant dicts with x, y and optionally name,
+            openfarm_slug, radius, z, planted_at, plant_stage.
+        **kwargs: `bulk` options (workers, progress).
+    Returns:
+        list of `bulk` results in the order of `plants`.
+    """
+    new_plants = [
+        dict({k: v for k, v in plant.items() if v is not None},
+             pointer_type='Plant')
+        for plant in plants]
+    return bulk('POST', 'points', new_plants, get_info=get_info, **kwargs)
+
+
+def delete_points(ids, get_info=_get_required_info, **kwargs):
+    """Delete many points (plants, weeds, etc.) concurrently.
+
+    Args:
+        ids (list): Point IDs.
+        **kwargs: `bulk` options (workers, progress).
+    Returns:
+        list of `bulk` results in the order of `ids`.
+    """
+    return bulk('DELETE', 'points', ids, get_info=get_info, **kwargs)
+
+
+def set_sequence_index(path=None, max_age=DEFAULT_INDEX_MAX_AGE_SECONDS):
+    """Configure the sequence name index used by the sequence lookups.
+
+    Args:
+        path (str, optional): JSON file to persist the index to, i.e.,
+            to share it between Farmware runs. Defaults to None (memory).
+        max_age (float, optional): Seconds before the index is refreshed.
+            Defaults to DEFAULT_INDEX_MAX_AGE_SECONDS.
     """
+    SEQUENCE_INDEX_OPTIONS.update(path=path, max_age=max_age)
+    SEQUENCE_INDEXES.clear()
+
+
+def _refresh_sequence_index(index, get_info):
     sequences = get('sequences', get_info=get_info)
     if not isinstance(sequences, list):
         _error('Error retrieving sequences.')
-        sequences = []
-    sequence_lookup = {s['name']: s['id'] for s in sequences}
+        return
+    index.update(sequences)
+
+
+def _find_sequences(names, ignore_case, get_info, prefix=False):
+    """Look up sequence names in the (refreshed if required) index.
+
+    The sequence list is downloaded at most once per call: when the
+    index is stale, or when a name is not found in a cached index.
+    """
     try:
-        uname = name.decode('utf-8')
-    except (UnicodeEncodeError, AttributeError):
-        uname = name
+        account = _account(get_info())
+    except GET_INFO_ERRORS:
+        account = None
+    if account not in SEQUENCE_INDEXES:
+        SEQUENCE_INDEXES[account] = _SequenceIndex(
+            account, **SEQUENCE_INDEX_OPTIONS)
+    index = SEQUENCE_INDEXES[account]
+    refreshed = index.stale()
+    if refreshed:
+        _refresh_sequence_index(index, get_info)
+    while True:
+        if prefix:
+            found = {}
+            for name in names:
+                found.update(index.prefix(name, ignore_case))
+            if found or refreshed:
+                return found
+        else:
+            found = {name: index.lookup(name, ignore_case) for name in names}
+            if refreshed or None not in found.values():
+                return found
+        _refresh_sequence_index(index, get_info)
+        refreshed = True
+
+
+def _decoded(name):
     try:
-        sequence_id = sequence_lookup[uname]
-    except KeyError:
+        return name.decode('utf-8')
+    except (UnicodeEncodeError, AttributeError):
+        return name
+
+
+def find_sequences_by_name(names, ignore_case=False,
+                           get_info=_get_required_info):
+    """Find the sequence_ids for many sequence names at once.
+
+    Args:
+        names (list): Sequence names.
+        ignore_case (bool, optional): Defaults to False.
+    Returns:
+        {name: sequence_id or None if not found}
+    """
+    names = [_decoded(name) for name in names]
+    return _find_sequences(names, ignore_case, get_info)
+
+
+def find_sequences_by_prefix(prefix, ignore_case=False,
+                             get_info=_get_required_info):
+    """Find the sequences whose name starts with `prefix`.
+
+    Args:
+        prefix (str): Sequence name prefix.
+        ignore_case (bool, optional): Defaults to False.
+    Returns:
+        {name: sequence_id}
+    """
+    return _find_sequences(
+        [_decoded(prefix)], ignore_case, get_info, prefix=True)
+
+
+def find_sequence_by_name(name, ignore_case=False,
+                          get_info=_get_required_info):
+    """Find the sequence_id for a given sequence name.
+
+    Sequence names are looked up in an index that is built once
+    and refreshed when stale or when a name is not found
+    (see `set_sequence_index`).
+
+    Args:
+        name (str): Sequence name.
+        ignore_case (bool, optional): Defaults to False.
+    """
+    uname = _decoded(name)
+    sequence_id = _find_sequences([uname], ignore_case, get_info)[uname]
+    if sequence_id is None:
         _error(u'Sequence `{}` not found.'.format(uname))
-    else:
-        return sequence_id
+    return sequence_id
 
 
 if __name__ == '__main__':
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: Web App (asyncio).
+
+Awaitable counterparts of the `app` functions, i.e.,
+`await app_aio.get('sequences')`.
+
+Requests are sent by a small HTTP/1.1 client built on asyncio streams
+that keeps connections alive per host, so any number of requests can
+be awaited concurrently without a thread per request. Requests are
+prepared and responses handled by the same helpers as `app.request`,
+and the `app` response cache (see `app.enable_cache`) is shared.
+Sequence name lookups run the blocking `app` functions in the default
+executor.
+'''
+
+from __future__ import print_function
+import ssl
+import json
+import asyncio
+from functools import partial
+from urllib.parse import urlsplit
+from . import app
+from ._http import DEFAULT_POOL_SIZE
+from .app import DEFAULT_BULK_WORKERS
+from .app import _get_required_info, _prepare, _finish, _unsent, _bulk_item
+
+NO_BODY_STATUS_CODES = [204, 304]
+# Requests retried on a new connection when a reused connection fails
+# (the server may have processed other requests before closing it).
+RETRY_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+class _Headers(dict):
+    '''Response headers with case-insensitive `get`.'''
+
+    def get(self, name, default=None):
+        return dict.get(self, name.lower(), default)
+
+
+class _Pool():
+    '''Keep-alive HTTP/1.1 connections for the running event loop.'''
+
+    def __init__(self, size=DEFAULT_POOL_SIZE):
+        self.size = size
+        self.loop = None
+        self.idle = {}
+        self.limits = {}
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection[1].close()
+        except RuntimeError:  # its event loop is closed
+            pass
+
+    def _reset(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            for connections in self.idle.values():
+                for connection in connections:
+                    self._close(connection)
+            self.loop = loop
+            self.idle = {}
+            self.limits = {}
+
+    @staticmethod
+    async def _open(scheme, host, port):
+        context = ssl.create_default_context() if scheme == 'https' else None
+        return await asyncio.open_connection(host, port, ssl=context)
+
+    @staticmethod
+    async def _read_body(reader, method, status_code, headers):
+        'Read a response body. Returns (body, keep-alive).'
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status_code in NO_BODY_STATUS_CODES or (
+                100 <= status_code < 200):
+            return b'', keep_alive
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';')[0].strip(), 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    return b''.join(chunks), keep_alive
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        length = headers.get('content-length')
+        if length is not None:
+            return await reader.readexactly(int(length)), keep_alive
+        return await reader.read(), False
+
+    async def _exchange(self, connection, method, target, headers, body):
+        reader, writer = connection
+        lines = ['{} {} HTTP/1.1'.format(method, target)]
+        lines.extend('{}: {}'.format(k, v) for k, v in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+        status_line = await reader.readuntil(b'\r\n')
+        status_code = int(status_line.split()[1])
+        response_headers = _Headers()
+        while True:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1')
+            if line == '\r\n':
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        response_body, keep_alive = await self._read_body(
+            reader, method, status_code, response_headers)
+        return status_code, response_headers, response_body, keep_alive
+
+    async def fetch(self, method, url, headers, body=b''):
+        """Send an HTTP request.
+
+        Returns:
+            (status code, headers, body bytes)
+        """
+        self._reset()
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        request_headers = {'Host': parts.netloc,
+                           'Content-Length': str(len(body))}
+        request_headers.update(headers)
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(self.size)
+        idle = self.idle.setdefault(key, [])
+        async with self.limits[key]:
+            while True:
+                reused = len(idle) > 0
+                connection = idle.pop() if reused else await self._open(*key)
+                try:
+                    (status_code, response_headers, response_body,
+                     keep_alive) = await self._exchange(
+                         connection, method, target, request_headers, body)
+                except (OSError, EOFError, asyncio.IncompleteReadError):
+                    self._close(connection)
+                    if reused and method in RETRY_METHODS:
+                        continue  # closed by the server while idle
+                    raise
+                except BaseException:
+                    self._close(connection)
+                    raise
+                if keep_alive:
+                    idle.append(connection)
+                else:
+                    self._close(connection)
+                return status_code, response_headers, response_body
+
+
+POOL = _Pool()
+
+
+def set_pool_size(size):
+    """Set how many concurrent connections are used per host.
+
+    Args:
+        size (int): Connections per host. Defaults to DEFAULT_POOL_SIZE.
+    """
+    POOL.size = size
+    POOL.loop = None
+
+
+async def request(raw_method, endpoint, _id=None, payload=None,
+                  return_dict=False, get_info=_get_required_info):
+    """Send an HTTP request to the FarmBot Web App.
+
+    Args:
+        raw_method (str): HTTP request method ('POST', 'GET', etc.)
+        endpoint (str): Web App endpoint ('sequences', 'logs', etc.)
+        _id (int, optional): Web App resource ID. Defaults to None.
+        payload (dict, optional): i.e., {'name': 'new tool'}
+    """
+    prepared, result = _prepare(
+        raw_method, endpoint, _id, payload, return_dict, get_info)
+    if prepared is None:
+        return result
+    try:
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        status_code, response_headers, response_body = await POOL.fetch(
+            prepared['method'], prepared['url'], prepared['headers'], body)
+    except Exception:
+        return _unsent(prepared['request_string'], return_dict)
+    return _finish(prepared, status_code,
+                   response_body.decode('utf-8', 'replace'), response_headers)
+
+
+async def post(endpoint, payload, return_dict=False,
+               get_info=_get_required_info):
+    """Send a POST HTTP request to the FarmBot Web App. See `app.post`."""
+    return await request('POST', endpoint, payload=payload,
+                         return_dict=return_dict, get_info=get_info)
+
+
+async def get(endpoint, _id=None, payload=None, return_dict=False,
+              get_info=_get_required_info):
+    """Send a GET HTTP request to the FarmBot Web App. See `app.get`."""
+    return await request('GET', endpoint, _id=_id, payload=payload,
+                         return_dict=return_dict, get_info=get_info)
+
+
+async def patch(endpoint, _id=None, payload=None, return_dict=False,
+                get_info=_get_required_info):
+    """Send a PATCH HTTP request to the FarmBot Web App. See `app.patch`."""
+    return await request('PATCH', endpoint, _id=_id, payload=payload,
+                         return_dict=return_dict, get_info=get_info)
+
+
+async def put(endpoint, _id=None, payload=None, return_dict=False,
+              get_info=_get_required_info):
+    """Send a PUT HTTP request to the FarmBot Web App. See `app.put`."""
+    return await request('PUT', endpoint, _id=_id, payload=payload,
+                         return_dict=return_dict, get_info=get_info)
+
+
+async def delete(endpoint, _id=None, return_dict=False,
+                 get_info=_get_required_info):
+    """Send a DELETE HTTP request to the FarmBot Web App. See `app.delete`."""
+    return await request('DELETE', endpoint, _id=_id,
+                         return_dict=return_dict, get_info=get_info)
+
+
+async def bulk(method, endpoint, items, workers=DEFAULT_BULK_WORKERS,
+               progress=None, get_info=_get_required_info):
+    """Send many HTTP requests to the FarmBot Web App. See `app.bulk`."""
+    items = list(items)
+    limit = asyncio.Semaphore(workers)
+    done = [0]
+
+    async def _send(item):
+        _id, payload = _bulk_item(item)
+        async with limit:
+            result = await request(method, endpoint, _id=_id, payload=payload,
+                                   return_dict=True, get_info=get_info)
+        done[0] += 1
+        if progress is not None:
+            progress(done[0], len(items))
+        return result
+    return list(await asyncio.gather(*[_send(item) for item in items]))
+
+
+async def log(message, message_type='info', get_info=_get_required_info):
+    """POST a log message to the Web App. See `app.log`."""
+    payload = {'message': message, 'type': message_type}
+    return await post('logs', payload=payload, get_info=get_info)
+
+
+async def search_logs(search_payload, get_info=_get_required_info):
+    """Get a filtered selection of logs. See `app.search_logs`."""
+    return await get('logs/search', payload=search_payload, get_info=get_info)
+
+
+async def search_points(search_payload, get_info=_get_required_info):
+    """Get a filtered selection of points. See `app.search_points`."""
+    return await post(
+        'points/search', payload=search_payload, get_info=get_info)
+
+
+async def download_plants(get_info=_get_required_info):
+    """Get plant data from the web app."""
+    return await search_points({'pointer_type': 'Plant'}, get_info)
+
+
+async def get_points(get_info=_get_required_info):
+    """Get generic point data from the web app."""
+    return await search_points({'pointer_type': 'GenericPointer'}, get_info)
+
+
+async def get_plants(get_info=_get_required_info):
+    """Get plant data from the web app."""
+    return await download_plants(get_info)
+
+
+async def get_toolslots(get_info=_get_required_info):
+    """Get tool slot data from the web app."""
+    return await search_points({'pointer_type': 'ToolSlot'}, get_info)
+
+
+async def get_property(endpoint, field, _id=None,
+                       get_info=_get_required_info):
+    """Get the value of a field of a record. See `app.get_property`."""
+    record = await get(endpoint, _id=_id, get_info=get_info)
+    try:
+        return record[field]
+    except (KeyError, TypeError):
+        app._error('{} not found.'.format(field))
+
+
+async def add_plant(x, y, get_info=_get_required_info, **kwargs):
+    """Add a plant to the garden map. See `app.add_plant`."""
+    new_plant = {'pointer_type': 'Plant', 'x': x, 'y': y}
+    for key, value in kwargs.items():
+        if value is not None:
+            new_plant[key] = value
+    return await post('points', payload=new_plant, get_info=get_info)
+
+
+async def add_plants(plants, get_info=_get_required_info, **kwargs):
+    """Add many plants to the garden map. See `app.add_plants`."""
+    new_plants = [
+        dict({k: v for k, v in plant.items() if v is not None},
+             pointer_type='Plant')
+        for plant in plants]
+    return await bulk('POST', 'points', new_plants, get_info=get_info,
+                      **kwargs)
+
+
+async def delete_points(ids, get_info=_get_required_info, **kwargs):
+    """Delete many points. See `app.delete_points`."""
+    return await bulk('DELETE', 'points', ids, get_info=get_info, **kwargs)
+
+
+async def _run_blocking(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, partial(function, *args, **kwargs))
+
+
+async def find_sequence_by_name(name, ignore_case=False,
+                                get_info=_get_required_info):
+    """Find the sequence_id for a sequence name.
+
+    See `app.find_sequence_by_name`.
+    """
+    return await _run_blocking(
+        app.find_sequence_by_name, name, ignore_case, get_info=get_info)
+
+
+async def find_sequences_by_name(names, ignore_case=False,
+                                 get_info=_get_required_info):
+    """Find the sequence_ids for many sequence names.
+
+    See `app.find_sequences_by_name`.
+    """
+    return await _run_blocking(
+        app.find_sequences_by_name, names, ignore_case, get_info=get_info)
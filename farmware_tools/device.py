@@ -5,21 +5,46 @@
 from __future__ import print_function
 import os
 import sys
+import time
+import json
 import uuid
+import hashlib
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future, wait as _wait
+from concurrent.futures import as_completed as _as_completed
 from functools import wraps
-import requests
-from ._util import _request_write, _response_read, _mqtt_request, _mqtt_status
+from ._util import _request_write, _response_read, _response_expect
+from ._util import _mqtt_request, _mqtt_request_async, _mqtt_status
+from ._util import _mqtt_session, _resolve_later
+from ._http import _session
+from ._state import StateView, _DirectorySource, _DictSource, _state_cache
+from ._state import decode_value
+from ._schema import ALLOWED_AXIS_VALUES, ALLOWED_MESSAGE_TYPES
+from ._schema import ALLOWED_MESSAGE_CHANNELS, ALLOWED_PACKAGES
+from ._schema import VALIDATION_MODES, VALIDATORS, VALID, validate_node
 from .auxiliary import Color
 from .env import Env
 
 COLOR = Color()
 ENV = Env()
-ALLOWED_AXIS_VALUES = ['x', 'y', 'z', 'all']
-ALLOWED_MESSAGE_TYPES = [
-    'success', 'busy', 'warn', 'error', 'info', 'fun', 'debug']
-ALLOWED_MESSAGE_CHANNELS = ['ticker', 'toast', 'email', 'espeak']
-ALLOWED_PACKAGES = ['farmbot_os', 'arduino_firmware', 'farmware']
 RESPONSE_ERROR_LOG_UUID = str(uuid.uuid4())
+DEFAULT_IN_FLIGHT_LIMIT = 8
+VALIDATION = {'mode': 'default', 'validators': VALIDATORS['default']}
+IN_FLIGHT = {'window': threading.BoundedSemaphore(DEFAULT_IN_FLIGHT_LIMIT)}
+WATCH_PATHS = ['location_data.position', 'pins', 'jobs',
+               'informational_settings']
+WATCH_POLL_INTERVAL_SECONDS = 0.5
+BATCHES = threading.local()
+SEQUENCE_KINDS = [
+    'calibrate', 'emergency_lock', 'execute', 'execute_script', 'find_home',
+    'home', 'move', 'move_absolute', 'move_relative', 'power_off',
+    'read_pin', 'read_status', 'reboot', 'send_message', 'set_servo_angle',
+    'sync', 'take_photo', 'toggle_pin', 'wait', 'write_pin', 'zero']
+SEQUENCE_IDS = {}
+USER_ENVS = {}
+StateChange = namedtuple('StateChange', ['path', 'old', 'new'])
 
 
 def _on_error():
@@ -40,9 +65,32 @@ def _check_celery_script(command):
             if not isinstance(body, list):
                 _cs_error(kind, body)
                 _on_error()
+        if VALIDATION['mode'] == 'strict':
+            invalid = validate_node(command, VALIDATION['validators'])
+            if invalid is not VALID:
+                _cs_error(kind, invalid)
+                _on_error()
+                return
         return kind, args, body
 
 
+def set_validation_mode(mode):
+    """Set how commands are validated before they are sent.
+
+    Args:
+        mode (str): One of VALIDATION_MODES:
+            'default': check arg values (enums and ranges),
+                including those of body items.
+            'strict': also check arg types, unknown args and body item kinds,
+                including commands passed to `send_celery_script`.
+            'trusted': skip validation.
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError('mode must be one of {}'.format(VALIDATION_MODES))
+    VALIDATION['validators'] = VALIDATORS[mode]
+    VALIDATION['mode'] = mode
+
+
 def rpc_wrapper(command, rpc_id=None):
     """Wrap a command in `rpc_request` with the given `rpc_id`."""
     return {
@@ -69,11 +117,12 @@ def _device_request(method, endpoint, payload=None):
         request_kwargs['json'] = payload
         response_error_log = payload.get(
             'args', {}).get('label') == RESPONSE_ERROR_LOG_UUID
-    response = requests.request(method, url, **request_kwargs)
+    response = _session().request(method, url, **request_kwargs)
     if response.status_code != 200 and not response_error_log:
-        log('{} request `{}` error ({})'.format(
-            endpoint, payload or '', response.status_code), 'error',
-            rpc_id=RESPONSE_ERROR_LOG_UUID)
+        with _unbatched():
+            log('{} request `{}` error ({})'.format(
+                endpoint, payload or '', response.status_code), 'error',
+                rpc_id=RESPONSE_ERROR_LOG_UUID)
         _on_error()
     return response
 
@@ -91,14 +140,7 @@ def _device_state_fetch_v2():
     'Get info from the device Farmware API (v2).'
     if ENV.bot_state_dir is None:
         return
-
-    def _crawl(path):
-        if os.path.isdir(path):
-            return {n: _crawl(os.path.join(path, n)) for n in os.listdir(path)}
-        with open(path, 'r') as value_file:
-            value = value_file.read()
-            return value if value != '' else None
-    return _crawl(ENV.bot_state_dir)
+    return _state_cache(ENV.bot_state_dir).get()
 
 
 def _post(endpoint, payload):
@@ -113,14 +155,15 @@ def _post(endpoint, payload):
     Returns:
         requests response object
     """
-    if ENV.use_v2():
+    transport = ENV.capabilities.transport
+    if transport == 'v2':
         return _device_request_v2(payload)
-    if ENV.use_mqtt():
+    if transport == 'mqtt':
         return _mqtt_request(payload)
     return _device_request('POST', endpoint, payload)
 
 
-def _get(endpoint):
+def _get(endpoint, max_age=None):
     """Get info from the device Farmware API.
 
     Since the only available endpoint is 'bot/state',
@@ -128,24 +171,36 @@ def _get(endpoint):
 
     Args:
         endpoint (str): 'bot/state'
+        max_age (float, optional): MQTT only. Maximum age in seconds of
+            the cached status. Defaults to None (any age).
     Returns:
         requests response object
     """
-    if ENV.use_v2():
+    transport = ENV.capabilities.transport
+    if transport == 'v2':
         return _device_state_fetch_v2()
-    if ENV.use_mqtt():
-        return _mqtt_status()
+    if transport == 'mqtt':
+        return _mqtt_status(max_age)
     return _device_request('GET', endpoint)
 
 
-def get_bot_state():
-    """Get the device state."""
-    bot_state = _get('bot/state')
+def get_bot_state(max_age=None):
+    """Get the device state.
+
+    Args:
+        max_age (float, optional): When using MQTT, the state is read from
+            a mirror kept current by status messages. Request a fresh
+            status if the mirror is older than `max_age` seconds.
+            Defaults to None (any age).
+    """
+    bot_state = _get('bot/state', max_age)
     if bot_state is None:
         _error('Device info could not be retrieved.')
         _on_error()
         return {}
-    return bot_state if (ENV.use_v2() or ENV.use_mqtt()) else bot_state.json()
+    if ENV.capabilities.structured_responses:
+        return bot_state
+    return bot_state.json()
 
 
 def _send(function):
@@ -153,33 +208,350 @@ def _send(function):
     def wrapper(*args, **kwargs):
         'Send Celery Script to the device.'
         rpc_id = kwargs.pop('rpc_id', None)
+        asynchronous = kwargs.pop('asynchronous', False)
+        active_batch = getattr(BATCHES, 'active', None)
+        if active_batch is not None:
+            return active_batch.add(
+                function(*args, **kwargs), asynchronous,
+                rpc_id=rpc_id if isinstance(rpc_id, str) else None)
+        if asynchronous:
+            send = send_celery_script_async
+        else:
+            send = send_celery_script
         if not isinstance(rpc_id, str):
-            return send_celery_script(function(*args, **kwargs))
-        return send_celery_script(function(*args, **kwargs), rpc_id=rpc_id)
+            return send(function(*args, **kwargs))
+        return send(function(*args, **kwargs), rpc_id=rpc_id)
     return wrapper
 
 
-def send_celery_script(command, rpc_id=None):
-    """Send a Celery Script command."""
-    kind, args, body = _check_celery_script(command)
-    temp_no_rpc_kinds = ['read_pin', 'write_pin',
-                         'set_pin_io_mode', 'update_farmware']
-    no_rpc = kind in temp_no_rpc_kinds and not ENV.fbos_at_least(7, 0, 1)
-    if kind == 'rpc_request' or no_rpc:
-        rpc = command
-    else:
-        rpc = rpc_wrapper(command, rpc_id=rpc_id)
-    response = _post('celery_script', rpc)
+def _wrap_command(command, rpc_id=None):
+    'Check a command and wrap it in an `rpc_request` if required.'
+    kind, _args, _body = _check_celery_script(command)
+    if kind == 'rpc_request' or kind in ENV.capabilities.no_rpc_kinds:
+        return command
+    return rpc_wrapper(command, rpc_id=rpc_id)
+
+
+def _command_result(command, rpc, response):
+    'Assemble the result of sending a command.'
     if response is None:
-        print(COLOR.colorize_celery_script(kind, args, body))
+        print(COLOR.colorize_celery_script(
+            command['kind'], command['args'], command.get('body')))
     return {
         'command': command,
         'sent': rpc,
-        'response': response if (ENV.use_v2() or ENV.use_mqtt()) else {}
+        'response': response if ENV.capabilities.structured_responses else {}
     }
 
 
-def log(message, message_type='info', channels=None, rpc_id=None):
+def send_celery_script(command, rpc_id=None):
+    """Send a Celery Script command."""
+    rpc = _wrap_command(command, rpc_id=rpc_id)
+    response = _post('celery_script', rpc)
+    return _command_result(command, rpc, response)
+
+
+def set_in_flight_limit(limit):
+    """Set how many asynchronous commands may await a response at once.
+
+    Args:
+        limit (int): Maximum number of commands in flight.
+            Defaults to DEFAULT_IN_FLIGHT_LIMIT.
+    """
+    IN_FLIGHT['window'] = threading.BoundedSemaphore(limit)
+
+
+def send_celery_script_async(command, rpc_id=None):
+    """Send a Celery Script command without waiting for the response.
+
+    Blocks only while the in-flight window (see `set_in_flight_limit`)
+    is full. Pipelining requires the v2 Farmware API or MQTT; otherwise
+    the command is sent immediately and the returned future is done.
+
+    Returns:
+        Future resolving to the `send_celery_script` result.
+        The RPC label is available as `future.rpc_id`.
+    """
+    rpc = _wrap_command(command, rpc_id=rpc_id)
+    result = Future()
+    result.rpc_id = rpc.get('args', {}).get('label')
+    capabilities = ENV.capabilities
+    pipelined = capabilities.pipes if capabilities.v2 else capabilities.mqtt
+    if not pipelined or result.rpc_id is None:
+        response = _post('celery_script', rpc)
+        result.set_result(_command_result(command, rpc, response))
+        return result
+    window = IN_FLIGHT['window']
+    window.acquire()
+
+    def _resolve(response_future):
+        window.release()
+        _resolve_later(
+            result, _command_result(command, rpc, response_future.result()))
+    if capabilities.v2:
+        _response_expect(result.rpc_id).add_done_callback(_resolve)
+        _request_write(rpc)
+    else:
+        _mqtt_request_async(rpc).add_done_callback(_resolve)
+    return result
+
+
+def wait_all(futures, timeout=None):
+    """Wait for asynchronous commands to complete.
+
+    Args:
+        futures (list): Futures returned by asynchronous commands.
+        timeout (float, optional): Seconds to wait. Defaults to None.
+    Returns:
+        command results, in the same order as `futures`
+    """
+    futures = list(futures)
+    _wait(futures, timeout)
+    return [future.result(timeout=0) for future in futures]
+
+
+def as_completed(futures, timeout=None):
+    """Iterate over asynchronous command results as they complete.
+
+    Args:
+        futures (list): Futures returned by asynchronous commands.
+        timeout (float, optional): Seconds to wait. Defaults to None.
+    """
+    for future in _as_completed(futures, timeout):
+        yield future.result()
+
+
+class Batch():
+    '''Collect commands and send them in a single `rpc_request`.
+
+    Use `batch()`.
+    '''
+
+    def __init__(self, rpc_id=None):
+        self.rpc_id = rpc_id
+        self.commands = []
+        self.results = []
+        self.futures = []
+        self.outer = None
+
+    def __enter__(self):
+        self.outer = getattr(BATCHES, 'active', None)
+        BATCHES.active = self
+        return self
+
+    def add(self, command, asynchronous=False, rpc_id=None):
+        '''Add a command. Returns a result placeholder (or a future).
+
+        Raises:
+            ValueError: `rpc_id` differs from the batch `rpc_id`.
+        '''
+        if rpc_id is not None:
+            if self.rpc_id is None:
+                self.rpc_id = rpc_id
+            elif rpc_id != self.rpc_id:
+                raise ValueError('rpc_id `{}` does not match batch rpc_id '
+                                 '`{}`.'.format(rpc_id, self.rpc_id))
+        if _check_celery_script(command) is None:
+            return
+        if _wrap_command(command) is command:
+            # Sent as-is (not in an `rpc_request`), so send what came before.
+            self.send()
+            result = send_celery_script(command)
+            return self._result(result, asynchronous)
+        return self._collect(command, asynchronous)
+
+    def _collect(self, command, asynchronous):
+        result = {'command': command, 'sent': None, 'response': None}
+        self.commands.append(command)
+        self.results.append(result)
+        return self._result(result, asynchronous)
+
+    def _result(self, result, asynchronous):
+        if not asynchronous:
+            return result
+        future = Future()
+        if result['sent'] is None:
+            self.futures.append((future, result))
+        else:
+            future.set_result(result)
+        return future
+
+    def send(self):
+        '''Send the collected commands and fill in their results.'''
+        if len(self.commands) == 0:
+            return
+        label = self.rpc_id or str(uuid.uuid4())
+        rpc = _assemble('rpc_request', {'label': label}, self.commands)
+        response = _post('celery_script', rpc)
+        for command, result in zip(self.commands, self.results):
+            result.update(_command_result(command, rpc, response))
+        self._done()
+
+    def _done(self):
+        for future, result in self.futures:
+            future.set_result(result)
+        self._clear()
+
+    def _clear(self):
+        self.commands, self.results, self.futures = [], [], []
+        self.rpc_id = None
+
+    def __exit__(self, exception_type, *_args):
+        BATCHES.active = self.outer
+        if exception_type is None:
+            self.send()
+        else:
+            # Nothing is sent: cancel the futures of the collected commands.
+            for future, _ in self.futures:
+                future.cancel()
+            self._clear()
+
+
+def batch(rpc_id=None):
+    """Send the commands issued in a `with` block as one `rpc_request`.
+
+    Commands sent by this module's command functions (`write_pin`,
+    `move_absolute`, `send_message`, ...) in the current thread are
+    collected and sent in a single round trip when the block exits.
+    Each call returns a result placeholder that is filled in when the
+    batch is sent. Nothing is sent if the block raises an exception
+    (futures of asynchronous commands are cancelled).
+
+    Usage:
+        with device.batch():
+            for pin in [7, 8, 9, 10]:
+                device.write_pin(pin, 1, 0)
+                device.wait(5000)
+                device.write_pin(pin, 0, 0)
+
+    Args:
+        rpc_id (str, optional): `rpc_request` label. Defaults to a new UUID.
+    """
+    return Batch(rpc_id)
+
+
+class Recorder(Batch):
+    '''Record commands into a sequence that FarmBot OS runs by itself.
+
+    Use `record()`.
+    '''
+
+    def __init__(self, name, color='gray', run=True):
+        Batch.__init__(self)
+        self.name = name
+        self.color = color
+        self.run = run
+        self.sequence_id = None
+
+    def add(self, command, asynchronous=False, rpc_id=None):
+        '''Record a command. Returns a result placeholder (or a future).
+
+        Raises:
+            ValueError: `rpc_id` provided (recorded commands have none).
+        '''
+        if rpc_id is not None:
+            raise ValueError('rpc_id can not be used in a recording.')
+        if _check_celery_script(command) is None:
+            return
+        if command['kind'] not in SEQUENCE_KINDS:
+            _error('`{}` can not be recorded in a sequence.'.format(
+                command['kind']))
+            return
+        return self._collect(command, asynchronous)
+
+    def sequence(self):
+        '''Get the Web App sequence for the recorded commands.
+
+        The sequence name ends with a hash of its content, so an
+        identical recording can be found instead of being uploaded again.
+        '''
+        content = {'name': self.name, 'color': self.color,
+                   'body': self.commands}
+        digest = hashlib.sha1(json.dumps(
+            content, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+        content['name'] = '{} [{}]'.format(self.name, digest)
+        content['kind'] = 'sequence'
+        content['args'] = {
+            'locals': {'kind': 'scope_declaration', 'args': {}}}
+        return content
+
+    def upload(self):
+        '''Upload the recorded sequence unless it already exists.
+
+        Returns:
+            (sequence ID or None, whether the sequence was uploaded)
+        '''
+        from . import app
+        sequence = self.sequence()
+        name = sequence['name']
+        if name in SEQUENCE_IDS:
+            return SEQUENCE_IDS[name], False
+        existing = app.get('sequences')
+        if isinstance(existing, list):
+            for record in existing:
+                if record.get('name') == name:
+                    SEQUENCE_IDS[name] = record['id']
+                    return record['id'], False
+        response = app.post('sequences', payload=sequence)
+        try:
+            SEQUENCE_IDS[name] = response['id']
+        except (KeyError, TypeError):
+            return None, False
+        return response['id'], True
+
+    def send(self):
+        '''Upload (if required) and run the recorded sequence.
+
+        Without Web App access, the commands are sent as a batch instead.
+        '''
+        if len(self.commands) == 0:
+            return
+        self.sequence_id, uploaded = self.upload()
+        if self.sequence_id is None:
+            Batch.send(self)
+            return
+        if not self.run:
+            self._done()
+            return
+        with batch():
+            if uploaded:
+                sync()
+            execute_result = execute(self.sequence_id)
+        for result in self.results:
+            result['sent'] = execute_result['sent']
+            result['response'] = execute_result['response']
+        self._done()
+
+
+def record(name, color='gray', run=True):
+    """Record the commands issued in a `with` block as a sequence.
+
+    Commands sent by this module's command functions (`move_absolute`,
+    `Move`, `write_pin`, `wait`, ...) in the current thread are recorded
+    instead of being sent. When the block exits, the recording is
+    uploaded to the Web App as a sequence (only once per distinct
+    recording), synced and executed by FarmBot OS in one request.
+    Nothing is uploaded if the block raises an exception.
+
+    Usage:
+        with device.record('Water plants') as routine:
+            for x in range(0, 1000, 100):
+                device.move_absolute(device.assemble_coordinate(x, 0, 0))
+                device.write_pin(8, 1, 0)
+                device.wait(2000)
+                device.write_pin(8, 0, 0)
+        print(routine.sequence_id)
+
+    Args:
+        name (str): Sequence name (a content hash is appended).
+        color (str, optional): Sequence color. Defaults to 'gray'.
+        run (bool, optional): Execute the sequence. Defaults to True.
+    """
+    return Recorder(name, color, run)
+
+
+def log(message, message_type='info', channels=None, rpc_id=None,
+        asynchronous=False):
     """Send a send_message command to post a log to the Web App.
 
     Args:
@@ -188,8 +560,11 @@ def log(message, message_type='info', channels=None, rpc_id=None):
             Defaults to 'info'.
         channels (list, optional): Any of ALLOWED_MESSAGE_CHANNELS.
             Defaults to None.
+        asynchronous (bool, optional): Return a future instead of
+            waiting for the response. Defaults to False.
     """
-    return send_message(message, message_type, channels, rpc_id=rpc_id)
+    return send_message(message, message_type, channels, rpc_id=rpc_id,
+                        asynchronous=asynchronous)
 
 
 def _assemble(kind, args, body=None):
@@ -199,16 +574,41 @@ def _assemble(kind, args, body=None):
     return {'kind': kind, 'args': args, 'body': body}
 
 
+def _build(kind, args, body=None):
+    'Validate (see `set_validation_mode`) and assemble a command.'
+    validators = VALIDATION['validators']
+    if validators is not None:
+        invalid = validators[kind](args, body)
+        if invalid is not VALID:
+            _cs_error(kind, invalid)
+            _on_error()
+            return
+    return _assemble(kind, args, body)
+
+
+@contextmanager
+def _unbatched():
+    'Send commands right away, even in a `batch` or `record` block.'
+    active_batch = getattr(BATCHES, 'active', None)
+    BATCHES.active = None
+    try:
+        yield
+    finally:
+        BATCHES.active = active_batch
+
+
 def _error(error_text):
     if ENV.farmware_api_available():
-        log(error_text, 'error')
+        with _unbatched():
+            log(error_text, 'error')
     else:
         print(COLOR.error(error_text))
 
 
 def _cs_error(kind, arg):
     if ENV.farmware_api_available():
-        log('Invalid arg `{}` for `{}`'.format(arg, kind), 'error')
+        with _unbatched():
+            log('Invalid arg `{}` for `{}`'.format(arg, kind), 'error')
     else:
         print(COLOR.error('Invalid input `{arg}` in `{kind}`'.format(
             arg=arg, kind=kind)))
@@ -249,19 +649,6 @@ def _nothing():
     return {'kind': 'nothing', 'args': {}}
 
 
-def _check_coordinate(coordinate):
-    coordinate_ok = True
-    try:
-        coordinate_ok = coordinate['kind'] == 'coordinate'
-        coordinate_ok = sorted(coordinate['args'].keys()) == ['x', 'y', 'z']
-    except (KeyError, TypeError):
-        coordinate_ok = False
-    if not coordinate_ok:
-        _cs_error('coordinate', coordinate)
-        _on_error()
-    return coordinate_ok
-
-
 @_send
 def send_message(message, message_type, channels=None):
     """Send command: send_message.
@@ -273,19 +660,11 @@ def send_message(message, message_type, channels=None):
         channels (list, optional): Any of ALLOWED_MESSAGE_CHANNELS.
             Defaults to None.
     """
-    kind = 'send_message'
-    args_ok = _check_arg(kind, message_type, ALLOWED_MESSAGE_TYPES)
-    if channels is not None:
-        for channel in channels:
-            args_ok = _check_arg(kind, channel, ALLOWED_MESSAGE_CHANNELS)
-    if args_ok:
-        if channels is None:
-            return _assemble(
-                kind, {'message': message, 'message_type': message_type})
-        return _assemble(
-            kind,
-            args={'message': message, 'message_type': message_type},
-            body=[_assemble_channel(channel) for channel in channels])
+    args = {'message': message, 'message_type': message_type}
+    if channels is None:
+        return _build('send_message', args)
+    body = [_assemble_channel(channel) for channel in channels]
+    return _build('send_message', args, body)
 
 
 @_send
@@ -295,10 +674,7 @@ def calibrate(axis):
     Args:
         axis (str): One of ALLOWED_AXIS_VALUES.
     """
-    kind = 'calibrate'
-    args_ok = _check_arg(kind, axis, ALLOWED_AXIS_VALUES)
-    if args_ok:
-        return _assemble(kind, {'axis': axis})
+    return _build('calibrate', {'axis': axis})
 
 
 @_send
@@ -308,24 +684,19 @@ def check_updates(package):
     Args:
         package (str): One of ALLOWED_PACKAGES.
     """
-    kind = 'check_updates'
-    args_ok = _check_arg(kind, package, ALLOWED_PACKAGES)
-    if args_ok:
-        return _assemble(kind, {'package': package})
+    return _build('check_updates', {'package': package})
 
 
 @_send
 def emergency_lock():
     """Send command: emergency_lock."""
-    kind = 'emergency_lock'
-    return _assemble(kind, {})
+    return _build('emergency_lock', {})
 
 
 @_send
 def emergency_unlock():
     """Send command: emergency_unlock."""
-    kind = 'emergency_unlock'
-    return _assemble(kind, {})
+    return _build('emergency_unlock', {})
 
 
 @_send
@@ -336,9 +707,7 @@ def execute(sequence_id):
         sequence_id (int): Web App Sequence ID.
             Sequence must be synced to FarmBot OS before execution.
     """
-    kind = 'execute'
-    args = {'sequence_id': sequence_id}
-    return _assemble(kind, args)
+    return _build('execute', {'sequence_id': sequence_id})
 
 
 @_send
@@ -350,10 +719,9 @@ def execute_script(label, inputs=None):
         inputs (dict, optional): Farmware configs, i.e., {'input_0': 0}.
             Defaults to None.
     """
-    kind = 'execute_script'
     args = {'label': label}
     if inputs is None:
-        return _assemble(kind, args)
+        return _build('execute_script', args)
     farmware = label.replace(' ', '_').replace('-', '_').lower()
     body = []
     for key, value in inputs.items():
@@ -362,7 +730,7 @@ def execute_script(label, inputs=None):
         else:
             input_name = '{}_{}'.format(farmware, key)
         body.append(assemble_pair(input_name, str(value)))
-    return _assemble(kind, args, body)
+    return _build('execute_script', args, body)
 
 
 def _set_docstring_for_execute_script_alias(func):
@@ -383,10 +751,7 @@ def factory_reset(package):
     Args:
         package (str): One of ALLOWED_PACKAGES.
     """
-    kind = 'factory_reset'
-    args_ok = _check_arg(kind, package, ALLOWED_PACKAGES)
-    if args_ok:
-        return _assemble(kind, {'package': package})
+    return _build('factory_reset', {'package': package})
 
 
 @_send
@@ -396,10 +761,7 @@ def find_home(axis):
     Args:
         axis (str): One of ALLOWED_AXIS_VALUES.
     """
-    kind = 'find_home'
-    args_ok = _check_arg(kind, axis, ALLOWED_AXIS_VALUES)
-    if args_ok:
-        return _assemble(kind, {'axis': axis})
+    return _build('find_home', {'axis': axis})
 
 
 @_send
@@ -409,10 +771,7 @@ def home(axis):
     Args:
         axis (str): One of ALLOWED_AXIS_VALUES.
     """
-    kind = 'home'
-    args_ok = _check_arg(kind, axis, ALLOWED_AXIS_VALUES)
-    if args_ok:
-        return _assemble(kind, {'axis': axis})
+    return _build('home', {'axis': axis})
 
 
 @_send
@@ -422,15 +781,13 @@ def install_farmware(url):
     Args:
         url (str): URL for the Farmware's manifest.
     """
-    kind = 'install_farmware'
-    return _assemble(kind, {'url': url})
+    return _build('install_farmware', {'url': url})
 
 
 @_send
 def install_first_party_farmware():
     """Send command: install_first_party_farmware."""
-    kind = 'install_first_party_farmware'
-    return _assemble(kind, {})
+    return _build('install_first_party_farmware', {})
 
 
 @_send
@@ -445,16 +802,11 @@ def move_absolute(location, speed=100, offset=None):
         speed (int): Percent of max speed.
         offset (dict): Celery Script 'coordinate' node.
     """
-    kind = 'move_absolute'
-    args_ok = _check_coordinate(location)
     if offset is None:
         offset = assemble_coordinate(0, 0, 0)
-    args_ok = _check_coordinate(offset)
-    args_ok = _check_arg(kind, speed, range(1, 101))
-    if args_ok:
-        return _assemble(kind, {'location': location,
-                                'speed': speed,
-                                'offset': offset})
+    return _build('move_absolute', {'location': location,
+                                    'speed': speed,
+                                    'offset': offset})
 
 
 @_send
@@ -467,13 +819,7 @@ def move_relative(x=0, y=0, z=0, speed=100):
         z (int): Distance.
         speed (int): Percent of max speed.
     """
-    kind = 'move_relative'
-    args_ok = _check_arg(kind, speed, range(1, 101))
-    if args_ok:
-        return _assemble(kind, {'x': x,
-                                'y': y,
-                                'z': z,
-                                'speed': speed})
+    return _build('move_relative', {'x': x, 'y': y, 'z': z, 'speed': speed})
 
 
 class Move():
@@ -540,8 +886,7 @@ class Move():
 @_send
 def power_off():
     """Send command: power_off."""
-    kind = 'power_off'
-    return _assemble(kind, {})
+    return _build('power_off', {})
 
 
 @_send
@@ -553,29 +898,21 @@ def read_pin(pin_number, label, pin_mode):
         label (str): Any string.
         pin_mode (int): 0 (digital) or 1 (analog).
     """
-    kind = 'read_pin'
-    args_ok = _check_arg(kind, pin_number, range(0, 70))
-    args_ok = _check_arg(kind, pin_mode, [0, 1])
-    if args_ok:
-        return _assemble(kind, {'pin_number': pin_number,
-                                'label': label,
-                                'pin_mode': pin_mode})
+    return _build('read_pin', {'pin_number': pin_number,
+                               'label': label,
+                               'pin_mode': pin_mode})
 
 
 @_send
 def read_status():
     """Send command: read_status."""
-    kind = 'read_status'
-    return _assemble(kind, {})
+    return _build('read_status', {})
 
 
 @_send
 def reboot(package='farmbot_os'):
     """Send command: reboot."""
-    kind = 'reboot'
-    args_ok = _check_arg(kind, package, ALLOWED_PACKAGES)
-    if args_ok:
-        return _assemble(kind, {'package': package})
+    return _build('reboot', {'package': package})
 
 
 @_send
@@ -591,11 +928,8 @@ def register_gpio(sequence_id, pin_number):
             Sequence must be synced to FarmBot OS before registration.
         pin_number (int): Raspberry Pi GPIO BCM pin number.
     """
-    kind = 'register_gpio'
-    args_ok = _check_arg(kind, pin_number, range(1, 30))
-    if args_ok:
-        return _assemble(kind, {'sequence_id': sequence_id,
-                                'pin_number': pin_number})
+    return _build('register_gpio', {'sequence_id': sequence_id,
+                                    'pin_number': pin_number})
 
 
 @_send
@@ -605,8 +939,7 @@ def remove_farmware(package):
     Args:
         package (str): Name of the Farmware to uninstall.
     """
-    kind = 'remove_farmware'
-    return _assemble(kind, {'package': package})
+    return _build('remove_farmware', {'package': package})
 
 
 @_send
@@ -617,12 +950,8 @@ def set_pin_io_mode(pin_io_mode, pin_number):
         pin_io_mode (int): 0 (input), 1 (output), or 2 (input_pullup)
         pin_number (int): Arduino pin (0 through 69).
     """
-    kind = 'set_pin_io_mode'
-    args_ok = _check_arg(kind, pin_io_mode, [0, 1, 2])
-    args_ok = _check_arg(kind, pin_number, range(0, 70))
-    if args_ok:
-        return _assemble(kind, {'pin_io_mode': pin_io_mode,
-                                'pin_number': pin_number})
+    return _build('set_pin_io_mode', {'pin_io_mode': pin_io_mode,
+                                      'pin_number': pin_number})
 
 
 @_send
@@ -633,39 +962,89 @@ def set_servo_angle(pin_number, pin_value):
         pin_number (int): Arduino servo pin (4, 5, 6, or 11).
         pin_value (int): Servo angle (0 through 180).
     """
-    kind = 'set_servo_angle'
-    args_ok = _check_arg(kind, pin_number, [4, 5, 6, 11])
-    args_ok = _check_arg(kind, pin_value, range(0, 181))
-    if args_ok:
-        return _assemble(kind, {'pin_number': pin_number,
-                                'pin_value': pin_value})
+    return _build('set_servo_angle', {'pin_number': pin_number,
+                                      'pin_value': pin_value})
 
 
 @_send
-def set_user_env(key, value):
+def _set_user_env_pairs(pairs):
+    return _build('set_user_env', {}, pairs)
+
+
+def _remember_user_envs(pairs, result):
+    'Remember the values FarmBot OS confirmed setting (see `set_user_envs`).'
+    try:
+        confirmed = result['response']['kind'] == 'rpc_ok'
+    except (KeyError, TypeError):
+        return
+    if confirmed:
+        for pair in pairs:
+            USER_ENVS[pair['args']['label']] = pair['args']['value']
+
+
+def _send_user_envs(pairs, rpc_id=None, asynchronous=False):
+    result = _set_user_env_pairs(
+        pairs, rpc_id=rpc_id, asynchronous=asynchronous)
+    if not isinstance(result, Future):
+        _remember_user_envs(pairs, result)
+        return result
+    # Resolve only once the values are remembered.
+    remembered = Future()
+    remembered.rpc_id = getattr(result, 'rpc_id', None)
+
+    def _remember(future):
+        if future.cancelled():
+            remembered.cancel()
+            return
+        _remember_user_envs(pairs, future.result())
+        remembered.set_result(future.result())
+    result.add_done_callback(_remember)
+    return remembered
+
+
+def set_user_env(key, value, rpc_id=None, asynchronous=False):
     """Send command: set_user_env.
 
     Args:
         key (str): ENV key
         value (str): ENV value
     """
-    kind = 'set_user_env'
-    body = [assemble_pair(key, str(value))]
-    return _assemble(kind, {}, body)
+    return _send_user_envs(
+        [assemble_pair(key, str(value))], rpc_id, asynchronous)
+
+
+def set_user_envs(envs, rpc_id=None, asynchronous=False):
+    """Send command: set_user_env, with many key/value pairs at once.
+
+    Keys whose value is unchanged (from the environment, or from a
+    value FarmBot OS confirmed setting earlier in this process) are
+    skipped.
+
+    Args:
+        envs (dict): ENV keys and values, i.e., {'key': 'value'}.
+    Returns:
+        The command result, or None if every value is unchanged.
+    """
+    pairs = []
+    for key, value in envs.items():
+        value = str(value)
+        if USER_ENVS.get(key, os.environ.get(key)) != value:
+            pairs.append(assemble_pair(key, value))
+    if len(pairs) == 0:
+        return
+    return _send_user_envs(pairs, rpc_id, asynchronous)
 
 
 @_send
 def sync():
     """Send command: sync."""
-    kind = 'sync'
-    return _assemble(kind, {})
+    return _build('sync', {})
 
 
 @_send
 def take_photo():
     """Send command: take_photo."""
-    kind = 'take_photo'
-    return _assemble(kind, {})
+    return _build('take_photo', {})
 
 
 @_send
@@ -675,10 +1054,7 @@ def toggle_pin(pin_number):
     Args:
         pin_number (int): Arduino pin (0 through 69).
     """
-    kind = 'toggle_pin'
-    args_ok = _check_arg(kind, pin_number, range(0, 70))
-    if args_ok:
-        return _assemble(kind, {'pin_number': pin_number})
+    return _build('toggle_pin', {'pin_number': pin_number})
 
 
 @_send
@@ -691,10 +1067,7 @@ def unregister_gpio(pin_number):
     Args:
         pin_number (int): Arduino pin (0 through 69).
     """
-    kind = 'unregister_gpio'
-    args_ok = _check_arg(kind, pin_number, range(0, 70))
-    if args_ok:
-        return _assemble(kind, {'pin_number': pin_number})
+    return _build('unregister_gpio', {'pin_number': pin_number})
 
 
 @_send
@@ -704,8 +1077,7 @@ def update_farmware(package):
     Args:
         package (str): Name of the Farmware to update.
     """
-    kind = 'update_farmware'
-    return _assemble(kind, {'package': package})
+    return _build('update_farmware', {'package': package})
 
 
 @_send
@@ -715,8 +1087,7 @@ def wait(milliseconds):
     Args:
         milliseconds (int): Time to wait in milliseconds.
     """
-    kind = 'wait'
-    return _assemble(kind, {'milliseconds': milliseconds})
+    return _build('wait', {'milliseconds': milliseconds})
 
 
 @_send
@@ -728,11 +1099,7 @@ def write_pin(pin_number, pin_value, pin_mode):
         pin_value (int): Value to write to pin.
         pin_mode (int): 0 (digital) or 1 (analog).
     """
-    kind = 'write_pin'
-    args_ok = _check_arg(kind, pin_number, range(0, 70))
-    args_ok = _check_arg(kind, pin_mode, [0, 1])
-    if args_ok:
-        return _assemble(kind, {'pin_number': pin_number,
+    return _build('write_pin', {'pin_number': pin_number,
                                 'pin_value': pin_value,
                                 'pin_mode': pin_mode})
 
@@ -744,17 +1111,63 @@ def zero(axis):
     Args:
         axis (str): One of ALLOWED_AXIS_VALUES.
     """
-    kind = 'zero'
-    args_ok = _check_arg(kind, axis, ALLOWED_AXIS_VALUES)
-    if args_ok:
-        return _assemble(kind, {'axis': axis})
+    return _build('zero', {'axis': axis})
+
+
+def get_state_value(path, max_age=None, _get_bot_state=None):
+    """Get one value (or branch) of the device state.
+
+    With the v2 Farmware API, only the state files on `path` are read
+    (or, once the state directory is cached, only the changed ones).
+
+    Args:
+        path (str or list): Dotted path or list of keys,
+            i.e., 'location_data.position.x' or ['pins', 13, 'value'].
+        max_age (float, optional): See `get_bot_state`. Defaults to None.
+    Raises:
+        KeyError: The path is not present in the device state.
+    """
+    if isinstance(path, str):
+        keys = path.split('.')
+    else:
+        keys = [str(key) for key in path]
+    if _get_bot_state is None and ENV.use_v2() and ENV.bot_state_dir:
+        return _state_cache(ENV.bot_state_dir).get_path(keys)
+    if _get_bot_state is None:
+        value = get_bot_state(max_age=max_age)
+    else:
+        value = _get_bot_state()
+    try:
+        for key in keys:
+            value = value[key]
+    except TypeError:
+        raise KeyError(path)
+    return value
+
+
+def get_bot_state_view(max_age=None):
+    """Get a lazy, read-only mapping view of the device state.
+
+    With the v2 Farmware API, state directories are listed and value
+    files are read only when first accessed. Values are decoded into
+    numbers, booleans and None, i.e.,
+    `get_bot_state_view()['location_data']['position']['x'] == 0.0`.
+    Call `snapshot()` on the view (or a branch) for a frozen copy.
+
+    Args:
+        max_age (float, optional): See `get_bot_state`. Defaults to None.
+    """
+    if ENV.use_v2() and ENV.bot_state_dir:
+        return StateView(_DirectorySource(ENV.bot_state_dir))
+    return StateView(_DictSource(get_bot_state(max_age=max_age)))
 
 
-def get_current_position(axis='all', _get_bot_state=get_bot_state):
+def get_current_position(axis='all', _get_bot_state=None, max_age=None):
     """Get the current position.
 
     Args:
         axis (str, optional): One of ALLOWED_AXIS_VALUES. Defaults to 'all'.
+        max_age (float, optional): See `get_bot_state`. Defaults to None.
     Returns:
         'all': FarmBot position, i.e., {'x': 0.0, 'y': 0.0, 'z': 0.0}
         'x', 'y', or 'z': FarmBot axis position, i.e., 0.0
@@ -763,34 +1176,196 @@ def get_current_position(axis='all', _get_bot_state=get_bot_state):
     if args_ok:
         if axis in ['x', 'y', 'z']:
             try:
-                axis_val = _get_bot_state()['location_data']['position'][axis]
+                axis_val = get_state_value(
+                    ['location_data', 'position', axis], max_age,
+                    _get_bot_state)
             except KeyError:
                 _error('Position `{}` value unknown.'.format(axis))
             else:
                 return float(axis_val)
         else:
             try:
-                position = _get_bot_state()['location_data']['position']
+                position = get_state_value(
+                    ['location_data', 'position'], max_age, _get_bot_state)
             except KeyError:
                 _error('Position unknown.')
             else:
                 return {axis: float(value) for axis, value in position.items()}
 
 
-def get_pin_value(pin_number, _get_bot_state=get_bot_state):
+def get_pin_value(pin_number, _get_bot_state=None, max_age=None):
     """Get a value from a pin.
 
     Args:
         pin_number (int): Arduino pin (0 through 69).
+        max_age (float, optional): See `get_bot_state`. Defaults to None.
     """
     try:
-        value = _get_bot_state()['pins'][str(pin_number)]['value']
+        value = get_state_value(
+            ['pins', pin_number, 'value'], max_age, _get_bot_state)
     except KeyError:
         _error('Pin `{}` value unknown.'.format(pin_number))
     else:
         return value
 
 
+def _state_change_source():
+    'Get functions to read the device state and to wait for a change.'
+    if ENV.use_v2() and ENV.bot_state_dir:
+        cache = _state_cache(ENV.bot_state_dir)
+        return cache.get, cache.wait_for_change
+    session = _mqtt_session() if ENV.use_mqtt() else None
+    if session is not None:
+        seen = {'count': session.status_count}
+
+        def _wait_for_status(timeout):
+            session.wait_for_status(seen['count'], timeout)
+            seen['count'] = session.status_count
+        return _mqtt_status, _wait_for_status
+
+    def _sleep(timeout):
+        if timeout is None:
+            timeout = WATCH_POLL_INTERVAL_SECONDS
+        time.sleep(min(timeout, WATCH_POLL_INTERVAL_SECONDS))
+    return get_bot_state, _sleep
+
+
+def _flatten(value, path, values):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(child, '{}.{}'.format(path, key), values)
+    else:
+        values[path] = decode_value(value)
+
+
+def _watched_values(state, paths):
+    values = {}
+    for path in paths:
+        value = state
+        try:
+            for key in path.split('.'):
+                value = value[key]
+        except (KeyError, TypeError):
+            continue
+        _flatten(value, path, values)
+    return values
+
+
+def _watch(paths, timeout):
+    'Yield the watched values now and after each change.'
+    read, wait_for_change = _state_change_source()
+    deadline = None if timeout is None else time.time() + timeout
+    previous = None
+    while True:
+        values = _watched_values(read(), paths)
+        if values != previous:
+            yield values
+            previous = values
+        remaining = None if deadline is None else deadline - time.time()
+        if remaining is not None and remaining <= 0:
+            return
+        wait_for_change(remaining)
+
+
+def watch_state(paths=None, timeout=None, initial=False):
+    """Yield device state value changes as they happen.
+
+    Changes are detected by watching the state directory (v2 Farmware
+    API) or by status messages (MQTT) and by polling otherwise.
+
+    Args:
+        paths (list, optional): Dotted paths of state branches or values
+            to watch, i.e., ['location_data.position', 'pins.13'].
+            Defaults to WATCH_PATHS.
+        timeout (float, optional): Stop watching after `timeout` seconds.
+            Defaults to None (watch forever).
+        initial (bool, optional): Also yield the current values first.
+            Defaults to False.
+    Yields:
+        StateChange: (path, old, new) for each changed value, i.e.,
+            ('location_data.position.x', 0.0, 100.0). Values are decoded
+            (see `get_bot_state_view`). Removed values are None.
+    """
+    previous = None
+    for values in _watch(paths or WATCH_PATHS, timeout):
+        if previous is None and not initial:
+            previous = values
+            continue
+        previous = previous or {}
+        for path in sorted(set(previous) | set(values)):
+            old, new = previous.get(path), values.get(path)
+            if old != new or path not in previous:
+                yield StateChange(path, old, new)
+        previous = values
+
+
+def _wait_for(paths, done, timeout):
+    for values in _watch(paths, timeout):
+        if done(values):
+            return True
+    return False
+
+
+def wait_for_position(x=None, y=None, z=None, tolerance=1, timeout=None):
+    """Wait for FarmBot to reach a position.
+
+    Args:
+        x, y, z (float, optional): Target coordinates. Axes left as None
+            are not checked.
+        tolerance (float, optional): Allowed distance (mm) per axis.
+            Defaults to 1.
+        timeout (float, optional): Maximum time to wait in seconds.
+            Defaults to None (wait forever).
+    Returns:
+        True if the position was reached, False on timeout.
+    """
+    path = 'location_data.position'
+    target = {axis: value for axis, value in zip('xyz', [x, y, z])
+              if value is not None}
+
+    def _reached(values):
+        for axis, value in target.items():
+            position = values.get('{}.{}'.format(path, axis))
+            if not isinstance(position, (int, float)):
+                return False
+            if abs(position - value) > tolerance:
+                return False
+        return True
+    return _wait_for([path], _reached, timeout)
+
+
+def wait_for_pin(pin_number, predicate=bool, timeout=None):
+    """Wait for a pin value to satisfy a condition.
+
+    Args:
+        pin_number (int): Arduino pin (0 through 69).
+        predicate (function, optional): Called with the pin value.
+            Defaults to `bool` (wait for a non-zero value).
+        timeout (float, optional): Maximum time to wait in seconds.
+            Defaults to None (wait forever).
+    Returns:
+        True if the condition was met, False on timeout.
+    """
+    path = 'pins.{}.value'.format(pin_number)
+    return _wait_for(
+        [path], lambda values: path in values and predicate(values[path]),
+        timeout)
+
+
+def wait_until_idle(timeout=None):
+    """Wait until FarmBot is no longer busy.
+
+    Args:
+        timeout (float, optional): Maximum time to wait in seconds.
+            Defaults to None (wait forever).
+    Returns:
+        True if FarmBot is idle, False on timeout.
+    """
+    path = 'informational_settings.busy'
+    return _wait_for(
+        [path], lambda values: values.get(path) is False, timeout)
+
+
 if __name__ == '__main__':
     send_celery_script({'kind': 'read_status', 'args': {}})
     log('Hello World!')
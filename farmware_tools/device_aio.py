@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: Device (asyncio).
+
+Awaitable counterparts of the `device` commands, i.e.,
+`await device_aio.move_absolute(coordinate)`.
+
+With the v2 Farmware API, commands await the response futures of the
+shared response pipe listener, so any number of commands can await
+their responses concurrently. With MQTT, commands await the response
+futures of the persistent MQTT session. The legacy HTTP transport and
+state reads run the blocking `device` functions in the default
+executor.
+'''
+
+import asyncio
+from functools import wraps, partial
+from . import device
+from ._util import _request_write, _response_expect, _response_buffer
+from ._util import TIMEOUT_SECONDS, _mqtt_request_async
+from .env import Env
+
+ENV = Env()
+
+
+def _send_v2(rpc, timeout):
+    'Write a request and get the response buffer future for it.'
+    future = _response_expect(rpc['args']['label'], timeout)
+    _request_write(rpc)
+    return future
+
+
+async def _request_v2(rpc, timeout=TIMEOUT_SECONDS):
+    """Send an RPC over the v2 pipes and await its response.
+
+    FarmBot OS answers on a single response pipe connection, read by the
+    `_util` response buffer listener, so its response future is awaited.
+    Resolves to 'no response' after `timeout` seconds.
+    """
+    future = await _run_blocking(_send_v2, rpc, timeout)
+    try:
+        return await asyncio.wrap_future(future)
+    finally:
+        _response_buffer().discard(rpc['args']['label'])
+
+
+async def _run_blocking(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, partial(function, *args, **kwargs))
+
+
+async def send_celery_script(command, rpc_id=None):
+    """Send a Celery Script command."""
+    capabilities = ENV.capabilities
+    if capabilities.transport == 'http':
+        return await _run_blocking(device.send_celery_script, command, rpc_id)
+    rpc = device._wrap_command(command, rpc_id=rpc_id)
+    response = None
+    if capabilities.transport == 'mqtt':
+        response = await asyncio.wrap_future(_mqtt_request_async(rpc))
+    elif capabilities.pipes:
+        response = await _request_v2(rpc)
+    return device._command_result(command, rpc, response)
+
+
+async def get_bot_state(max_age=None):
+    """Get the device state. See `device.get_bot_state`."""
+    return await _run_blocking(device.get_bot_state, max_age=max_age)
+
+
+def _send(command):
+    build = command.__wrapped__
+
+    @wraps(build)
+    async def wrapper(*args, **kwargs):
+        'Send Celery Script to the device.'
+        rpc_id = kwargs.pop('rpc_id', None)
+        if not isinstance(rpc_id, str):
+            rpc_id = None
+        return await send_celery_script(build(*args, **kwargs), rpc_id=rpc_id)
+    return wrapper
+
+
+send_message = _send(device.send_message)
+calibrate = _send(device.calibrate)
+check_updates = _send(device.check_updates)
+emergency_lock = _send(device.emergency_lock)
+emergency_unlock = _send(device.emergency_unlock)
+execute = _send(device.execute)
+execute_script = _send(device.execute_script)
+factory_reset = _send(device.factory_reset)
+find_home = _send(device.find_home)
+home = _send(device.home)
+install_farmware = _send(device.install_farmware)
+install_first_party_farmware = _send(device.install_first_party_farmware)
+move_absolute = _send(device.move_absolute)
+move_relative = _send(device.move_relative)
+power_off = _send(device.power_off)
+read_pin = _send(device.read_pin)
+read_status = _send(device.read_status)
+reboot = _send(device.reboot)
+register_gpio = _send(device.register_gpio)
+remove_farmware = _send(device.remove_farmware)
+set_pin_io_mode = _send(device.set_pin_io_mode)
+set_servo_angle = _send(device.set_servo_angle)
+sync = _send(device.sync)
+take_photo = _send(device.take_photo)
+toggle_pin = _send(device.toggle_pin)
+unregister_gpio = _send(device.unregister_gpio)
+update_farmware = _send(device.update_farmware)
+wait = _send(device.wait)
+write_pin = _send(device.write_pin)
+zero = _send(device.zero)
+
+
+_set_user_env_pairs = _send(device._set_user_env_pairs)
+
+
+async def set_user_env(key, value, rpc_id=None):
+    """Send command: set_user_env. See `device.set_user_env`."""
+    pairs = [device.assemble_pair(key, str(value))]
+    result = await _set_user_env_pairs(pairs, rpc_id=rpc_id)
+    device._remember_user_envs(pairs, result)
+    return result
+
+
+async def log(message, message_type='info', channels=None, rpc_id=None):
+    """Send a send_message command to post a log to the Web App.
+
+    Args:
+        message (str): log message contents
+        message_type (str, optional): One of device.ALLOWED_MESSAGE_TYPES.
+            Defaults to 'info'.
+        channels (list, optional): Any of device.ALLOWED_MESSAGE_CHANNELS.
+            Defaults to None.
+    """
+    return await send_message(message, message_type, channels, rpc_id=rpc_id)
+
+
+async def run_farmware(label, inputs=None, rpc_id=None):
+    """Alias for `execute_script`"""
+    return await execute_script(label, inputs, rpc_id=rpc_id)
+
+
+async def get_state_value(path, max_age=None):
+    """Get one value of the device state. See `device.get_state_value`."""
+    return await _run_blocking(device.get_state_value, path, max_age)
+
+
+async def get_current_position(axis='all', max_age=None):
+    """Get the current position. See `device.get_current_position`."""
+    return await _run_blocking(
+        device.get_current_position, axis, max_age=max_age)
+
+
+async def get_pin_value(pin_number, max_age=None):
+    """Get a value from a pin. See `device.get_pin_value`."""
+    return await _run_blocking(
+        device.get_pin_value, pin_number, max_age=max_age)
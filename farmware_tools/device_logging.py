@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+'''Farmware Tools: buffered device logging (Python `logging` handler).'''
+
+from __future__ import print_function
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+FLUSH_INTERVAL_SECONDS = 0.5
+DEFAULT_BUDGET = 5
+MAX_PENDING = 1000
+IMMEDIATE_MESSAGE_TYPES = ['error', 'warn']
+LEVEL_MESSAGE_TYPES = [
+    (logging.ERROR, 'error'),
+    (logging.WARNING, 'warn'),
+    (logging.INFO, 'info'),
+    (logging.NOTSET, 'debug'),
+]
+
+
+class DeviceLogHandler(logging.Handler):
+    '''Send `logging` records to FarmBot OS as buffered device logs.
+
+    Identical messages are coalesced ("... [repeated 40 times]") and
+    each message type may send at most `budget` messages per second;
+    messages over budget are counted and reported once budget is
+    available. Buffered messages are sent together in one `rpc_request`
+    from a background thread every `interval` seconds. 'error' and
+    'warn' messages are never dropped and flush the buffer immediately.
+    Errors while sending are reported with `handleError`.
+
+    Usage:
+        logger = logging.getLogger('my_farmware')
+        logger.addHandler(DeviceLogHandler())
+        logger.setLevel(logging.INFO)
+        logger.info('hello')
+        logger.info('hello', extra={'message_type': 'success'})
+    '''
+
+    def __init__(self, level=logging.NOTSET, channels=None,
+                 budget=DEFAULT_BUDGET, interval=FLUSH_INTERVAL_SECONDS,
+                 _send=None):
+        logging.Handler.__init__(self, level)
+        self.channels = channels
+        self.budget = budget
+        self.interval = interval
+        self.pending = OrderedDict()
+        self.tokens = {}
+        self.refilled = {}
+        self.dropped = {}
+        self.buffer_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.flusher = None
+        self.closed = False
+        self._send_messages = _send or self._send_to_device
+
+    @staticmethod
+    def message_type(record):
+        '''Get the device message type for a log record.'''
+        message_type = getattr(record, 'message_type', None)
+        if message_type is not None:
+            return message_type
+        for level, level_message_type in LEVEL_MESSAGE_TYPES:
+            if record.levelno >= level:
+                return level_message_type
+        return 'debug'
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        message_type = self.message_type(record)
+        key = (message_type, message)
+        with self.buffer_lock:
+            if key in self.pending:
+                self.pending[key] += 1
+            elif (len(self.pending) < MAX_PENDING
+                  or message_type in IMMEDIATE_MESSAGE_TYPES):
+                self.pending[key] = 1
+            else:
+                self.dropped[message_type] = (
+                    self.dropped.get(message_type, 0) + 1)
+        if message_type in IMMEDIATE_MESSAGE_TYPES:
+            self._flush_safely(record)
+        else:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        if self.flusher is None and not self.closed:
+            with self.buffer_lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(
+                        target=self._flush_periodically, daemon=True)
+                    self.flusher.start()
+
+    def _flush_periodically(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self._flush_safely()
+
+    def _flush_safely(self, record=None):
+        '''Flush, reporting a failed send with `handleError`.'''
+        try:
+            self.flush()
+        except Exception:
+            self.handleError(record or logging.makeLogRecord(
+                {'msg': 'Could not send buffered device logs.'}))
+
+    def _take_token(self, message_type, now):
+        if message_type in IMMEDIATE_MESSAGE_TYPES:
+            return True
+        elapsed = now - self.refilled.get(message_type, now)
+        tokens = min(self.budget, self.tokens.get(
+            message_type, self.budget) + elapsed * self.budget)
+        self.refilled[message_type] = now
+        if tokens < 1:
+            self.tokens[message_type] = tokens
+            return False
+        self.tokens[message_type] = tokens - 1
+        return True
+
+    def _collect(self):
+        'Take the buffered messages that are within budget.'
+        now = time.time()
+        messages = []
+        with self.buffer_lock:
+            pending, self.pending = self.pending, OrderedDict()
+            for (message_type, message), count in pending.items():
+                if not self._take_token(message_type, now):
+                    self.dropped[message_type] = (
+                        self.dropped.get(message_type, 0) + count)
+                    continue
+                if count > 1:
+                    message = '{} [repeated {} times]'.format(message, count)
+                messages.append((message, message_type))
+            for message_type, count in list(self.dropped.items()):
+                if self._take_token(message_type, now):
+                    del self.dropped[message_type]
+                    messages.append((
+                        '{} `{}` messages dropped (rate limit)'.format(
+                            count, message_type), message_type))
+        return messages
+
+    def _send_to_device(self, messages):
+        from . import device
+        with device.batch():
+            for message, message_type in messages:
+                device.log(message, message_type, self.channels)
+
+    def flush(self):
+        '''Send the buffered messages now.'''
+        with self.send_lock:
+            messages = self._collect()
+            if len(messages) > 0:
+                self._send_messages(messages)
+
+    def close(self):
+        '''Send the buffered messages and stop the background thread.'''
+        self.closed = True
+        self.wake.set()
+        self._flush_safely()
+        logging.Handler.close(self)
+
+
+def get_logger(name='farmware', level=logging.INFO, **kwargs):
+    """Get a `logging` logger that sends buffered device logs.
+
+    Args:
+        name (str, optional): Logger name. Defaults to 'farmware'.
+        level (int, optional): Logger level. Defaults to logging.INFO.
+        **kwargs: DeviceLogHandler options (channels, budget, interval).
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(h, DeviceLogHandler) for h in logger.handlers):
+        logger.addHandler(DeviceLogHandler(**kwargs))
+    logger.setLevel(level)
+    return logger
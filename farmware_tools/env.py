@@ -5,6 +5,9 @@
 import os
 import json
 import base64
+import importlib.util
+from functools import lru_cache
+from collections import namedtuple
 
 # Farmware API ENV variables
 FARMWARE_API_PREFIX = 'FARMWARE_API_V2_'
@@ -24,17 +27,118 @@ TOKEN = os.getenv(FARMBOT_API_PREFIX + 'TOKEN')
 LEGACY_TOKEN = os.getenv('API_TOKEN')
 
 
+# Kinds FarmBot OS before v7.0.1 expects without an `rpc_request` wrapper
+LEGACY_NO_RPC_KINDS = frozenset([
+    'read_pin', 'write_pin', 'set_pin_io_mode', 'update_farmware'])
+
+Capabilities = namedtuple('Capabilities', [
+    'fbos_version',  # version parts tuple, i.e., (8, 0, 0)
+    'transport',  # 'v2' (Farmware API v2), 'mqtt', or 'http' (legacy)
+    'v2',  # FarmBot OS supports the v2 Farmware API
+    'mqtt',  # MQTT is available (paho installed and API token set)
+    'pipes',  # v2 Farmware API request and response pipes are set
+    'structured_responses',  # responses are dicts (v2 or MQTT)
+    'no_rpc_kinds',  # kinds sent without an `rpc_request` wrapper
+])
+
+
+def _decode_token(token):
+    'Decode an API token payload.'
+    if token is None:
+        return {}
+    encoded_payload = token.split('.')[1]
+    encoded_payload += '=' * (4 - len(encoded_payload) % 4)
+    json_payload = base64.b64decode(encoded_payload).decode('utf-8')
+    return json.loads(json_payload)
+
+
+@lru_cache(maxsize=None)
+def _mqtt_installed():
+    '''Determine if paho is installed.
+
+    Only the top-level `paho` package is looked up: finding `paho.mqtt`
+    would import `paho`.
+    '''
+    try:
+        return importlib.util.find_spec('paho') is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _profile_input(name, *derived):
+    'Env attribute that resets the capability profile and `derived` when set.'
+    attribute = '_' + name
+
+    def _get(self):
+        return getattr(self, attribute)
+
+    def _set(self, value):
+        setattr(self, attribute, value)
+        self._capabilities = None
+        for derived_attribute in derived:
+            setattr(self, derived_attribute, None)
+    return property(_get, _set)
+
+
 class Env(object):
     'Farmware environment variables.'
 
+    request_pipe = _profile_input('request_pipe')
+    response_pipe = _profile_input('response_pipe')
+    fbos_version = _profile_input('fbos_version')
+    token = _profile_input('token', '_decoded_token')
+
     def __init__(self):
+        self._capabilities = None
+        self._decoded_token = None
         self.request_pipe = REQUEST_PIPE
         self.response_pipe = RESPONSE_PIPE
         self.images_dir = IMAGES_DIR or LEGACY_IMAGES_DIR
         self.fbos_version = FBOS_VERSION
         self.bot_state_dir = BOT_STATE_DIR
         self.token = TOKEN or LEGACY_TOKEN
-        self.decoded_token = self.decode_token()
+
+    @property
+    def capabilities(self):
+        """Capability profile used to dispatch requests.
+
+        Computed once, and again only after one of the attributes it is
+        based on (pipes, FarmBot OS version, token) has been changed.
+        """
+        capabilities = self._capabilities
+        if capabilities is None:
+            capabilities = self._capabilities = self._profile()
+        return capabilities
+
+    def _profile(self):
+        version = tuple(self.get_version_parts(self.fbos_version))
+        v2 = version >= (8,)
+        mqtt = self.token is not None and _mqtt_installed()
+        return Capabilities(
+            fbos_version=version,
+            transport='v2' if v2 else ('mqtt' if mqtt else 'http'),
+            v2=v2,
+            mqtt=mqtt,
+            pipes=self.request_pipe is not None
+            and self.response_pipe is not None,
+            structured_responses=v2 or mqtt,
+            no_rpc_kinds=(frozenset() if version >= (7, 0, 1)
+                          else LEGACY_NO_RPC_KINDS))
+
+    @property
+    def decoded_token(self):
+        '''Decoded API token payload (dict).
+
+        Decoded on first use, and again after `token` has been changed.
+        May be set, i.e., to provide a token payload in tests.
+        '''
+        if self._decoded_token is None:
+            self._decoded_token = self.decode_token()
+        return self._decoded_token
+
+    @decoded_token.setter
+    def decoded_token(self, value):
+        self._decoded_token = value
 
     @staticmethod
     def get_version_parts(version_string):
@@ -44,41 +148,27 @@ class Env(object):
 
     def fbos_at_least(self, major, minor=None, patch=None):
         'Determine if the current FBOS version meets the version requirement.'
-        current_version = self.get_version_parts(self.fbos_version)
-        required_version = [int(p)
-                            for p in [major, minor, patch] if p is not None]
-        for part, required_version_part in enumerate(required_version):
-            if current_version[part] != required_version_part:
-                # Versions are not equal. Check if current meets requirement.
-                return current_version[part] > required_version_part
-            # Versions are equal so far.
-            if required_version_part == required_version[-1]:
-                # No more parts to compare. Versions are equal.
-                return True
+        required_version = tuple(
+            int(p) for p in [major, minor, patch] if p is not None)
+        current_version = self.capabilities.fbos_version
+        current_version += (0,) * (len(required_version) - len(current_version))
+        return current_version[:len(required_version)] >= required_version
 
     def use_v2(self):
         'Determine if the v2 API should be used.'
-        return self.fbos_at_least(8)
+        return self.capabilities.v2
 
     def farmware_api_available(self):
         'Determine if the Farmware API is available.'
-        if self.use_v2():
-            return self.request_pipe is not None and self.response_pipe is not None
+        capabilities = self.capabilities
+        if capabilities.v2:
+            return capabilities.pipes
         return os.getenv('FARMWARE_URL') is not None and self.token is not None
 
     def decode_token(self):
         'Decode API token.'
-        if self.token is None:
-            return {}
-        encoded_payload = self.token.split('.')[1]
-        encoded_payload += '=' * (4 - len(encoded_payload) % 4)
-        json_payload = base64.b64decode(encoded_payload).decode('utf-8')
-        return json.loads(json_payload)
+        return _decode_token(self.token)
 
     def use_mqtt(self):
         'Determine if MQTT should be used.'
-        try:
-            import paho.mqtt
-        except ImportError:
-            return False
-        return self.token is not None
+        return self.capabilities.mqtt
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: asyncio Web App requests'''
+
+from __future__ import print_function
+import time
+import asyncio
+from farmware_tools import app, app_aio
+from fake_web_app import FakeWebApp
+
+DELAY_SECONDS = 0.2
+DROPPED = []
+POINTS = []
+
+
+def _respond(request):
+    'Echo requests slowly. `chunked` responses use chunked encoding.'
+    if request.path.startswith('/api/dropped'):
+        DROPPED.append(request.method)
+        return None
+    time.sleep(DELAY_SECONDS)
+    if request.path.startswith('/api/missing'):
+        return 404, b'<h1>Not Found</h1>'
+    if request.path == '/api/points' and request.method == 'POST':
+        POINTS.append(request.payload)
+    data = {'method': request.method, 'path': request.path,
+            'payload': request.payload,
+            'token': request.headers['Authorization'],
+            'name': 'seq', 'id': 1}
+    if request.path.startswith('/api/chunked'):
+        return 200, data, {'Transfer-Encoding': 'chunked'}
+    return 200, data
+
+
+async def _test_requests(get_info):
+    result = await app_aio.get('tools', 5, get_info=get_info)
+    assert result['path'] == '/api/tools/5', result
+    assert result['token'] == 'Bearer token'
+    result = await app_aio.put('tools', 5, {'name': 'a'}, get_info=get_info)
+    assert (result['method'], result['payload']) == ('PUT', {'name': 'a'})
+    result = await app_aio.patch('tools', 5, {'name': 'b'}, True, get_info)
+    assert result['status_code'] == 200
+    assert result['json']['method'] == 'PATCH'
+    result = await app_aio.delete('tools', 5, get_info=get_info)
+    assert result['method'] == 'DELETE'
+    result = await app_aio.get_plants(get_info=get_info)
+    assert result['path'] == '/api/points/search'
+    assert result['payload'] == {'pointer_type': 'Plant'}
+    result = await app_aio.get('chunked', get_info=get_info)
+    assert result['path'] == '/api/chunked', result
+    assert await app_aio.get_property(
+        'sequences', 'name', 1, get_info=get_info) == 'seq'
+
+
+async def _test_errors(get_info):
+    result = await app_aio.get('missing', return_dict=True, get_info=get_info)
+    assert result == {'json': '"<h1>Not Found</h1>"', 'status_code': 404}
+
+    def _no_info():
+        raise KeyError('token')
+    assert await app_aio.get('tools', get_info=_no_info) == 'GET /api/tools '
+
+    def _no_server():
+        return {'token': 'token', 'url': 'http://127.0.0.1:1/api/'}
+    result = await app_aio.post(
+        'tools', {}, return_dict=True, get_info=_no_server)
+    assert result['status_code'] == 0, result
+
+
+async def _test_concurrent(web_app, get_info):
+    web_app.connections = 0
+    start = time.time()
+    results = await asyncio.gather(*[
+        app_aio.get('points', i, get_info=get_info) for i in range(20)])
+    duration = time.time() - start
+    print('20 concurrent requests: {:.2f} seconds, {} connections'.format(
+        duration, web_app.connections))
+    assert [r['path'] for r in results] == [
+        '/api/points/{}'.format(i) for i in range(20)]
+    assert duration < 20 * DELAY_SECONDS / 4
+    assert web_app.connections <= 10
+    await app_aio.get('points', get_info=get_info)
+    assert web_app.connections <= 10
+
+
+async def _test_bulk(get_info):
+    calls = []
+    results = await app_aio.add_plants(
+        [{'x': i, 'y': 0} for i in range(10)], get_info=get_info,
+        progress=lambda done, total: calls.append(done))
+    assert [r['json']['payload']['x'] for r in results] == list(range(10))
+    assert sorted(calls) == list(range(1, 11))
+    assert len(POINTS) == 10
+
+
+async def _test_cache(web_app, get_info):
+    app.enable_cache(ttl=60)
+    web_app.connections = 0
+    first = await app_aio.get('sensors', get_info=get_info)
+    start = time.time()
+    assert await app_aio.get('sensors', get_info=get_info) == first
+    assert app.get('sensors', get_info=get_info) == first
+    assert time.time() - start < DELAY_SECONDS
+    assert app.cache_stats()['hits'] == 2
+    app.disable_cache()
+
+
+async def _test_dropped(get_info):
+    await app_aio.get('points', get_info=get_info)
+    result = await app_aio.post(
+        'dropped', {}, return_dict=True, get_info=get_info)
+    assert result['status_code'] == 0, result
+    assert DROPPED == ['POST'], DROPPED
+    await app_aio.get('points', get_info=get_info)
+    result = await app_aio.get('dropped', return_dict=True, get_info=get_info)
+    assert result['status_code'] == 0, result
+    assert DROPPED == ['POST', 'GET', 'GET'], DROPPED
+    await app_aio.get('points', get_info=get_info)
+    return [connection[1] for connections in app_aio.POOL.idle.values()
+            for connection in connections]
+
+
+async def _test_reset(get_info, writers):
+    assert writers
+    await app_aio.get('points', get_info=get_info)
+    assert all(writer.is_closing() for writer in writers)
+
+
+def run_tests():
+    'Run asyncio Web App request tests.'
+    web_app = FakeWebApp(_respond).start()
+    get_info = web_app.get_info()
+    asyncio.run(_test_requests(get_info))
+    asyncio.run(_test_errors(get_info))
+    asyncio.run(_test_concurrent(web_app, get_info))
+    asyncio.run(_test_bulk(get_info))
+    asyncio.run(_test_cache(web_app, get_info))
+    writers = asyncio.run(_test_dropped(get_info))
+    asyncio.run(_test_reset(get_info, writers))
+
+
+if __name__ == '__main__':
+    run_tests()
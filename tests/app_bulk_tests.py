@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: concurrent Web App bulk requests'''
+
+from __future__ import print_function
+import time
+import threading
+from farmware_tools import app
+from fake_web_app import FakeWebApp
+
+DELAY_SECONDS = 0.05
+POINTS = {}
+ACTIVE = {'now': 0, 'max': 0}
+LOCK = threading.Lock()
+
+
+def _slowly(action):
+    with LOCK:
+        ACTIVE['now'] += 1
+        ACTIVE['max'] = max(ACTIVE['max'], ACTIVE['now'])
+    time.sleep(DELAY_SECONDS)
+    try:
+        with LOCK:
+            return action()
+    finally:
+        with LOCK:
+            ACTIVE['now'] -= 1
+
+
+def _respond(request):
+    'Create and delete points slowly. Points with x < 0 are invalid.'
+    if request.method == 'POST':
+        point = request.payload
+
+        def _create():
+            if point['x'] < 0:
+                return 422, {'x': 'must be positive'}
+            point['id'] = len(POINTS) + 1
+            POINTS[point['id']] = point
+            return 200, point
+        return _slowly(_create)
+    _id = int(request.path.split('/')[-1])
+
+    def _delete():
+        if POINTS.pop(_id, None) is None:
+            return 404, {'error': 'not found'}
+        return 200, {}
+    return _slowly(_delete)
+
+
+def _test_add_plants(get_info):
+    plants = [{'x': i, 'y': 0, 'name': 'Plant {}'.format(i), 'radius': None}
+              for i in range(100)]
+    calls = []
+    start = time.time()
+    results = app.add_plants(
+        plants, workers=8, progress=lambda done, total: calls.append(
+            (done, total)), get_info=get_info)
+    duration = time.time() - start
+    print('100 plants added in {:.2f} seconds'.format(duration))
+    assert duration < 100 * DELAY_SECONDS / 2
+    assert 1 < ACTIVE['max'] <= 8, ACTIVE
+    assert [r['status_code'] for r in results] == [200] * 100
+    assert [r['json']['x'] for r in results] == list(range(100))
+    assert all(r['json']['pointer_type'] == 'Plant' for r in results)
+    assert 'radius' not in results[0]['json']
+    assert calls == [(done, 100) for done in range(1, 101)], calls
+
+
+def _test_errors(get_info):
+    results = app.bulk('POST', 'points', [{'x': 1}, {'x': -1}, {'x': 2}],
+                       get_info=get_info)
+    assert [r['status_code'] for r in results] == [200, 422, 200], results
+    assert results[1]['json'] == {'x': 'must be positive'}
+    assert app.bulk('POST', 'points', [], get_info=get_info) == []
+
+
+def _test_delete_points(get_info):
+    ids = sorted(POINTS)
+    results = app.delete_points(ids + [9999], get_info=get_info)
+    assert [r['status_code'] for r in results] == [200] * len(ids) + [404]
+    assert POINTS == {}
+
+
+def run_tests():
+    'Run bulk request tests.'
+    get_info = FakeWebApp(_respond).start().get_info()
+    _test_add_plants(get_info)
+    _test_errors(get_info)
+    _test_delete_points(get_info)
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: Web App response cache'''
+
+from __future__ import print_function
+from farmware_tools import app
+from fake_web_app import FakeWebApp
+
+ETAG = '"v1"'
+
+
+def _respond(request):
+    'Answer with the request path as JSON and honor If-None-Match.'
+    if request.headers.get('If-None-Match') == ETAG:
+        return 304, None, {'ETag': ETAG}
+    return 200, [{'id': 1, 'name': request.path}], {'ETag': ETAG}
+
+
+def _test_disabled(web_app, get_info):
+    app.disable_cache()
+    del web_app.requests[:]
+    app.get('tools', get_info=get_info)
+    app.get('tools', get_info=get_info)
+    assert len(web_app.requests) == 2
+    assert app.cache_stats() is None
+
+
+def _test_hits(web_app, get_info):
+    app.enable_cache(ttl=60)
+    del web_app.requests[:]
+    first = app.get('tools', get_info=get_info)
+    first.append('changed by caller')
+    second = app.get('tools', get_info=get_info)
+    assert second == [{'id': 1, 'name': '/api/tools'}], second
+    assert app.get('tools', 1, get_info=get_info) == [
+        {'id': 1, 'name': '/api/tools/1'}]
+    assert app.get('tools', return_dict=True, get_info=get_info) == {
+        'json': [{'id': 1, 'name': '/api/tools'}], 'status_code': 200}
+    assert len(web_app.requests) == 2, web_app.requests
+    stats = app.cache_stats()
+    assert stats['hits'] == 2 and stats['misses'] == 2, stats
+
+
+def _test_searches(web_app, get_info):
+    app.enable_cache(ttl=60)
+    del web_app.requests[:]
+    app.search_points({'pointer_type': 'Plant'}, get_info=get_info)
+    app.search_points({'pointer_type': 'Plant'}, get_info=get_info)
+    app.search_points({'pointer_type': 'Weed'}, get_info=get_info)
+    assert len(web_app.requests) == 2, web_app.requests
+    app.post('points', {'x': 1}, get_info=get_info)
+    app.search_points({'pointer_type': 'Plant'}, get_info=get_info)
+    assert len(web_app.requests) == 4, web_app.requests
+    assert app.cache_stats()['invalidations'] == 2
+
+
+def _test_revalidation(web_app, get_info):
+    app.enable_cache(ttl=60, ttls={'sequences': 0})
+    del web_app.requests[:]
+    assert app.find_sequence_by_name(
+        '/api/sequences', get_info=get_info) == 1
+    assert app.get('sequences', get_info=get_info) == [
+        {'id': 1, 'name': '/api/sequences'}]
+    assert len(web_app.requests) == 2, web_app.requests
+    stats = app.cache_stats()
+    assert stats['revalidated'] == 1 and stats['hits'] == 0, stats
+
+
+def _test_eviction(web_app, get_info):
+    app.enable_cache(ttl=60, max_entries=2)
+    del web_app.requests[:]
+    for endpoint in ['tools', 'sensors', 'tools', 'device', 'tools']:
+        app.get(endpoint, get_info=get_info)
+    assert len(web_app.requests) == 3, web_app.requests
+    stats = app.cache_stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 2, stats
+    app.disable_cache()
+
+
+def _test_accounts(web_app, get_info):
+    app.enable_cache(ttl=60)
+    del web_app.requests[:]
+
+    def _other_account():
+        return dict(get_info(), token='other token')
+    app.get('device', get_info=get_info)
+    app.get('device', get_info=_other_account)
+    app.get('device', get_info=get_info)
+    assert len(web_app.requests) == 2, web_app.requests
+    app.disable_cache()
+
+
+def _test_in_flight_invalidation(get_info):
+    cache = app._ResponseCache()
+    key = cache.key(get_info(), 'GET', 'points', None)
+    generation = cache.generation('points')
+    cache.invalidate('points/5')
+    cache.store(key, [], {}, generation)
+    assert cache.stats()['entries'] == 0
+    cache.store(key, [], {}, cache.generation('points'))
+    assert cache.stats()['entries'] == 1
+
+
+def run_tests():
+    'Run Web App response cache tests.'
+    web_app = FakeWebApp(_respond).start()
+    get_info = web_app.get_info()
+    _test_disabled(web_app, get_info)
+    _test_hits(web_app, get_info)
+    _test_searches(web_app, get_info)
+    _test_revalidation(web_app, get_info)
+    _test_eviction(web_app, get_info)
+    _test_accounts(web_app, get_info)
+    _test_in_flight_invalidation(get_info)
+
+
+if __name__ == '__main__':
+    run_tests()
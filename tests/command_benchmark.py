@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Benchmark: command construction throughput'''
+
+from __future__ import print_function
+import timeit
+from farmware_tools import device
+
+NUMBER = 20000
+COORDINATE = device.assemble_coordinate(1, 2, 3)
+COMMANDS = [
+    ('write_pin', lambda: device.write_pin.__wrapped__(13, 1, 0)),
+    ('move_absolute',
+     lambda: device.move_absolute.__wrapped__(COORDINATE, 100, COORDINATE)),
+    ('send_message', lambda: device.send_message.__wrapped__(
+        'hello', 'info', ['toast'])),
+]
+
+
+def run_benchmark():
+    'Measure how many commands can be built per second in each mode.'
+    for mode in device.VALIDATION_MODES:
+        device.set_validation_mode(mode)
+        for name, build in COMMANDS:
+            assert build() is not None
+            elapsed = min(timeit.repeat(build, number=NUMBER, repeat=3))
+            print('{:<8} {:<14} {:>10,.0f} commands/s'.format(
+                mode, name, NUMBER / elapsed))
+    device.set_validation_mode('default')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: asyncio device commands'''
+
+from __future__ import print_function
+import time
+import asyncio
+from farmware_tools import device_aio
+from fake_fbos import FakeFarmBotOS
+
+
+async def _test_concurrent_commands(fbos):
+    start = time.time()
+    results = await asyncio.gather(
+        device_aio.log('hi'),
+        device_aio.write_pin(13, 1, 0),
+        device_aio.move_relative(x=10),
+        device_aio.set_user_env('key', 'value', rpc_id='custom'),
+        device_aio.send_celery_script({'kind': 'sync', 'args': {}}),
+        device_aio._run_blocking(device_aio.device.read_status))
+    elapsed = time.time() - start
+    print('6 concurrent commands completed in {:.2f}s'.format(elapsed))
+    assert elapsed < 2 * fbos.delay
+    for result in results:
+        assert result['response']['kind'] == 'rpc_ok'
+        assert result['response']['args'] == result['sent']['args']
+    assert results[3]['sent']['args']['label'] == 'custom'
+    assert sorted(fbos.sent_kinds()) == sorted([
+        'send_message', 'write_pin', 'move_relative', 'set_user_env', 'sync',
+        'read_status'])
+
+
+async def _test_no_response(fbos):
+    fbos.respond = False
+    result = await device_aio._request_v2(
+        device_aio.device.rpc_wrapper({'kind': 'sync', 'args': {}}),
+        timeout=0.1)
+    assert result == 'no response'
+    assert device_aio._response_buffer().stats()['waiting'] == 0
+    fbos.respond = True
+
+
+def _test_without_farmware_api():
+    result = asyncio.run(device_aio.sync())
+    assert result['command'] == {'kind': 'sync', 'args': {}}
+
+
+def run_tests():
+    'Run asyncio device command tests.'
+    _test_without_farmware_api()
+    fbos = FakeFarmBotOS(delay=0.2).start()
+    asyncio.run(_test_concurrent_commands(fbos))
+    asyncio.run(_test_no_response(fbos))
+
+
+if __name__ == '__main__':
+    run_tests()
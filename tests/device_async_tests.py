@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: asynchronous device commands'''
+
+from __future__ import print_function
+import time
+import threading
+from concurrent.futures import Future
+from farmware_tools import device
+from fake_fbos import FakeFarmBotOS
+
+
+def _test_without_farmware_api():
+    future = device.send_celery_script_async({'kind': 'sync', 'args': {}})
+    assert isinstance(future, Future)
+    assert future.done()
+    assert future.result()['command'] == {'kind': 'sync', 'args': {}}
+
+
+def _test_pipelined(fbos):
+    start = time.time()
+    futures = [device.write_pin(13, 1, 0, asynchronous=True)
+               for _ in range(8)]
+    assert time.time() - start < fbos.delay
+    results = device.wait_all(futures)
+    elapsed = time.time() - start
+    print('8 pipelined commands completed in {:.2f}s'.format(elapsed))
+    assert elapsed < 8 * fbos.delay
+    for future, result in zip(futures, results):
+        assert result['response']['kind'] == 'rpc_ok'
+        assert result['response']['args']['label'] == future.rpc_id
+        assert result['sent']['args']['label'] == future.rpc_id
+
+
+def _test_as_completed():
+    futures = [device.log('message {}'.format(i), asynchronous=True)
+               for i in range(3)]
+    results = list(device.as_completed(futures))
+    labels = sorted(result['sent']['args']['label'] for result in results)
+    assert labels == sorted(future.rpc_id for future in futures)
+
+
+def _test_in_flight_window(fbos):
+    device.set_in_flight_limit(2)
+    start = time.time()
+    futures = [device.send_celery_script_async({'kind': 'sync', 'args': {}})
+               for _ in range(3)]
+    assert time.time() - start >= fbos.delay
+    device.wait_all(futures)
+    device.set_in_flight_limit(device.DEFAULT_IN_FLIGHT_LIMIT)
+
+
+def _test_command_from_callback(fbos):
+    inner = []
+    done = threading.Event()
+
+    def _callback(_future):
+        inner.append(device.read_status())
+        done.set()
+    start = time.time()
+    future = device.send_celery_script_async({'kind': 'sync', 'args': {}})
+    future.add_done_callback(_callback)
+    assert done.wait(5)
+    elapsed = time.time() - start
+    print('command sent from a done-callback in {:.2f}s'.format(elapsed))
+    assert inner[0]['response']['kind'] == 'rpc_ok', inner
+    assert elapsed < 4 * fbos.delay
+
+
+def run_tests():
+    'Run asynchronous device command tests.'
+    _test_without_farmware_api()
+    fbos = FakeFarmBotOS(delay=0.2).start()
+    _test_pipelined(fbos)
+    _test_as_completed()
+    _test_in_flight_window(fbos)
+    _test_command_from_callback(fbos)
+
+
+if __name__ == '__main__':
+    run_tests()
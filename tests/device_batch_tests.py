@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: batched device commands'''
+
+from __future__ import print_function
+import time
+from farmware_tools import device
+from fake_fbos import FakeFarmBotOS
+
+
+def _test_one_round_trip(fbos):
+    start = time.time()
+    with device.batch() as commands:
+        results = []
+        for step in range(25):
+            results.append(device.write_pin(step % 10, 1, 0))
+            results.append(device.wait(100))
+        assert results[0]['sent'] is None
+    elapsed = time.time() - start
+    print('50 batched commands completed in {:.2f}s'.format(elapsed))
+    assert elapsed < 3 * fbos.delay
+    assert len(fbos.requests) == 1
+    assert fbos.sent_kinds() == ['write_pin', 'wait'] * 25
+    label = fbos.requests[0]['args']['label']
+    for result in results:
+        assert result['sent']['args']['label'] == label
+        assert result['response'] == {'kind': 'rpc_ok',
+                                      'args': {'label': label}}
+    assert results[1]['command'] == {'kind': 'wait',
+                                     'args': {'milliseconds': 100}}
+    assert len(commands.commands) == 0
+
+
+def _test_asynchronous(fbos):
+    with device.batch(rpc_id='batch'):
+        future = device.log('batched', asynchronous=True)
+        assert not future.done()
+    assert future.result(0)['response']['args']['label'] == 'batch'
+    assert fbos.requests[-1]['body'][0]['kind'] == 'send_message'
+
+
+def _test_exception(fbos):
+    count = len(fbos.requests)
+    try:
+        with device.batch():
+            device.sync()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert len(fbos.requests) == count
+    assert device.sync()['response']['kind'] == 'rpc_ok'
+    assert len(fbos.requests) == count + 1
+    try:
+        with device.batch():
+            future = device.sync(asynchronous=True)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert future.cancelled()
+
+
+def _test_rpc_id(fbos):
+    with device.batch():
+        device.sync(rpc_id='given')
+        device.wait(10)
+    assert fbos.requests[-1]['args']['label'] == 'given'
+    try:
+        with device.batch(rpc_id='batch'):
+            device.sync(rpc_id='other')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('rpc_id mismatch not rejected')
+
+
+def _test_error_in_batch(fbos):
+    count = len(fbos.requests)
+    try:
+        with device.batch():
+            device.sync()
+            device.write_pin(100, 1, 0)
+    except SystemExit:
+        pass
+    assert len(fbos.requests) == count + 1
+    error_log = fbos.requests[-1]['body'][0]
+    assert error_log['kind'] == 'send_message'
+    assert error_log['args']['message_type'] == 'error'
+
+
+def run_tests():
+    'Run batched device command tests.'
+    fbos = FakeFarmBotOS(delay=0.1).start()
+    _test_one_round_trip(fbos)
+    _test_asynchronous(fbos)
+    _test_exception(fbos)
+    _test_rpc_id(fbos)
+    _test_error_in_batch(fbos)
+
+
+if __name__ == '__main__':
+    run_tests()
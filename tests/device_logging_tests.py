@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: buffered device logging'''
+
+from __future__ import print_function
+import time
+import logging
+from farmware_tools import device_logging
+from fake_fbos import FakeFarmBotOS
+
+
+class Sent(object):
+    'Record the message batches sent by a handler.'
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, messages):
+        self.batches.append(messages)
+
+    def messages(self):
+        'All sent messages.'
+        return [message for batch in self.batches for message in batch]
+
+
+def _logger(name, **kwargs):
+    sent = Sent()
+    handler = device_logging.DeviceLogHandler(_send=sent, **kwargs)
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger, handler, sent
+
+
+def _test_coalesce():
+    logger, handler, sent = _logger('coalesce', interval=60)
+    for _ in range(40):
+        logger.info('x')
+    logger.debug('y')
+    logger.info('done', extra={'message_type': 'success'})
+    assert sent.batches == []
+    handler.flush()
+    assert sent.batches == [[('x [repeated 40 times]', 'info'),
+                             ('y', 'debug'), ('done', 'success')]]
+    print('coalesced: {}'.format(sent.batches[0][0][0]))
+
+
+def _test_immediate():
+    logger, _handler, sent = _logger('immediate', interval=60)
+    logger.info('before')
+    logger.warning('careful')
+    assert sent.batches == [[('before', 'info'), ('careful', 'warn')]]
+    logger.error('failed')
+    assert sent.batches[-1] == [('failed', 'error')]
+
+
+def _test_budget():
+    logger, handler, sent = _logger('budget', budget=3, interval=60)
+    for i in range(10):
+        logger.info('message {}'.format(i))
+    handler.flush()
+    assert sent.messages() == [
+        ('message {}'.format(i), 'info') for i in range(3)]
+    time.sleep(0.4)
+    handler.flush()
+    assert sent.messages()[-1] == (
+        '7 `info` messages dropped (rate limit)', 'info')
+    for _ in range(5):
+        logger.error('always sent')
+    assert sent.messages()[-5:] == [('always sent', 'error')] * 5
+
+
+def _test_background_flush():
+    logger, handler, sent = _logger('background', interval=0.05)
+    start = time.time()
+    logger.info('async')
+    assert time.time() - start < 0.05
+    time.sleep(0.2)
+    assert sent.messages() == [('async', 'info')]
+    handler.close()
+
+
+def _test_send_error():
+    logger, handler, sent = _logger('send_error', interval=0.05)
+    errors = []
+    handler.handleError = errors.append
+
+    def _send(messages):
+        if len(errors) == 0:
+            raise OSError('pipe closed')
+        sent(messages)
+    handler._send_messages = _send
+    logger.info('a')
+    time.sleep(0.2)
+    logger.info('b')
+    time.sleep(0.2)
+    assert len(errors) == 1, errors
+    assert sent.messages() == [('b', 'info')], sent.messages()
+    assert handler.flusher.is_alive()
+    logger.error('c')
+    assert sent.messages()[-1] == ('c', 'error')
+    handler.close()
+
+
+def _test_cap():
+    logger, handler, sent = _logger('cap', interval=60)
+    for i in range(device_logging.MAX_PENDING + 5):
+        logger.info('message {}'.format(i))
+    logger.warning('careful')
+    assert ('careful', 'warn') in sent.messages()
+    assert 'warn' not in handler.dropped
+    handler.close()
+
+
+def _test_one_request_per_flush():
+    fbos = FakeFarmBotOS().start()
+    handler = device_logging.DeviceLogHandler(interval=60)
+    logger = logging.getLogger('device')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for i in range(4):
+        logger.info('step {}'.format(i))
+    handler.flush()
+    assert len(fbos.requests) == 1
+    assert fbos.sent_kinds() == ['send_message'] * 4
+    handler.close()
+
+
+def run_tests():
+    'Run buffered device logging tests.'
+    _test_coalesce()
+    _test_immediate()
+    _test_budget()
+    _test_background_flush()
+    _test_send_error()
+    _test_cap()
+    _test_one_request_per_flush()
+
+
+if __name__ == '__main__':
+    run_tests()
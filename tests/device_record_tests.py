@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: recording device commands as a sequence'''
+
+from __future__ import print_function
+from farmware_tools import app, device
+from fake_fbos import FakeFarmBotOS
+
+
+class FakeWebApp(object):
+    'Stand-in for the Web App sequences endpoint.'
+
+    def __init__(self):
+        self.sequences = []
+        self.gets = 0
+        self.available = True
+
+    def get(self, endpoint):
+        'Get all sequences.'
+        assert endpoint == 'sequences'
+        self.gets += 1
+        return list(self.sequences)
+
+    def post(self, endpoint, payload):
+        'Create a sequence.'
+        assert endpoint == 'sequences'
+        if not self.available:
+            return 'POST /api/sequences'
+        sequence = dict(payload, id=len(self.sequences) + 1)
+        self.sequences.append(sequence)
+        return sequence
+
+
+def _routine():
+    with device.Move() as move:
+        move.set_position('x', 100)
+        move.add_offset('z', -10)
+    device.wait(500)
+    return device.write_pin(8, 1, 0)
+
+
+def _test_upload_and_run(fbos, web_app):
+    with device.record('Water') as routine:
+        result = _routine()
+        device.set_user_env('not', 'recorded')
+    [sequence] = web_app.sequences
+    assert [step['kind'] for step in sequence['body']] == [
+        'move', 'wait', 'write_pin']
+    assert sequence['name'].startswith('Water [')
+    assert routine.sequence_id == sequence['id']
+    assert fbos.sent_kinds()[-2:] == ['sync', 'execute']
+    assert fbos.requests[-1]['body'][1]['args']['sequence_id'] == 1
+    assert result['response']['kind'] == 'rpc_ok'
+    print('recorded sequence: {}'.format(sequence['name']))
+
+
+def _test_cached(fbos, web_app):
+    count = len(fbos.requests)
+    gets = web_app.gets
+    with device.record('Water'):
+        _routine()
+    assert len(web_app.sequences) == 1
+    assert web_app.gets == gets
+    assert fbos.sent_kinds()[-1] == 'execute'
+    assert len(fbos.requests) == count + 1
+
+    device.SEQUENCE_IDS.clear()
+    with device.record('Water', run=False) as routine:
+        _routine()
+    assert len(web_app.sequences) == 1
+    assert web_app.gets == gets + 1
+    assert routine.sequence_id == 1
+    assert len(fbos.requests) == count + 1
+
+
+def _test_without_web_app(fbos, web_app):
+    web_app.available = False
+    with device.record('Offline') as routine:
+        _routine()
+    assert routine.sequence_id is None
+    assert fbos.sent_kinds()[-3:] == ['move', 'wait', 'write_pin']
+
+
+def run_tests():
+    'Run sequence recording tests.'
+    fbos = FakeFarmBotOS().start()
+    web_app = FakeWebApp()
+    app.get, app.post = web_app.get, web_app.post
+    _test_upload_and_run(fbos, web_app)
+    _test_cached(fbos, web_app)
+    _test_without_web_app(fbos, web_app)
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -23,7 +23,7 @@ class MockResponse(object):
 MOCK = {'calls': []}
 
 def _mock_request_with(status_code, json_response=None):
-    def _mock_request(method, url, **kwargs):
+    def _mock_request(_session, method, url, **kwargs):
         try:
             uuid = kwargs['json']['args']['label']
             command = kwargs['json']['body'][0]
@@ -37,7 +37,7 @@ def _mock_request_with(status_code, json_response=None):
         return MockResponse(status_code, json_response)
     return _mock_request
 
-@mock.patch('requests.request', _mock_request_with(500))
+@mock.patch('requests.Session.request', _mock_request_with(500))
 def _test_500_response():
     MOCK['calls'] = []
     device.log('hi')
@@ -50,7 +50,7 @@ def _test_500_response():
 
 FAKE_BOT_STATE = {'location_data': {'position': {'x': 1}}}
 
-@mock.patch('requests.request', _mock_request_with(200, FAKE_BOT_STATE))
+@mock.patch('requests.Session.request', _mock_request_with(200, FAKE_BOT_STATE))
 def _test_200_response():
     MOCK['calls'] = []
     bot_state = device.get_bot_state()
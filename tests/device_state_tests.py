@@ -3,7 +3,11 @@
 '''Farmware Tools Tests: bot state'''
 
 from __future__ import print_function
-from farmware_tools import device
+import os
+import time
+import tempfile
+import threading
+from farmware_tools import device, _state
 
 def _test_get_value(func, key, expected):
     def _get_state():
@@ -25,6 +29,106 @@ def run_pin_value_tests():
     _test_get_value(device.get_pin_value, 14, None)
     _test_get_value(device.get_pin_value, 13, 1)
 
+def _make_state_dir():
+    root = tempfile.mkdtemp()
+    for keys, value in [(['location_data', 'position', 'x'], '1.5'),
+                        (['location_data', 'position', 'y'], '2'),
+                        (['location_data', 'position', 'z'], '0'),
+                        (['pins', '13', 'value'], '1'),
+                        (['informational_settings', 'busy'], 'false')]:
+        path = os.path.join(root, *keys)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as value_file:
+            value_file.write(value)
+    return root
+
+
+def run_state_value_tests():
+    'Run get_state_value tests.'
+    def _get_state():
+        return {'location_data': {'position': {'x': 3}}}
+    assert device.get_state_value(
+        'location_data.position.x', _get_bot_state=_get_state) == 3
+    try:
+        device.get_state_value('location_data.position.x.y',
+                               _get_bot_state=_get_state)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('expected KeyError')
+
+    read_paths = []
+
+    def _read_value(path):
+        read_paths.append(os.path.relpath(path, root))
+        return read_value(path)
+    root = _make_state_dir()
+    read_value = _state._read_value
+    _state._read_value = _read_value
+    device.ENV.fbos_version = '8.0.0'
+    device.ENV.bot_state_dir = root
+    try:
+        assert device.get_current_position('x') == 1.5
+        assert device.get_pin_value(13) == '1'
+        assert device.get_state_value(['pins', 13]) == {'value': '1'}
+        assert read_paths == ['location_data/position/x', 'pins/13/value',
+                              'pins/13/value'], read_paths
+        assert device.get_current_position() == {'x': 1.5, 'y': 2, 'z': 0}
+        print('path-targeted reads: {}'.format(read_paths[:3]))
+    finally:
+        _state._read_value = read_value
+        device.ENV.fbos_version = '0'
+        device.ENV.bot_state_dir = None
+
+
+def _write_later(root, keys, value, delay=0.1):
+    def _write():
+        time.sleep(delay)
+        with open(os.path.join(root, *keys), 'w') as value_file:
+            value_file.write(value)
+    threading.Thread(target=_write).start()
+
+
+def run_watch_tests():
+    'Run state change stream tests.'
+    root = _make_state_dir()
+    device.ENV.fbos_version = '8.0.0'
+    device.ENV.bot_state_dir = root
+    try:
+        assert device.wait_for_position(x=1, y=2, timeout=0)
+        assert not device.wait_for_position(x=100, timeout=0.1)
+        _write_later(root, ['location_data', 'position', 'x'], '100.4')
+        start = time.time()
+        assert device.wait_for_position(x=100, tolerance=0.5, timeout=2)
+        elapsed = time.time() - start
+        print('position reached after {:.2f}s'.format(elapsed))
+        assert elapsed < 1
+
+        _write_later(root, ['pins', '13', 'value'], '0')
+        changes = device.watch_state(['pins'], timeout=2)
+        assert next(changes) == ('pins.13.value', 1, 0)
+        assert device.wait_for_pin(13, lambda value: value == 0, timeout=0)
+        assert not device.wait_for_pin(14, timeout=0)
+
+        initial = list(device.watch_state(
+            ['informational_settings'], timeout=0, initial=True))
+        assert initial == [('informational_settings.busy', None, False)]
+        with open(os.path.join(root, 'informational_settings', 'busy'),
+                  'w') as busy_file:
+            busy_file.write('true')
+        assert not device.wait_until_idle(timeout=0.1)
+        os.remove(os.path.join(root, 'informational_settings', 'busy'))
+        assert not device.wait_until_idle(timeout=0.1)
+        _write_later(root, ['informational_settings', 'busy'], 'false')
+        assert device.wait_until_idle(timeout=2)
+    finally:
+        device.ENV.fbos_version = '0'
+        device.ENV.bot_state_dir = None
+
+
 if __name__ == '__main__':
     run_position_tests()
     run_pin_value_tests()
+    run_state_value_tests()
+    run_watch_tests()
@@ -3,6 +3,8 @@
 '''Farmware Tools Tests: env'''
 
 from __future__ import print_function
+import json
+import base64
 from farmware_tools.env import Env
 
 def _version_compare_test(current, required, expected):
@@ -26,6 +28,40 @@ OK = [
     [7], [6],
     ]
 
+def _token(payload):
+    encoded = base64.b64encode(json.dumps(payload).encode('utf-8'))
+    return 'header.{}.signature'.format(encoded.decode('utf-8').strip('='))
+
+def run_capabilities_tests():
+    'Run capability profile tests.'
+    ENV = Env()
+    ENV.fbos_version = '7.0.0'
+    ENV.token = None
+    capabilities = ENV.capabilities
+    assert ENV.capabilities is capabilities
+    assert capabilities.fbos_version == (7, 0, 0)
+    assert capabilities.transport == 'http'
+    assert 'write_pin' in capabilities.no_rpc_kinds
+    ENV.fbos_version = 'v8.1.0-rc2'
+    assert ENV.capabilities is not capabilities
+    assert ENV.capabilities.transport == 'v2'
+    assert ENV.capabilities.no_rpc_kinds == frozenset()
+    assert not ENV.farmware_api_available()
+    ENV.request_pipe = ENV.response_pipe = 'pipe'
+    assert ENV.capabilities.pipes and ENV.farmware_api_available()
+    assert ENV.fbos_at_least(8, 0) and not ENV.fbos_at_least(8, 1, 1)
+    ENV.token = _token({'bot': 'device_1', 'iss': '//my.farm.bot:443'})
+    assert ENV.decoded_token['bot'] == 'device_1'
+    decoded_token = ENV.decoded_token
+    ENV.fbos_version = '8.0.0'
+    assert ENV.decoded_token is decoded_token
+    assert json.loads(json.dumps(ENV.decoded_token)) == decoded_token
+    ENV.decoded_token = {'bot': 'injected'}
+    assert ENV.decoded_token == {'bot': 'injected'}
+    ENV.token = _token({'bot': 'device_2'})
+    assert ENV.decoded_token == {'bot': 'device_2'}
+    print('capabilities: {}'.format(ENV.capabilities[:6]))
+
 def run_tests():
     'Run env tests.'
     for requirement_met in OK:
@@ -33,6 +69,8 @@ def run_tests():
     for requirement_not_met in LESS:
         _version_compare_test('7.0.1', requirement_not_met, False)
     _version_compare_test('V7.0.11-rc1', [7, 0, 11], True)
+    _version_compare_test('8', [8, 0], True)
 
 if __name__ == '__main__':
     run_tests()
+    run_capabilities_tests()
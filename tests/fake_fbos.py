@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: fake FarmBot OS Farmware API (v2)'''
+
+from __future__ import print_function
+import os
+import time
+import socket
+import tempfile
+import threading
+from farmware_tools import _util, device, device_aio
+
+
+class FakeFarmBotOS(object):
+    'Answer v2 Farmware API requests over local unix sockets.'
+
+    def __init__(self, delay=0, respond=True):
+        self.delay = delay
+        self.respond = respond
+        self.response_kind = 'rpc_ok'
+        self.requests = []
+        self.responses = []
+        self.response_connection = None
+        self.response_connected = threading.Event()
+        self.lock = threading.Lock()
+        directory = tempfile.mkdtemp()
+        self.request_pipe = os.path.join(directory, 'request_pipe')
+        self.response_pipe = os.path.join(directory, 'response_pipe')
+        self.request_server = self._listen(self.request_pipe)
+        self.response_server = self._listen(self.response_pipe)
+
+    @staticmethod
+    def _listen(address):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+        server.listen(1)
+        return server
+
+    def start(self):
+        'Point farmware_tools at the fake pipes and start answering.'
+        for env in [_util.ENV, device.ENV, device_aio.ENV]:
+            env.fbos_version = '8.0.0'
+            env.request_pipe = self.request_pipe
+            env.response_pipe = self.response_pipe
+        threading.Thread(target=self._accept_requests, daemon=True).start()
+        threading.Thread(target=self._accept_response, daemon=True).start()
+        _util.RESPONSE_BUFFER = None
+        _util.REQUEST_CHANNEL = None
+        return self
+
+    def _accept_requests(self):
+        while True:
+            connection, _ = self.request_server.accept()
+            threading.Thread(
+                target=self._read_requests, args=(connection,),
+                daemon=True).start()
+
+    def _accept_response(self):
+        self.response_connection, _ = self.response_server.accept()
+        self.response_connected.set()
+
+    def _read_requests(self, connection):
+        reader = _util._FrameReader(connection)
+        while reader.fill() > 0:
+            for request in reader.frames():
+                with self.lock:
+                    self.requests.append(request)
+                if self.respond:
+                    threading.Thread(
+                        target=self._reply, args=(request,)).start()
+
+    def _reply(self, request):
+        time.sleep(self.delay)
+        self.response_connected.wait()
+        response = {'kind': self.response_kind,
+                    'args': {'label': request['args']['label']}}
+        with self.lock:
+            self.responses.append(response)
+            self.response_connection.sendall(_util._encode_frame(response))
+
+    def sent_kinds(self):
+        'Kinds of the commands received so far.'
+        with self.lock:
+            return [item['kind']
+                    for request in self.requests for item in request['body']]
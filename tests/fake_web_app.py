@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: fake FarmBot Web App API (HTTP/1.1)'''
+
+from __future__ import print_function
+import json
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+Request = namedtuple('Request', ['method', 'path', 'headers', 'payload'])
+CHUNK_SIZE = 10
+
+
+class _Handler(BaseHTTPRequestHandler):
+    'Pass each request to the `FakeWebApp` that owns the server.'
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.server.web_app.connected()
+        BaseHTTPRequestHandler.setup(self)
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        request = Request(self.command, self.path, self.headers,
+                          json.loads(body) if body else None)
+        response = self.server.web_app.handle(request)
+        if response is None:
+            self.close_connection = True
+            return
+        status_code, data, headers = (tuple(response) + ({},))[:3]
+        if isinstance(data, bytes):
+            body = data
+        else:
+            body = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        if data is not None and not isinstance(data, bytes):
+            self.send_header('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if headers.get('Transfer-Encoding') == 'chunked':
+            self.end_headers()
+            for start in range(0, len(body), CHUNK_SIZE):
+                chunk = body[start:start + CHUNK_SIZE]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode())
+                self.wfile.write(chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+    def log_message(self, *_args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    'Accept a burst of concurrent connections.'
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class FakeWebApp(object):
+    '''Answer Web App API requests on a local port.
+
+    `respond(request)` returns (status_code, data[, headers]), where
+    data is JSON-serializable, bytes or None (no body). If it returns
+    None, the connection is closed without a response.
+    '''
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.web_app = self
+        self.url = 'http://127.0.0.1:{}/api/'.format(
+            self.server.server_address[1])
+
+    def start(self):
+        'Start answering requests.'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def connected(self):
+        'Count a new connection.'
+        with self.lock:
+            self.connections += 1
+
+    def handle(self, request):
+        'Record a request and get the response.'
+        with self.lock:
+            self.requests.append((request.method, request.path))
+        return self.respond(request)
+
+    def get_info(self, token='token'):
+        'Get a `get_info` function for the fake Web App.'
+        return lambda: {'token': token, 'url': self.url}
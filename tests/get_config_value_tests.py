@@ -4,7 +4,8 @@
 
 from __future__ import print_function
 import os
-from farmware_tools import get_config_value
+import farmware_tools
+from farmware_tools import get_config_value, get_config_values
 
 def _test_get_config(farmware, config, type_, expected):
     def _get_state():
@@ -31,5 +32,39 @@ def run_tests():
     os.environ['farmware_name_twenty'] = 'twenty'
     _test_get_config('Farmware Name', 'twenty', str, 'twenty')  # set value
 
+def run_bulk_tests():
+    'Run get_config_values tests.'
+    fetches = []
+
+    def _get_state():
+        fetches.append(1)
+        return {'process_info': {'farmwares': {'Bulk': {'config': {
+            '0': {'name': 'speed', 'value': '50'},
+            '1': {'name': 'label', 'value': 'default'}}}}}}
+    os.environ['bulk_label'] = 'set'
+    values = get_config_values(
+        'Bulk', {'speed': int, 'label': str}, _get_state=_get_state)
+    assert values == {'speed': 50, 'label': 'set'}, values
+    assert len(fetches) == 1
+    try:
+        get_config_values('Bulk', {'missing': int}, _get_state=_get_state)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('expected KeyError')
+
+    farmware_tools.CONFIG_DEFAULTS['Cached'] = {'a': 1, 'b': '2'}
+    values = get_config_values('Cached', {'a': int, 'b': float})
+    assert values == {'a': 1, 'b': 2.0}
+    assert get_config_value('Cached', 'b', float) == 2.0
+    values['a'] = 3
+    del farmware_tools.CONFIG_DEFAULTS['Cached']
+    assert get_config_values('Cached', {'a': int, 'b': float})['a'] == 1
+    print('get_config_values result {}'.format(values))
+
+    assert farmware_tools._config_defaults('Not Installed Yet') is None
+    assert 'Not Installed Yet' not in farmware_tools.CONFIG_DEFAULTS
+
 if __name__ == '__main__':
     run_tests()
+    run_bulk_tests()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: keep-alive HTTP session pool'''
+
+from __future__ import print_function
+import threading
+from farmware_tools import app, _http
+from fake_web_app import FakeWebApp
+
+
+def _respond(_request):
+    'Answer every request with an empty JSON list.'
+    return 200, []
+
+
+def _test_reuse(web_app, get_info):
+    web_app.connections = 0
+    for _ in range(20):
+        assert app.get('points', get_info=get_info) == []
+    assert app.post('points', {'x': 1}, get_info=get_info) == []
+    print('21 requests used {} connection(s)'.format(web_app.connections))
+    assert web_app.connections == 1
+
+
+def _test_threads(web_app, get_info):
+    web_app.connections = 0
+    _http.set_pool_size(2)
+
+    def _requests():
+        for _ in range(10):
+            app.get('points', get_info=get_info)
+    threads = [threading.Thread(target=_requests) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _http._session() is _http._session()
+    print('2 threads, 20 requests used {} connection(s)'.format(
+        web_app.connections))
+    assert web_app.connections <= 2
+
+
+def run_tests():
+    'Run HTTP session pool tests.'
+    web_app = FakeWebApp(_respond).start()
+    get_info = web_app.get_info()
+    _test_reuse(web_app, get_info)
+    _test_threads(web_app, get_info)
+
+
+if __name__ == '__main__':
+    run_tests()
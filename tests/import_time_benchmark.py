@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Benchmark: import time'''
+
+from __future__ import print_function
+import sys
+import json
+import subprocess
+
+RUNS = 10
+STATEMENTS = [
+    'import farmware_tools',
+    'from farmware_tools import snake_case',
+    'from farmware_tools import app',
+    'from farmware_tools import device',
+    'from farmware_tools import *',
+]
+CHECK = '''
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'elapsed': elapsed,
+    'modules': [m for m in ['requests', 'paho', 'socket', 'asyncio']
+                if m in sys.modules],
+    'threads': __import__('threading').active_count()}}))
+'''
+
+
+def _measure(statement):
+    code = 'import json\n' + CHECK.format(statement=statement)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.decode())
+
+
+def run_benchmark():
+    'Measure the import time of common entry points.'
+    for statement in STATEMENTS:
+        results = [_measure(statement) for _ in range(RUNS)]
+        times = sorted(result['elapsed'] for result in results)
+        print('{:<42} median {:6.1f} ms  loaded: {}'.format(
+            statement, times[RUNS // 2] * 1000,
+            ', '.join(results[0]['modules']) or '-'))
+        assert results[0]['threads'] == 1, 'import started a thread'
+        assert 'paho' not in results[0]['modules']
+        if not any(name in statement for name in ['device', 'app', '*']):
+            assert 'requests' not in results[0]['modules']
+        if '*' in statement:
+            assert 'asyncio' not in results[0]['modules']
+    namespace = {}
+    exec('from farmware_tools import *', namespace)
+    for name in ['log', 'get_bot_state', 'set_user_env', 'request', 'device',
+                 'get_config_value', 'snake_case']:
+        assert name in namespace, name
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: MQTT session'''
+
+from __future__ import print_function
+import json
+import time
+import threading
+from farmware_tools import _util
+
+
+class FakeMessage(object):
+    'Received MQTT message.'
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = json.dumps(payload)
+
+
+class FakeClient(object):
+    'Stand-in for paho.mqtt.client.Client that answers every request.'
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.published = []
+        self.subscriptions = []
+        self.on_connect = None
+        self.on_subscribe = None
+        self.on_message = None
+
+    def connect(self, host):
+        'Connect to the broker.'
+        self.host = host
+
+    def loop_start(self):
+        'Start the network loop.'
+        threading.Timer(
+            self.delay, self.on_connect, args=(self, None, {}, 0)).start()
+
+    def subscribe(self, topics):
+        'Subscribe to topics.'
+        self.subscriptions.extend(topic for topic, _ in topics)
+        threading.Timer(
+            self.delay, self.on_subscribe, args=(self, None, 1, (0,))).start()
+
+    def publish(self, topic, payload):
+        'Publish a message and schedule the device reply.'
+        request = json.loads(payload)
+        self.published.append((topic, request))
+        threading.Timer(self.delay, self._reply, args=(request,)).start()
+
+    def _reply(self, request):
+        label = request['args']['label']
+        if request['body'][0]['kind'] == 'read_status':
+            self.on_message(self, None, FakeMessage(
+                'bot/device_1/status',
+                {'location_data': {'position': {'x': 1}}}))
+        self.on_message(self, None, FakeMessage(
+            'bot/device_1/from_device',
+            {'kind': 'rpc_ok', 'args': {'label': label}}))
+
+
+def _rpc(label, kind='sync'):
+    return {'kind': 'rpc_request', 'args': {'label': label},
+            'body': [{'kind': kind, 'args': {}}]}
+
+
+def _test_subscriptions(client):
+    assert client.host == 'broker'
+    assert client.subscriptions == [
+        'bot/device_1/from_device', 'bot/device_1/status']
+
+
+def _test_request(session, client):
+    start = time.time()
+    response = session.request(_rpc('one'))
+    elapsed = time.time() - start
+    print('MQTT response received in {:.2f}s'.format(elapsed))
+    assert response == {'kind': 'rpc_ok', 'args': {'label': 'one'}}
+    assert elapsed < 1
+    assert client.published[0] == ('bot/device_1/from_clients', _rpc('one'))
+
+
+def _test_concurrent_requests(session):
+    start = time.time()
+    futures = [session.send(_rpc(str(i))) for i in range(5)]
+    labels = [future.result(1)['args']['label'] for future in futures]
+    assert labels == [str(i) for i in range(5)]
+    assert time.time() - start < 1
+
+
+def _test_status(session):
+    response = session.request(_rpc('status', 'read_status'),
+                               wait_for_status=True)
+    assert response == 'got status'
+    assert session.status['location_data'] == {'position': {'x': 1}}
+
+
+def _test_status_mirror(session, client):
+    published = len(client.published)
+    assert session.status_snapshot()['location_data']['position']['x'] == 1
+    assert session.status_snapshot(max_age=60) is not None
+    assert len(client.published) == published
+    time.sleep(0.02)
+    assert session.status_snapshot(max_age=0.01) is None
+    session._on_message(client, None, FakeMessage(
+        'bot/device_1/status', {'location_data': {'position': {'x': 2}}}))
+    snapshot = session.status_snapshot(max_age=0.01)
+    assert snapshot['location_data']['position']['x'] == 2
+
+
+def _test_no_response(session, client):
+    client.publish = lambda topic, payload: None
+    assert session.request(_rpc('lost'), timeout=0.1) == 'no response'
+    assert session.responses.stats()['waiting'] == 0
+
+
+def _test_single_deadline(session, client):
+    session.subscribed.clear()
+    publish = client.publish
+    client.publish = lambda topic, payload: None
+    start = time.time()
+    assert session.request(_rpc('unsubscribed'), timeout=0.2) == 'no response'
+    assert session.request(_rpc('unsubscribed_status', 'read_status'),
+                           wait_for_status=True, timeout=0.2) == 'no response'
+    elapsed = time.time() - start
+    print('two unsubscribed requests timed out in {:.2f}s'.format(elapsed))
+    assert elapsed < 0.6, elapsed
+    session.subscribed.set()
+    client.publish = publish
+
+
+def run_tests():
+    'Run MQTT session tests.'
+    client = FakeClient()
+    session = _util._MqttSession(client, 'device_1')
+    session.start('broker')
+    _test_request(session, client)
+    _test_subscriptions(client)
+    _test_concurrent_requests(session)
+    _test_status(session)
+    _test_status_mirror(session, client)
+    _test_single_deadline(session, client)
+    _test_no_response(session, client)
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: v2 request channel'''
+
+from __future__ import print_function
+import os
+import time
+import socket
+import tempfile
+import threading
+from farmware_tools import _util
+
+
+class _BrokenSocket():
+    'Accept `limit` bytes, then fail as if the pipe was closed.'
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def send(self, data):
+        if self.limit == 0:
+            raise BrokenPipeError()
+        count = min(len(data), self.limit)
+        self.limit -= count
+        return count
+
+    def close(self):
+        pass
+
+
+def _listen():
+    address = os.path.join(tempfile.mkdtemp(), 'request_pipe')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(address)
+    server.listen(1)
+    server.settimeout(5)
+    return address, server
+
+
+def _read_frames(connection, count):
+    reader = _util._FrameReader(connection)
+    frames = []
+    while len(frames) < count:
+        assert reader.fill() > 0
+        frames.extend(reader.frames())
+    return frames
+
+
+def _test_connection_reuse(channel, server):
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'one'}})
+    connection, _ = server.accept()
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'two'}},
+                  {'kind': 'rpc_request', 'args': {'label': 'three'}})
+    frames = _read_frames(connection, 3)
+    labels = [frame['args']['label'] for frame in frames]
+    assert labels == ['one', 'two', 'three'], labels
+    print('read {} frames from one connection'.format(len(frames)))
+    return connection
+
+
+def _test_reconnect(channel, server, connection):
+    connection.close()
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'four'}})
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'five'}})
+    reconnection, _ = server.accept()
+    frames = _read_frames(reconnection, 2)
+    labels = [frame['args']['label'] for frame in frames]
+    assert labels == ['four', 'five'], labels
+    print('reconnected after the pipe was closed')
+
+
+def _test_partial_write(channel, server):
+    first = _util._encode_frame(
+        {'kind': 'rpc_request', 'args': {'label': 'a'}})
+    channel.close()
+    channel.request_socket = _BrokenSocket(len(first) + 3)
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'a'}},
+                  {'kind': 'rpc_request', 'args': {'label': 'b'}},
+                  {'kind': 'rpc_request', 'args': {'label': 'c'}})
+    reconnection, _ = server.accept()
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'd'}})
+    frames = _read_frames(reconnection, 3)
+    labels = [frame['args']['label'] for frame in frames]
+    assert labels == ['b', 'c', 'd'], labels
+    print('resent only the frames not completely written')
+    return reconnection
+
+
+def _test_pipe_restart(channel, address, server, connection):
+    connection.close()
+    server.close()
+    os.remove(address)
+    restarted = []
+
+    def _restart():
+        time.sleep(0.3)
+        restarted.append(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+        restarted[0].bind(address)
+        restarted[0].listen(1)
+    threading.Thread(target=_restart).start()
+    start = time.time()
+    channel.write({'kind': 'rpc_request', 'args': {'label': 'restarted'}})
+    elapsed = time.time() - start
+    connection, _ = restarted[0].accept()
+    frames = _read_frames(connection, 1)
+    assert frames[0]['args']['label'] == 'restarted', frames
+    print('reconnected to a recreated pipe in {:.2f}s'.format(elapsed))
+    assert 0.3 <= elapsed < _util.TIMEOUT_SECONDS
+
+
+def run_tests():
+    'Run request channel tests.'
+    address, server = _listen()
+    channel = _util._RequestChannel(address)
+    connection = _test_connection_reuse(channel, server)
+    _test_reconnect(channel, server, connection)
+    connection = _test_partial_write(channel, server)
+    _test_pipe_restart(channel, address, server, connection)
+    channel.close()
+
+
+if __name__ == '__main__':
+    run_tests()
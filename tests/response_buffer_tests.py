@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: v2 response buffer'''
+
+from __future__ import print_function
+import os
+import json
+import time
+import struct
+import socket
+import tempfile
+import threading
+from farmware_tools import _util
+
+
+def _frame(label, extra=''):
+    message = json.dumps(
+        {'kind': 'rpc_ok', 'args': {'label': label, 'extra': extra}})
+    message_bytes = bytes(message, 'utf-8')
+    header = struct.pack(_util.HEADER_FORMAT, 0xFBFB, 0, len(message_bytes))
+    return header + message_bytes
+
+
+def _connect_buffer():
+    address = os.path.join(tempfile.mkdtemp(), 'response_pipe')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(address)
+    server.listen(1)
+    _util.ENV.response_pipe = address
+    buffer = _util._ResponseBuffer()
+    connection, _ = server.accept()
+    listener = threading.Thread(target=buffer.listen, daemon=True)
+    listener.start()
+    return buffer, server, connection
+
+
+def _test_wakes_waiter(buffer, connection):
+    def _respond():
+        time.sleep(0.05)
+        connection.sendall(_frame('waiting'))
+    threading.Thread(target=_respond).start()
+    start = time.time()
+    response = buffer.pop('waiting')
+    elapsed = time.time() - start
+    print('response received in {:.3f}s'.format(elapsed))
+    assert response['args']['label'] == 'waiting'
+    assert elapsed < 0.4
+    assert 'waiting' not in buffer.waiters
+
+
+def _test_early_response(buffer, connection):
+    connection.sendall(_frame('early'))
+    time.sleep(0.1)
+    assert 'early' in buffer.responses
+    assert buffer.pop('early')['args']['label'] == 'early'
+    assert 'early' not in buffer.responses
+
+
+def _test_timeout(buffer):
+    assert buffer.pop('missing', timeout=0.1) == 'no response'
+    assert 'missing' not in buffer.waiters
+
+
+def _test_reconnect(buffer, server, connection):
+    connection.close()
+    server.settimeout(5)
+    reconnection, _ = server.accept()
+    reconnection.sendall(_frame('reconnected'))
+    assert buffer.pop('reconnected')['args']['label'] == 'reconnected'
+    print('response pipe reconnected after it was closed')
+
+
+def _read_all(reader, count):
+    frames = []
+    while len(frames) < count:
+        assert reader.fill() > 0
+        frames.extend(reader.frames())
+    return frames
+
+
+def _test_partial_reads():
+    sender, receiver = socket.socketpair()
+    reader = _util._FrameReader(receiver, size=16)
+    data = _frame('one') + _frame('two', 'x' * 5000) + _frame('three')
+
+    def _trickle():
+        for i in range(0, len(data), 7):
+            sender.sendall(data[i:i + 7])
+            time.sleep(0.0001)
+    threading.Thread(target=_trickle).start()
+    frames = _read_all(reader, 3)
+    assert [f['args']['label'] for f in frames] == ['one', 'two', 'three']
+    assert frames[1]['args']['extra'] == 'x' * 5000
+    assert reader.start == reader.end == 0
+    print('decoded {} frames from partial reads'.format(len(frames)))
+
+
+def _test_resync():
+    sender, receiver = socket.socketpair()
+    reader = _util._FrameReader(receiver)
+    sender.sendall(b'garbage' + _frame('after_garbage') + b'\xfb\x00'
+                   + _frame('after_marker_byte'))
+    frames = _read_all(reader, 2)
+    labels = [f['args']['label'] for f in frames]
+    assert labels == ['after_garbage', 'after_marker_byte'], labels
+    print('resynchronized on frame marker: {}'.format(labels))
+
+
+def _response(label):
+    return {'kind': 'rpc_ok', 'args': {'label': label}}
+
+
+def _test_store_bounds():
+    store = _util._ResponseStore(max_size=2, ttl=0.1)
+    for label in ['a', 'b', 'c']:
+        store.add(_response(label))
+    assert list(store.responses) == ['b', 'c']
+    assert store.stats()['overflow'] == 1
+    time.sleep(0.15)
+    store.add(_response('d'))
+    assert list(store.responses) == ['d']
+    assert store.stats()['expired'] == 2
+    assert store.pop('d') == _response('d')
+    print('response store stats: {}'.format(store.stats()))
+    assert store.stats() == {
+        'expired': 2, 'overflow': 1, 'size': 0, 'waiting': 0}
+
+
+def _test_store_expire():
+    store = _util._ResponseStore(ttl=0.1)
+    store.add(_response('stale'))
+    future = store.expect('late', timeout=0.1)
+    time.sleep(0.15)
+    store.expire()
+    assert future.result(0) == 'no response'
+    assert len(store) == 0
+    assert store.stats()['waiting'] == 0
+
+
+def run_tests():
+    'Run response buffer tests.'
+    _test_store_bounds()
+    _test_store_expire()
+    _test_partial_reads()
+    _test_resync()
+    buffer, server, connection = _connect_buffer()
+    _test_wakes_waiter(buffer, connection)
+    _test_early_response(buffer, connection)
+    _test_timeout(buffer)
+    _test_reconnect(buffer, server, connection)
+
+
+if __name__ == '__main__':
+    run_tests()
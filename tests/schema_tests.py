@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: Celery Script schemas'''
+
+from __future__ import print_function
+from farmware_tools import _schema, device
+
+DEFAULT = _schema.VALIDATORS['default']
+STRICT = _schema.VALIDATORS['strict']
+
+
+def _test_values():
+    assert DEFAULT['calibrate']({'axis': 'x'}) is _schema.VALID
+    assert DEFAULT['calibrate']({'axis': 'q'}) == 'q'
+    assert DEFAULT['calibrate']({}) == {}
+    assert DEFAULT['write_pin'](
+        {'pin_number': 69, 'pin_value': 1, 'pin_mode': 1}) is _schema.VALID
+    for pin_number in [70, -1, 1.5, '1', None]:
+        assert DEFAULT['toggle_pin']({'pin_number': pin_number}) == pin_number
+    assert DEFAULT['set_servo_angle'](
+        {'pin_number': 4, 'pin_value': 180.0}) is _schema.VALID
+    assert DEFAULT['calibrate']({'axis': ['x']}) == ['x']
+
+
+def _test_nodes():
+    coordinate = device.assemble_coordinate(1, 2, 3)
+    args = {'location': coordinate, 'speed': 100, 'offset': coordinate}
+    assert DEFAULT['move_absolute'](args) is _schema.VALID
+    args['offset'] = {'kind': 'coordinate', 'args': {'x': 0, 'y': 0}}
+    assert DEFAULT['move_absolute'](args) == args['offset']
+    args['offset'] = {'kind': 'nothing', 'args': {}}
+    assert DEFAULT['move_absolute'](args) == args['offset']
+    message = {'message': 'hi', 'message_type': 'info'}
+    channel = {'kind': 'channel', 'args': {'channel_name': 'pager'}}
+    assert DEFAULT['send_message'](message, [channel]) == 'pager'
+    assert DEFAULT['send_message'](message, [{'kind': 'unknown'}]) is (
+        _schema.VALID)
+
+
+def _test_strict():
+    args = {'pin_number': 13, 'pin_value': 1, 'pin_mode': 0}
+    assert STRICT['write_pin'](args) is _schema.VALID
+    assert STRICT['write_pin'](dict(args, pin_value='1')) == '1'
+    assert DEFAULT['write_pin'](dict(args, extra=1)) is _schema.VALID
+    assert STRICT['write_pin'](dict(args, extra=1))['extra'] == 1
+    message = {'message': 'hi', 'message_type': 'info'}
+    channel = {'kind': 'channel', 'args': {'channel_name': 'toast'}}
+    assert STRICT['send_message'](message, [channel]) is _schema.VALID
+    pair = device.assemble_pair('a', 'b')
+    assert STRICT['send_message'](message, [pair]) == pair
+    rpc = device.rpc_wrapper({'kind': 'sync', 'args': {}})
+    assert _schema.validate_node(rpc, STRICT) is _schema.VALID
+    rpc['body'].append({'kind': 'unknown', 'args': {}})
+    assert _schema.validate_node(rpc, STRICT) == rpc['body'][1]
+
+
+def _test_modes():
+    assert device.calibrate.__wrapped__('x') == {
+        'kind': 'calibrate', 'args': {'axis': 'x'}}
+    assert device.calibrate.__wrapped__('q') is None
+    command = device.send_message.__wrapped__('hi', 'info', ['toast'])
+    assert command['body'] == [
+        {'kind': 'channel', 'args': {'channel_name': 'toast'}}]
+    assert device.send_message.__wrapped__('hi', 'info', ['pager']) is None
+    assert device.write_pin.__wrapped__(13, '1', 0) is not None
+    device.set_validation_mode('strict')
+    assert device.write_pin.__wrapped__(13, '1', 0) is None
+    device.set_validation_mode('trusted')
+    assert device.calibrate.__wrapped__('q')['args'] == {'axis': 'q'}
+    device.set_validation_mode('default')
+    try:
+        device.set_validation_mode('lenient')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+
+
+def run_tests():
+    'Run Celery Script schema tests.'
+    _test_values()
+    _test_nodes()
+    _test_strict()
+    _test_modes()
+    print('{} kinds validated'.format(len(_schema.SCHEMAS)))
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: Web App sequence name index'''
+
+from __future__ import print_function
+import os
+import tempfile
+from farmware_tools import app
+from fake_web_app import FakeWebApp
+
+SEQUENCES = [
+    {'id': i, 'name': 'Sequence {}'.format(i), 'updated_at': '2020-01-01',
+     'body': [{'kind': 'wait', 'args': {'milliseconds': 100}}] * 50}
+    for i in range(1, 101)]
+OTHER_ACCOUNT_SEQUENCES = [
+    {'id': 500, 'name': 'Sequence 1', 'updated_at': '2020-01-01'}]
+
+
+def _respond(request):
+    'Serve the sequence list and accept new sequences.'
+    if request.method == 'GET':
+        if request.headers['Authorization'] == 'Bearer other':
+            return 200, OTHER_ACCOUNT_SEQUENCES
+        return 200, SEQUENCES
+    sequence = dict(request.payload, id=len(SEQUENCES) + 1,
+                    updated_at='2020-01-02')
+    SEQUENCES.append(sequence)
+    return 200, sequence
+
+
+def _test_lookups(web_app, get_info):
+    app.set_sequence_index()
+    del web_app.requests[:]
+    names = ['Sequence {}'.format(i) for i in range(1, 11)]
+    found = app.find_sequences_by_name(names, get_info=get_info)
+    assert found == {name: i for i, name in enumerate(names, 1)}, found
+    for i, name in enumerate(names, 1):
+        assert app.find_sequence_by_name(name, get_info=get_info) == i
+    assert app.find_sequence_by_name(
+        'sequence 7', ignore_case=True, get_info=get_info) == 7
+    assert app.find_sequences_by_prefix(
+        'Sequence 10', get_info=get_info) == {
+            'Sequence 10': 10, 'Sequence 100': 100}
+    assert app.find_sequences_by_prefix(
+        'SEQUENCE 9', ignore_case=True, get_info=get_info) == dict(
+            [('Sequence 9', 9)] + [
+                ('Sequence {}'.format(i), i) for i in range(90, 100)])
+    print('{} lookups: {} request(s)'.format(
+        len(names) * 2 + 3, len(web_app.requests)))
+    assert len(web_app.requests) == 1, web_app.requests
+
+
+def _test_refresh(web_app, get_info):
+    app.set_sequence_index()
+    del web_app.requests[:]
+    assert app.find_sequence_by_name('Sequence 1', get_info=get_info) == 1
+    app.post('sequences', {'name': 'New'}, get_info=get_info)
+    assert app.find_sequence_by_name('New', get_info=get_info) == 101
+    assert app.find_sequences_by_name(
+        ['Missing'], get_info=get_info) == {'Missing': None}
+    assert [method for method, _ in web_app.requests] == [
+        'GET', 'POST', 'GET', 'GET'], web_app.requests
+    SEQUENCES.pop()
+
+
+def _test_incremental():
+    app.set_sequence_index()
+    index = app._SequenceIndex('url')
+    assert index.update(SEQUENCES) == len(SEQUENCES)
+    assert index.update(SEQUENCES) == 0
+    renamed = dict(SEQUENCES[0], name='Renamed', updated_at='2020-01-03')
+    assert index.update([renamed] + SEQUENCES[1:]) == 1
+    assert index.lookup('Renamed') == 1
+    assert index.lookup('Sequence 1') is None
+    assert index.update(SEQUENCES[1:]) == 1
+    assert index.lookup('Renamed') is None
+
+
+def _test_disk(web_app, get_info):
+    path = os.path.join(tempfile.mkdtemp(), 'sequences.json')
+    app.set_sequence_index(path=path, max_age=60)
+    del web_app.requests[:]
+    assert app.find_sequence_by_name('Sequence 5', get_info=get_info) == 5
+    assert os.path.exists(path)
+    app.set_sequence_index(path=path, max_age=60)
+    assert app.find_sequence_by_name('Sequence 6', get_info=get_info) == 6
+    assert len(web_app.requests) == 1, web_app.requests
+    index = app._SequenceIndex('other url', path=path)
+    assert index.stale() and index.lookup('Sequence 5') is None
+    app.set_sequence_index()
+
+
+def _test_accounts(web_app, get_info):
+    path = os.path.join(tempfile.mkdtemp(), 'sequences.json')
+    app.set_sequence_index(path=path, max_age=60)
+
+    assert app.find_sequence_by_name('Sequence 1', get_info=get_info) == 1
+    assert app.find_sequence_by_name(
+        'Sequence 1', get_info=web_app.get_info('other')) == 500
+    app.set_sequence_index(path=path, max_age=60)
+    assert app.find_sequence_by_name('Sequence 1', get_info=get_info) == 1
+    app.set_sequence_index()
+
+
+def run_tests():
+    'Run sequence index tests.'
+    web_app = FakeWebApp(_respond).start()
+    get_info = web_app.get_info()
+    _test_lookups(web_app, get_info)
+    _test_refresh(web_app, get_info)
+    _test_incremental()
+    _test_disk(web_app, get_info)
+    _test_accounts(web_app, get_info)
+
+
+if __name__ == '__main__':
+    run_tests()
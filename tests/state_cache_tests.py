@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: FarmBot OS state directory cache'''
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+from farmware_tools import _state
+
+READS = {'count': 0}
+READ_VALUE = _state._read_value
+
+
+def _counting_read_value(path):
+    READS['count'] += 1
+    return READ_VALUE(path)
+
+
+def _write(root, keys, value):
+    path = os.path.join(root, *keys)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as value_file:
+        value_file.write(value)
+
+
+def _make_state_dir():
+    root = tempfile.mkdtemp()
+    for axis in ['x', 'y', 'z']:
+        _write(root, ['location_data', 'position', axis], '0.0')
+    for pin in range(10):
+        _write(root, ['pins', str(pin), 'value'], '0')
+    _write(root, ['informational_settings', 'busy'], '')
+    return root
+
+
+def _expect_reads(cache, expected_reads, keys=()):
+    READS['count'] = 0
+    value = cache.get(keys)
+    assert READS['count'] == expected_reads, READS['count']
+    return value
+
+
+def _test_cache(use_inotify):
+    root = _make_state_dir()
+    cache = _state._StateCache(root, use_inotify=use_inotify)
+    mode = 'inotify' if cache.watcher is not None else 'mtime'
+    state = _expect_reads(cache, 14)
+    assert state['location_data']['position'] == {
+        'x': '0.0', 'y': '0.0', 'z': '0.0'}
+    assert state['informational_settings']['busy'] is None
+    assert _expect_reads(cache, 0) == state
+
+    state['pins'].clear()
+    assert len(cache.get(('pins',))) == 10
+
+    _write(root, ['location_data', 'position', 'x'], '100.00')
+    assert _expect_reads(cache, 1, ('location_data', 'position', 'x')) == '100.00'
+
+    _write(root, ['pins', '13', 'value'], '1')
+    assert _expect_reads(cache, 1, ('pins', '13')) == {'value': '1'}
+
+    path = os.path.join(root, 'location_data', 'position', 'y')
+    with open(path, 'w') as value_file:  # truncated, write in progress
+        position = cache.get(('location_data', 'position'))
+        assert position['y'] == '0.0', position
+        value_file.write('5.0')
+    assert cache.get(('location_data', 'position', 'y')) == '5.0'
+
+    os.remove(os.path.join(root, 'pins', '0', 'value'))
+    shutil.rmtree(os.path.join(root, 'pins', '1'))
+    state = _expect_reads(cache, 0)
+    assert state['pins']['0'] == {}
+    assert '1' not in state['pins']
+    print('state cache ({}) read only changed files'.format(mode))
+
+
+def _test_path_refresh():
+    root = _make_state_dir()
+    cache = _state._StateCache(root, use_inotify=False)
+    cache.get()
+    scanned = []
+    scan = cache._scan
+
+    def _counting_scan(keys, node):
+        scanned.append(keys)
+        scan(keys, node)
+    cache._scan = _counting_scan
+    READS['count'] = 0
+    _write(root, ['location_data', 'position', 'x'], '7.0')
+    assert cache.get_path(['location_data', 'position', 'x']) == '7.0'
+    assert cache.get_path(['location_data', 'position', 'x']) == '7.0'
+    assert READS['count'] == 1 and scanned == [], (READS, scanned)
+    _write(root, ['pins', '13', 'value'], '1')
+    assert cache.get_path(['pins', '13']) == {'value': '1'}
+    assert scanned == [('pins', '13')], scanned
+    os.remove(os.path.join(root, 'pins', '2', 'value'))
+    try:
+        cache.get_path(['pins', '2', 'value'])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('expected KeyError')
+    assert cache.get(('pins', '2')) == {}
+    print('state cache (mtime) checked only the requested path')
+
+
+def _test_decode_value():
+    for raw, expected in [('1', 1), ('-2', -2), ('1.5', 1.5), ('-.5', -0.5),
+                          ('1e3', 1000.0), ('true', True), ('false', False),
+                          ('', None), ('nil', None), (None, None),
+                          ('synced', 'synced'), ('nan', 'nan'), (3, 3)]:
+        decoded = _state.decode_value(raw)
+        assert decoded == expected and type(decoded) is type(expected), (
+            raw, decoded)
+
+
+def _test_directory_view():
+    root = _make_state_dir()
+    READS['count'] = 0
+    view = _state.StateView(_state._DirectorySource(root))
+    assert READS['count'] == 0
+    assert view['location_data']['position']['x'] == 0.0
+    assert view['pins'][3]['value'] == 0
+    assert view['informational_settings']['busy'] is None
+    assert READS['count'] == 3
+    assert view['location_data']['position']['x'] == 0.0
+    assert READS['count'] == 3
+    assert 'missing' not in view
+    assert sorted(view['location_data']['position']) == ['x', 'y', 'z']
+    snapshot = view.snapshot()
+    assert READS['count'] == 14
+    try:
+        snapshot['pins'] = {}
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('snapshot is writable')
+    _write(root, ['location_data', 'position', 'x'], '5')
+    assert snapshot['location_data']['position']['x'] == 0.0
+    print('lazy state view: {}'.format(dict(snapshot['location_data']['position'])))
+
+
+def _test_dict_view():
+    view = _state.StateView(_state._DictSource(
+        {'pins': {'13': {'value': '1'}}, 'configuration': {'x': 2.5}}))
+    assert view['pins'][13]['value'] == 1
+    assert view['configuration']['x'] == 2.5
+    assert dict(view.snapshot()['configuration']) == {'x': 2.5}
+
+
+def run_tests():
+    'Run state cache tests.'
+    _test_decode_value()
+    _test_dict_view()
+    _state._read_value = _counting_read_value
+    _test_cache(use_inotify=True)
+    _test_cache(use_inotify=False)
+    _test_path_refresh()
+    _test_directory_view()
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+'''Farmware Tools Tests: bulk set_user_env'''
+
+from __future__ import print_function
+import os
+from farmware_tools import device, set_config_values
+from fake_fbos import FakeFarmBotOS
+
+
+def _pairs(request):
+    [command] = request['body']
+    assert command['kind'] == 'set_user_env'
+    return {pair['args']['label']: pair['args']['value']
+            for pair in command['body']}
+
+
+def _test_one_command(fbos):
+    os.environ['unchanged'] = '1'
+    result = device.set_user_envs({'a': 1, 'b': 2.5, 'unchanged': 1})
+    assert result['response']['kind'] == 'rpc_ok'
+    assert len(fbos.requests) == 1
+    assert _pairs(fbos.requests[0]) == {'a': '1', 'b': '2.5'}
+
+
+def _test_skip_unchanged(fbos):
+    assert device.set_user_envs({'a': '1', 'unchanged': '1'}) is None
+    assert len(fbos.requests) == 1
+    device.set_user_envs({'a': 2, 'b': 2.5})
+    assert _pairs(fbos.requests[-1]) == {'a': '2'}
+    device.set_user_env('a', 3)
+    device.set_user_envs({'a': 2})
+    assert _pairs(fbos.requests[-1]) == {'a': '2'}
+
+
+def _test_failed_write(fbos):
+    fbos.response_kind = 'rpc_error'
+    device.set_user_envs({'failed': 'x'})
+    fbos.response_kind = 'rpc_ok'
+    count = len(fbos.requests)
+    device.set_user_envs({'failed': 'x'})
+    assert len(fbos.requests) == count + 1
+    assert device.set_user_envs({'failed': 'x'}) is None
+    future = device.set_user_envs({'async': 'y'}, asynchronous=True)
+    device.wait_all([future])
+    assert device.set_user_envs({'async': 'y'}) is None
+
+
+def _test_set_config_values(fbos):
+    set_config_values('Camera Calibration', {'x_px': 10, 'y_px': 20})
+    assert _pairs(fbos.requests[-1]) == {
+        'camera_calibration_x_px': '10', 'camera_calibration_y_px': '20'}
+    print('set {} configs in one command'.format(
+        len(_pairs(fbos.requests[-1]))))
+
+
+def run_tests():
+    'Run bulk set_user_env tests.'
+    fbos = FakeFarmBotOS().start()
+    _test_one_command(fbos)
+    _test_skip_unchanged(fbos)
+    _test_failed_write(fbos)
+    _test_set_config_values(fbos)
+
+
+if __name__ == '__main__':
+    run_tests()